@@ -0,0 +1,257 @@
+"""
+Stateless JWT authentication.
+
+Tokens issued by the login, registration and token endpoints carry the
+user's role, username and token version as signed claims, so a request
+is authenticated without reading its ``users`` row: ``request.user`` is a
+``ClaimsUser`` built from the claims, which is all permission checks and
+queryset scoping need (``id``, ``role``).
+
+Revocation goes through a small per-user state kept in the cache,
+``(token_version, is_active, role)``, refreshed whenever a ``User`` is
+saved (see ``signals``) and read from the database only on a cache miss.
+A token is refused once its version or role no longer matches or the user
+is deactivated; ``User.revoke_tokens`` and password changes bump the
+version. Saves refresh the cache of the saving process only, so with a
+per-process cache the other workers notice after
+``AUTH_STATE_CACHE_SECONDS``; use a shared cache to keep that long. Code that really needs the model instance uses ``full_user``,
+which caches it for ``AUTH_USER_CACHE_SECONDS``.
+
+Tokens without these claims, issued before they existed, are still
+accepted through a regular ``users`` lookup.
+
+Refresh tokens are checked against the revocation store of
+``apps.core.revocation``: rotation (``/api/token/refresh/``) and logout
+(``/api/token/blacklist/``) revoke the token they were given, verification
+(``/api/token/verify/``) refuses revoked tokens, and refreshes read the
+cached user state instead of the ``users`` table.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer, TokenObtainPairSerializer, TokenRefreshSerializer, TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+from bookbridge.instrumentation import TimedJWTAuthentication
+
+from . import revocation
+from .models import User
+
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+
+STATE_CACHE_SECONDS = getattr(settings, 'AUTH_STATE_CACHE_SECONDS', 5)
+USER_CACHE_SECONDS = getattr(settings, 'AUTH_USER_CACHE_SECONDS', 60)
+
+
+def _state_key(user_id):
+    return f'auth-state:{user_id}'
+
+
+def _user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def user_state(user_id):
+    """``(token_version, is_active, role)`` of ``user_id``, or ``None`` if it is gone."""
+    state = cache.get(_state_key(user_id))
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('token_version', 'is_active', 'role').first()
+        # Missing users are cached too, as False
+        state = tuple(row) if row else False
+        cache.set(_state_key(user_id), state, STATE_CACHE_SECONDS)
+    return state or None
+
+
+async def auser_state(user_id):
+    """``user_state`` for async views."""
+    state = await cache.aget(_state_key(user_id))
+    if state is None:
+        row = await User.objects.filter(pk=user_id).values_list('token_version', 'is_active', 'role').afirst()
+        state = tuple(row) if row else False
+        await cache.aset(_state_key(user_id), state, STATE_CACHE_SECONDS)
+    return state or None
+
+
+def check_state(state, validated_token):
+    """Refuse ``validated_token`` unless ``state`` shows it is still valid."""
+    if state is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    version, is_active, role = state
+    if not is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if version != validated_token[VERSION_CLAIM] or role != validated_token[ROLE_CLAIM]:
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+
+def clear_user(user_id):
+    cache.delete_many([_state_key(user_id), _user_key(user_id)])
+
+
+def remember_user(user):
+    """Refresh the cached state of ``user`` once its save is committed."""
+    cache.set(_state_key(user.pk), (user.token_version, user.is_active, user.role), STATE_CACHE_SECONDS)
+    cache.delete(_user_key(user.pk))
+
+
+def forget_user(user_id):
+    cache.set(_state_key(user_id), False, STATE_CACHE_SECONDS)
+    cache.delete(_user_key(user_id))
+
+
+def full_user(user):
+    """The ``User`` instance behind ``user``, which may be a ``ClaimsUser``."""
+    if isinstance(user, ClaimsUser):
+        return user.user
+    return user
+
+
+async def afull_user(user):
+    """``full_user`` for async views."""
+    if not isinstance(user, ClaimsUser):
+        return user
+    found = await cache.aget(_user_key(user.id))
+    if found is None:
+        found = await User.objects.aget(pk=user.id)
+        await cache.aset(_user_key(user.id), found, USER_CACHE_SECONDS)
+    return found
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the claims read by
+    ``ClaimsJWTAuthentication``, and which can be revoked.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if revocation.get_store().is_revoked(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        revocation.get_store().revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.username
+        token[ROLE_CLAIM] = user.role
+        token[VERSION_CLAIM] = user.token_version
+        # The row was just read: spare the first request a lookup
+        cache.add(_state_key(user.pk), (user.token_version, user.is_active, user.role), STATE_CACHE_SECONDS)
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """``TokenRefreshSerializer`` checking the cached user state instead of the user row."""
+    token_class = ClaimsRefreshToken
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        state = user_state(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if state is None or not state[1]:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        if VERSION_CLAIM in refresh.payload:
+            if refresh[VERSION_CLAIM] != state[0]:
+                raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+            # Role changes reach new access tokens
+            refresh[ROLE_CLAIM] = state[2]
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class ClaimsTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenVerifySerializer(TokenVerifySerializer):
+    """``TokenVerifySerializer`` refusing tokens of the revocation store."""
+    
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        if revocation.get_store().is_revoked(token[api_settings.JTI_CLAIM], token['exp']):
+            raise ValidationError('Token is blacklisted')
+        return {}
+
+
+class ClaimsUser(TokenUser):
+    """``request.user`` for claims-bearing tokens; ``user`` loads the full row."""
+
+    @cached_property
+    def role(self):
+        return self.token[ROLE_CLAIM]
+
+    @property
+    def is_customer(self):
+        return self.role == 'customer'
+
+    @property
+    def is_seller(self):
+        return self.role == 'seller'
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    @cached_property
+    def user(self):
+        user = cache.get(_user_key(self.id))
+        if user is None:
+            user = User.objects.get(pk=self.id)
+            cache.set(_user_key(self.id), user, USER_CACHE_SECONDS)
+        return user
+
+
+class ClaimsJWTAuthentication(TimedJWTAuthentication):
+    """JWT authentication answering from token claims and the cached user state."""
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token or VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        check_state(user_state(validated_token[api_settings.USER_ID_CLAIM]), validated_token)
+        return ClaimsUser(validated_token)
+    
+    async def aauthenticate(self, request):
+        """
+        ``authenticate`` for async views: the user, or ``None`` without a
+        token. Claims-bearing tokens cost no query when the state is cached.
+        """
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        return await self.aget_user(self.get_validated_token(raw_token))
+    
+    async def aget_user(self, validated_token):
+        """``get_user`` for async views."""
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if ROLE_CLAIM in validated_token and VERSION_CLAIM in validated_token:
+            check_state(await auser_state(user_id), validated_token)
+            return ClaimsUser(validated_token)
+        
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
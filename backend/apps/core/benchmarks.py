@@ -0,0 +1,257 @@
+"""
+In-process API benchmarks.
+
+Scenarios drive the real URLconf through the Django test client, so every
+middleware, authentication class, serializer and query runs as in
+production, minus the network and the application server. Each scenario
+reports latency percentiles, throughput and queries per request; results
+are plain dicts so runs can be saved as JSON and compared later.
+
+``json_benchmark`` separately compares DRF's stdlib JSON renderer and
+parser with the orjson-backed ones on real serializer output.
+"""
+import io
+import math
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import Prefetch
+from django.test import Client
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import ClaimsRefreshToken
+from .cache import CACHE_ALIAS
+from .models import Book, Order, OrderItem, User
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .serializers import BookSerializer, OrderSerializer
+from .services import inventory
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+@contextmanager
+def count_queries(counter):
+    """Count queries on every connection used by this thread into ``counter``."""
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+class Fixtures:
+    """Users, tokens and ids sampled from the database the scenarios draw on."""
+
+    def __init__(self, rng, sample_size=500):
+        self.rng = rng
+        self.book_ids = list(
+            Book.objects.filter(is_active=True).order_by('?').values_list('id', flat=True)[:sample_size]
+        )
+        self.in_stock = list(
+            Book.objects.filter(is_active=True, stock_quantity__gte=5)
+            .order_by('?').values_list('id', flat=True)[:sample_size]
+        )
+        titles = Book.objects.filter(id__in=self.book_ids[:100]).values_list('title', flat=True)
+        self.terms = sorted({word.lower() for title in titles for word in title.split() if len(word) > 2})
+        self.customers = self._tokens('customer')
+        self.sellers = self._tokens('seller', books__isnull=False)
+
+    def _tokens(self, role, **filters):
+        users = User.objects.filter(role=role, is_active=True, **filters).distinct().order_by('?')[:20]
+        return [str(ClaimsRefreshToken.for_user(user).access_token) for user in users]
+
+    def auth(self, tokens):
+        return {'HTTP_AUTHORIZATION': f'Bearer {self.rng.choice(tokens)}'} if tokens else {}
+
+
+def book_list(fixtures):
+    ordering = fixtures.rng.choice(['-created_at', 'price', 'title'])
+    return 'get', f'/api/core/books/?ordering={ordering}', None, {}
+
+
+def book_search(fixtures):
+    term = fixtures.rng.choice(fixtures.terms or ['book'])
+    return 'get', f'/api/core/books/?search={term}&search_mode=fulltext', None, {}
+
+
+def book_detail(fixtures):
+    book_id = fixtures.rng.choice(fixtures.book_ids)
+    return 'get', f'/api/core/books/{book_id}/', None, {}
+
+
+def order_create(fixtures):
+    books = fixtures.rng.sample(fixtures.in_stock, min(len(fixtures.in_stock), fixtures.rng.randint(1, 3)))
+    data = {
+        'shipping_address': '1 Benchmark Street',
+        'items': [{'book_id': book_id, 'quantity': 1} for book_id in books],
+    }
+    return 'post', '/api/core/orders/', data, fixtures.auth(fixtures.customers)
+
+
+def seller_order_list(fixtures):
+    return 'get', '/api/core/orders/', None, fixtures.auth(fixtures.sellers)
+
+
+SCENARIOS = {
+    'book-list': book_list,
+    'book-search': book_search,
+    'book-detail': book_detail,
+    'order-create': order_create,
+    'seller-order-list': seller_order_list,
+}
+
+
+def _run_one(client, fixtures, scenario, cold_cache):
+    method, path, data, headers = scenario(fixtures)
+    if cold_cache:
+        caches[CACHE_ALIAS].clear()
+    queries = [0]
+    with count_queries(queries):
+        started = time.perf_counter()
+        if data is None:
+            response = getattr(client, method)(path, **headers)
+        else:
+            response = getattr(client, method)(path, data, content_type='application/json', **headers)
+        elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, queries[0], response.status_code < 400
+
+
+def run_scenario(name, fixtures, requests=200, warmup=20, concurrency=1, host='localhost', cold_cache=False):
+    """Run scenario ``name`` and return its latency and query statistics."""
+    scenario = SCENARIOS[name]
+
+    def worker(count):
+        client = Client(HTTP_HOST=host)
+        try:
+            return [_run_one(client, fixtures, scenario, cold_cache) for _ in range(count)]
+        finally:
+            if concurrency > 1:
+                connection.close()
+
+    worker(warmup)
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = [sample for part in pool.map(worker, shares) for sample in part]
+    else:
+        samples = worker(requests)
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else None,
+        'throughput_rps': len(samples) / wall if wall else None,
+        'queries_per_request': sum(queries for _, queries, _ in samples) / len(samples) if samples else None,
+    }
+
+
+def run(scenarios=None, requests=200, warmup=20, concurrency=1, host='localhost', cold_cache=False, seed=42):
+    """Run ``scenarios`` (all by default) and return a JSON-serializable report."""
+    fixtures = Fixtures(random.Random(seed))
+    results = {}
+    for name in scenarios or SCENARIOS:
+        results[name] = run_scenario(name, fixtures, requests, warmup, concurrency, host, cold_cache)
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'books': Book.objects.count(),
+            'requests': requests,
+            'concurrency': concurrency,
+            'cold_cache': cold_cache,
+            'seed': seed,
+        },
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.10):
+    """
+    Compare two reports scenario by scenario.
+
+    Returns ``(rows, regressions)``; a scenario regresses when its p95 grows
+    by more than ``tolerance`` or it issues more queries per request.
+    """
+    rows, regressions = [], []
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        row = {'scenario': name}
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request'):
+            old, new = before.get(metric), result.get(metric)
+            row[metric] = (old, new, (new - old) / old if old and new is not None else None)
+        rows.append(row)
+        p95_change = row['p95_ms'][2]
+        old_queries, new_queries, _ = row['queries_per_request']
+        if (p95_change is not None and p95_change > tolerance) or (
+                old_queries is not None and new_queries is not None and new_queries > old_queries):
+            regressions.append(name)
+    return rows, regressions
+
+
+def json_payloads(orders=100, books=100):
+    """``OrderSerializer`` and ``BookSerializer`` output for the latest rows."""
+    order_rows = Order.objects.select_related('customer').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('book'))
+    ).order_by('-id')[:orders]
+    book_rows = inventory.with_available_stock(
+        Book.objects.select_related('category', 'seller')
+    ).order_by('-id')[:books]
+    return {
+        'orders': OrderSerializer(order_rows, many=True).data,
+        'books': BookSerializer(book_rows, many=True).data,
+    }
+
+
+def _median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def json_benchmark(payloads, repeat=50):
+    """Median render and parse times of DRF's JSON classes against the fast ones."""
+    implementations = {
+        'drf': (JSONRenderer(), JSONParser()),
+        'fast': (FastJSONRenderer(), FastJSONParser()),
+    }
+    results = {}
+    for name, data in payloads.items():
+        body = JSONRenderer().render(data)
+        result = {'bytes': len(body)}
+        for label, (renderer, parser) in implementations.items():
+            result[f'{label}_render_ms'] = _median_ms(lambda: renderer.render(data), repeat)
+            result[f'{label}_parse_ms'] = _median_ms(lambda: parser.parse(io.BytesIO(body)), repeat)
+        for step in ('render', 'parse'):
+            fast = result[f'fast_{step}_ms']
+            result[f'{step}_speedup'] = result[f'drf_{step}_ms'] / fast if fast else None
+        results[name] = result
+    return results
@@ -0,0 +1,219 @@
+"""
+Tag-invalidated response cache for read-heavy endpoints.
+
+Every entry records the version of each tag it depends on (``book:<id>``,
+``category:<id>``, ``seller:<id>``, ...). Invalidating a tag just moves its
+version forward, so stale entries are detected on read without having to
+enumerate keys. This works with any Django cache backend, including the
+local-memory and file-based ones.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from bookbridge.routers import replica_reads_active
+
+
+CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+# How long replicas may lag behind an invalidation
+REPLICA_SETTLE_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def stats():
+    """Return hit/miss counters for this process, e.g. ``{'book:list:hit': 12}``."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def _new_version():
+    # Time-based versions keep entries invalid even if a tag key is evicted
+    # and later recreated.
+    return time.time_ns()
+
+
+def tag_versions(tags):
+    """Return the current version of every tag, creating missing ones."""
+    cache = caches[CACHE_ALIAS]
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def invalidate_tags(*tags):
+    """Invalidate every cached response depending on any of ``tags``."""
+    if tags:
+        version = _new_version()
+        caches[CACHE_ALIAS].set_many({_tag_key(tag): version for tag in tags}, timeout=None)
+
+
+async def atag_versions(tags):
+    """``tag_versions`` for async views."""
+    cache = caches[CACHE_ALIAS]
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _is_current(entry, current):
+    return all(current.get(_tag_key(tag)) == version for tag, version in entry['tags'].items())
+
+
+def _settling(versions, settle_seconds):
+    return settle_seconds and versions and time.time_ns() - max(versions.values()) < settle_seconds * 1e9
+
+
+def get_response(key):
+    """Return cached ``(data, headers)`` for ``key`` or ``None`` if missing or stale."""
+    cache = caches[CACHE_ALIAS]
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if not _is_current(entry, cache.get_many([_tag_key(tag) for tag in entry['tags']])):
+        return None
+    return entry['data'], entry['headers']
+
+
+async def aget_response(key):
+    """``get_response`` for async views."""
+    cache = caches[CACHE_ALIAS]
+    entry = await cache.aget(key)
+    if entry is None:
+        return None
+    if not _is_current(entry, await cache.aget_many([_tag_key(tag) for tag in entry['tags']])):
+        return None
+    return entry['data'], entry['headers']
+
+
+def set_response(key, data, tags, headers=None, settle_seconds=0):
+    """
+    Cache ``data`` under ``key``, tagged with ``tags``.
+
+    Nothing is stored if one of the tags was invalidated less than
+    ``settle_seconds`` ago: data read from a lagging replica may predate
+    that invalidation. Returns whether the entry was stored.
+    """
+    versions = tag_versions(tags)
+    if _settling(versions, settle_seconds):
+        return False
+    caches[CACHE_ALIAS].set(key, {
+        'data': data,
+        'headers': headers or {},
+        'tags': versions,
+    }, CACHE_TIMEOUT)
+    return True
+
+
+async def aset_response(key, data, tags, headers=None, settle_seconds=0):
+    """``set_response`` for async views."""
+    versions = await atag_versions(tags)
+    if _settling(versions, settle_seconds):
+        return False
+    await caches[CACHE_ALIAS].aset(key, {
+        'data': data,
+        'headers': headers or {},
+        'tags': versions,
+    }, CACHE_TIMEOUT)
+    return True
+
+
+def normalized_query(query_params, exclude=()):
+    """Return the query string with keys and repeated values sorted."""
+    return urlencode(sorted(
+        (key, value)
+        for key in query_params if key not in exclude
+        for value in query_params.getlist(key)
+    ))
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list`` and ``retrieve`` from the response cache.
+
+    Entries are keyed on the host, action, lookup and normalized query string
+    and tagged through ``get_cache_tags``. Requests carrying any of
+    ``cache_bypass_params`` are never cached. Responses carry an ``X-Cache``
+    header reporting ``HIT`` or ``MISS``. Validators set by the wrapped view
+    (see ``ConditionalGetMixin``) are stored with the entry, so a hit can
+    answer a conditional request with 304 without touching the database.
+    """
+    cache_prefix = None
+    cached_headers = ('ETag', 'Last-Modified')
+    cache_bypass_params = ()
+
+    def get_cache_tags(self, data):
+        raise NotImplementedError
+
+    def get_cache_key(self, request):
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')
+        raw = '|'.join([
+            request.get_host(), self.action, str(lookup),
+            normalized_query(request.query_params),
+        ])
+        return f'response:{self.cache_prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def cached_response(self, request, view, *args, **kwargs):
+        if any(param in request.query_params for param in self.cache_bypass_params):
+            return view(request, *args, **kwargs)
+
+        stat = f'{self.cache_prefix}:{self.action}'
+        key = self.get_cache_key(request)
+        entry = get_response(key)
+        if entry is not None:
+            _count(f'{stat}:hit')
+            data, headers = entry
+            response = get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+            ) or Response(data)
+            for header, value in headers.items():
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(f'{stat}:miss')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {h: response[h] for h in self.cached_headers if response.has_header(h)}
+            set_response(
+                key, response.data, self.get_cache_tags(response.data), headers,
+                settle_seconds=REPLICA_SETTLE_SECONDS if replica_reads_active() else 0,
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,311 @@
+"""
+Live stock and order-status events for Server-Sent Events streams.
+
+Writers publish on commit: ``stock_changed`` with the ids of books whose
+stock may have moved (saves, checkouts, imports) and ``order_status`` when
+an order changes status. Publishing costs no query: stock events only
+carry book ids. Each process runs one dispatcher thread, started with its
+first subscriber. It takes events in batches, reads the current stock of
+the changed books that local clients watch in a single query, and fans the
+events out to the subscribers' queues. A burst of checkouts of one book
+becomes one read and one event per batch.
+
+Without ``EVENTS_RELAY_PATH``, events stay in the process that published
+them, which suits a single ASGI worker. With it, a small SQLite file on the
+host stands in for a message broker: publishers append rows to it and
+every dispatcher polls it (``PRAGMA data_version`` tells whether anything
+was written), so clients of any worker see events from all of them. Rows
+are kept for ``EVENTS_RETENTION_SECONDS``.
+
+Order events are replayed to reconnecting clients from their
+``Last-Event-ID`` while they are retained; stock needs no replay, as every
+stream starts with a snapshot of the books it watches.
+"""
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from itertools import count
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Book
+from .services import inventory
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+RETENTION_SECONDS = getattr(settings, 'EVENTS_RETENTION_SECONDS', 300)
+POLL_SECONDS = 0.2
+# Order events kept for replay by a process-local relay
+RECENT_EVENTS = 1000
+
+STOCK = 'stock'
+ORDER = 'order'
+
+
+def relay_path():
+    return getattr(settings, 'EVENTS_RELAY_PATH', '')
+
+
+def book_channel(book_id):
+    return f'book:{book_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def current_stock(book_ids):
+    """Stock event data of every book of ``book_ids``, from one query."""
+    rows = Book.objects.filter(pk__in=book_ids).annotate(
+        available=inventory.available_stock()
+    ).values_list('id', 'available', 'is_active')
+    found = {
+        book_id: {'book_id': book_id, 'stock_quantity': available, 'in_stock': is_active and available > 0}
+        for book_id, available, is_active in rows
+    }
+    # Deleted books are out of stock
+    return {
+        book_id: found.get(book_id, {'book_id': book_id, 'stock_quantity': 0, 'in_stock': False})
+        for book_id in book_ids
+    }
+
+
+class Subscriber:
+    """
+    Queue of ``(id, name, data)`` events of some channels for one stream,
+    living on the stream's event loop. A client too slow to drain
+    ``QUEUE_SIZE`` events is marked ``closed`` and should be disconnected,
+    to reconnect and catch up.
+    """
+
+    def __init__(self, channels, loop):
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.closed = False
+        self._loop = loop
+
+    def put(self, event):
+        """Queue ``event``; called from the dispatcher thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's loop is gone; it unsubscribes on its way out
+            self.closed = True
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+
+
+class LocalRelay:
+    """Events of this process only."""
+
+    def __init__(self):
+        self._ids = count(1)
+        self._queue = queue.SimpleQueue()
+        self._recent = deque(maxlen=RECENT_EVENTS)
+
+    def publish(self, events):
+        for channel, name, data in events:
+            self._queue.put((next(self._ids), channel, name, data))
+
+    def receive(self, timeout):
+        """Wait up to ``timeout`` seconds for events, then take all pending ones."""
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._recent.extend(event for event in events if event[3] is not None)
+        return events
+
+    def since(self, event_id, channels):
+        """Retained events with data on ``channels`` after ``event_id``."""
+        return [event for event in list(self._recent) if event[0] > event_id and event[1] in channels]
+
+
+class SQLiteRelay:
+    """Events of every process on the host, through a shared SQLite file."""
+
+    def __init__(self, path, retention_seconds=RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._last_id = None
+        self._purged_at = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, name TEXT NOT NULL, '
+                'data TEXT, created REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS events_created ON events (created)')
+            self._local.connection = connection
+            self._local.data_version = None
+        return connection
+
+    @staticmethod
+    def _event(row):
+        event_id, channel, name, data = row
+        return event_id, channel, name, None if data is None else json.loads(data)
+
+    def publish(self, events):
+        now = time.time()
+        self._connection().executemany(
+            'INSERT INTO events (channel, name, data, created) VALUES (?, ?, ?, ?)',
+            [(channel, name, None if data is None else json.dumps(data), now) for channel, name, data in events],
+        )
+        if now - self._purged_at > self.retention_seconds:
+            self.purge()
+
+    def receive(self, timeout):
+        """Wait up to ``timeout`` seconds for rows written since the last call."""
+        connection = self._connection()
+        if self._last_id is None:
+            # Start from now; older events are only replayed on request
+            self._last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        deadline = time.monotonic() + timeout
+        while True:
+            data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._local.data_version:
+                self._local.data_version = data_version
+                rows = connection.execute(
+                    'SELECT id, channel, name, data FROM events WHERE id > ? ORDER BY id', (self._last_id,)
+                ).fetchall()
+                if rows:
+                    self._last_id = rows[-1][0]
+                    return [self._event(row) for row in rows]
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(POLL_SECONDS)
+
+    def since(self, event_id, channels):
+        channels = list(channels)
+        rows = self._connection().execute(
+            'SELECT id, channel, name, data FROM events WHERE id > ? AND data IS NOT NULL '
+            f'AND channel IN ({", ".join("?" * len(channels))}) ORDER BY id',
+            (event_id, *channels),
+        ).fetchall()
+        return [self._event(row) for row in rows]
+
+    def purge(self):
+        self._purged_at = time.time()
+        self._connection().execute('DELETE FROM events WHERE created < ?', (self._purged_at - self.retention_seconds,))
+
+
+class Broker:
+    """Fan-out of relayed events to this process's subscribers."""
+
+    def __init__(self, relay):
+        self.relay = relay
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, events):
+        """Publish ``(channel, name, data)`` events; ``data`` of stock events is ``None``."""
+        # Nobody in this process listens before its first subscriber
+        if not events or (isinstance(self.relay, LocalRelay) and self._thread is None):
+            return
+        try:
+            self.relay.publish(events)
+        except sqlite3.Error:
+            logger.warning('Could not publish %d events', len(events), exc_info=True)
+
+    def subscribe(self, channels, loop):
+        subscriber = Subscriber(channels, loop)
+        with self._lock:
+            for channel in subscriber.channels:
+                self._subscribers[channel].add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events-dispatcher', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for channel in subscriber.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def _run(self):
+        while True:
+            try:
+                events = self.relay.receive(timeout=1)
+                if events:
+                    close_old_connections()
+                    self.dispatch(events)
+            except Exception:
+                logger.exception('Event dispatch failed')
+                time.sleep(1)
+
+    def dispatch(self, events):
+        """Resolve stock and queue ``(id, channel, name, data)`` events for their subscribers."""
+        with self._lock:
+            watched = {channel: list(subscribers) for channel, subscribers in self._subscribers.items()}
+        stock_ids = {
+            int(channel.split(':', 1)[1])
+            for _, channel, name, data in events if name == STOCK and data is None and channel in watched
+        }
+        stock = current_stock(stock_ids) if stock_ids else {}
+        for event_id, channel, name, data in events:
+            subscribers = watched.get(channel)
+            if not subscribers:
+                continue
+            if name == STOCK and data is None:
+                # One event per book and batch, with its current stock
+                data = stock.pop(int(channel.split(':', 1)[1]), None)
+                if data is None:
+                    continue
+            for subscriber in subscribers:
+                subscriber.put((event_id, name, data))
+
+    def since(self, event_id, channels):
+        return self.relay.since(event_id, channels)
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    path = relay_path()
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = Broker(SQLiteRelay(path) if path else LocalRelay())
+        return _brokers[path]
+
+
+def stock_changed(book_ids):
+    """Tell watchers of ``book_ids`` that their stock may have changed."""
+    get_broker().publish([(book_channel(book_id), STOCK, None) for book_id in book_ids])
+
+
+def order_status(order):
+    """Tell the customer of ``order`` about its new status."""
+    get_broker().publish([(user_channel(order.customer_id), ORDER, {
+        'order_id': order.pk,
+        'status': order.status,
+        'updated_at': order.updated_at.isoformat(),
+    })])
@@ -0,0 +1,74 @@
+"""
+Facet counts for catalog browsing.
+
+``facet_counts`` returns the number of books per category, price band and
+stock state for a filtered catalog queryset, from a single ``GROUP BY``
+over the three facets; the per-facet totals are summed up in Python from
+the (few) groups. Results are cached per filter signature, i.e. the query
+string without pagination and ordering, in the tag-invalidated response
+cache.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, Count, IntegerField, Value, When
+from rest_framework.settings import api_settings
+
+from bookbridge.routers import replica_reads_active
+
+from .cache import REPLICA_SETTLE_SECONDS, get_response, normalized_query, set_response
+from .services.inventory import with_available_stock
+
+
+# Upper bounds of the price bands; the last band is open-ended
+PRICE_BUCKETS = getattr(settings, 'BOOK_PRICE_BUCKETS', (10, 20, 50, 100))
+
+# Query parameters that do not change which books are counted
+IGNORED_PARAMS = ('cursor', 'page_size', 'count', 'facets', api_settings.ORDERING_PARAM)
+
+
+def price_bands():
+    bounds = [None, *PRICE_BUCKETS, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def facet_counts(queryset):
+    """Counts per category, price band and stock state for ``queryset``."""
+    price_band = Case(
+        *(When(price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)),
+        default=Value(len(PRICE_BUCKETS)), output_field=IntegerField(),
+    )
+    in_stock = Case(When(available__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField())
+    groups = with_available_stock(queryset.order_by()).annotate(
+        facet_price_band=price_band, facet_in_stock=in_stock,
+    ).values('category_id', 'category__name', 'facet_price_band', 'facet_in_stock').annotate(count=Count('pk'))
+
+    categories, bands, stock = {}, [0] * (len(PRICE_BUCKETS) + 1), {'in_stock': 0, 'out_of_stock': 0}
+    for group in groups:
+        category = categories.setdefault(group['category_id'], {
+            'id': group['category_id'], 'name': group['category__name'], 'count': 0,
+        })
+        category['count'] += group['count']
+        bands[group['facet_price_band']] += group['count']
+        stock['in_stock' if group['facet_in_stock'] else 'out_of_stock'] += group['count']
+
+    return {
+        'category': sorted(categories.values(), key=lambda category: (-category['count'], category['name'] or '')),
+        'price': [
+            {'min_price': low, 'max_price': high, 'count': count}
+            for (low, high), count in zip(price_bands(), bands) if count
+        ],
+        'stock': stock,
+    }
+
+
+def cached_facet_counts(queryset, query_params, tags):
+    """``facet_counts`` cached per filter signature and tagged with ``tags``."""
+    raw = normalized_query(query_params, exclude=IGNORED_PARAMS)
+    key = f'facets:book:{hashlib.md5(raw.encode()).hexdigest()}'
+    entry = get_response(key)
+    if entry is not None:
+        return entry[0]
+    counts = facet_counts(queryset)
+    set_response(key, counts, tags, settle_seconds=REPLICA_SETTLE_SECONDS if replica_reads_active() else 0)
+    return counts
@@ -0,0 +1,24 @@
+"""
+Filter sets for the core API.
+"""
+import django_filters
+
+from .models import Book
+from .services.inventory import with_available_stock
+
+
+class BookFilter(django_filters.FilterSet):
+    """Catalog filters matching the facets of ``apps.core.facets``."""
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lt')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    
+    class Meta:
+        model = Book
+        fields = ['category', 'seller']
+    
+    def filter_in_stock(self, queryset, name, value):
+        queryset = with_available_stock(queryset)
+        if value:
+            return queryset.filter(available__gt=0)
+        return queryset.filter(available__lte=0)
@@ -0,0 +1,75 @@
+import json
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the API in-process: p50/p95/p99 latency, throughput and '
+        'queries per request for each scenario. Note that order-create places '
+        'real orders; run it against seeded data (see seed_scale).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=list(benchmarks.SCENARIOS), dest='scenarios',
+            help='Scenario to run; repeat for several (default: all)',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per scenario')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the response cache before each request')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p95 growth, as a fraction')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+
+        if options['verbosity'] < 2:
+            # One slow-request warning per measured request drowns the report
+            logging.getLogger('bookbridge.performance').setLevel(logging.ERROR)
+
+        report = benchmarks.run(
+            scenarios=options['scenarios'],
+            requests=options['requests'],
+            warmup=options['warmup'],
+            concurrency=options['concurrency'],
+            host=options['host'],
+            cold_cache=options['cold_cache'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(f"{'scenario':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}{'queries':>9}{'errors':>8}")
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<20}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['throughput_rps']:>10.1f}{result['queries_per_request']:>9.1f}{result['errors']:>8}"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text())
+            rows, regressions = benchmarks.compare(baseline, report, options['tolerance'])
+            for row in rows:
+                old, new, change = row['p95_ms']
+                change = f'{change:+.1%}' if change is not None else 'n/a'
+                self.stdout.write(f"{row['scenario']:<20} p95 {old:.2f} -> {new:.2f} ms ({change})")
+            if regressions:
+                message = f"Regressions: {', '.join(regressions)}"
+                if options['fail_on_regression']:
+                    raise CommandError(message)
+                self.stdout.write(self.style.WARNING(message))
+            else:
+                self.stdout.write(self.style.SUCCESS('No regressions.'))
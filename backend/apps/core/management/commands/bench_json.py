@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from apps.core import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSON renderer and parser with the orjson-backed ones on "
+        'real OrderSerializer and BookSerializer output.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100, help='Orders per payload')
+        parser.add_argument('--books', type=int, default=100, help='Books per payload')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per measurement')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        payloads = benchmarks.json_payloads(options['orders'], options['books'])
+        results = benchmarks.json_benchmark(payloads, options['repeat'])
+
+        self.stdout.write(f"{'payload':<10}{'bytes':>10}{'render drf':>12}{'fast':>9}{'parse drf':>12}{'fast':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<10}{result['bytes']:>10}"
+                f"{result['drf_render_ms']:>10.2f}ms{result['fast_render_ms']:>7.2f}ms"
+                f"{result['drf_parse_ms']:>10.2f}ms{result['fast_parse_ms']:>7.2f}ms"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold new orders into the co-purchase matrix behind /books/<id>/related/, '
+        'once or every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount the whole order history')
+        parser.add_argument('--interval', type=float, help='Keep updating every this many seconds')
+        parser.add_argument('--path', help='Matrix file (default: settings.RECOMMENDATIONS_PATH)')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            if full:
+                entries = recommendations.build(options['path'])
+                self.stdout.write(self.style.SUCCESS(f'Co-purchase matrix rebuilt, {entries} entries'))
+                full = False
+            else:
+                entries = recommendations.update(options['path'])
+                if entries:
+                    self.stdout.write(f'Co-purchase matrix updated, {entries} entries')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import Book, User
+from apps.core.services.exports import FORMATS, export_books
+
+
+class Command(BaseCommand):
+    help = 'Stream the book catalog to stdout or a file as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--seller', help='Only export books of this seller username')
+        parser.add_argument('--active-only', action='store_true', help='Skip inactive books')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queryset = Book.objects.all()
+        if options['seller']:
+            try:
+                seller = User.objects.get(username=options['seller'], role='seller')
+            except User.DoesNotExist:
+                raise CommandError(f'Seller "{options["seller"]}" does not exist')
+            queryset = queryset.filter(seller_id=seller.id)
+        if options['active_only']:
+            queryset = queryset.filter(is_active=True)
+
+        chunks = export_books(queryset, options['format'], chunk_size=options['chunk_size'])
+        write_chunks(chunks, options['output'])
+
+
+def write_chunks(chunks, path):
+    out = open(path, 'w', encoding='utf-8', newline='') if path else sys.stdout
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if path:
+            out.close()
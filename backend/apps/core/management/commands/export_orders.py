@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import User
+from apps.core.services.exports import FORMATS, export_orders
+
+from .export_books import write_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream order lines to stdout or a file as CSV or NDJSON, as seen by a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--user', required=True, help='Export the orders visible to this username')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist')
+
+        chunks = export_orders(user, options['format'], chunk_size=options['chunk_size'])
+        write_chunks(chunks, options['output'])
@@ -0,0 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apps.core import renditions
+from apps.core.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Generate missing cover image renditions for books.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=renditions.WORKERS)
+        parser.add_argument('--force', action='store_true', help='Also re-record books whose renditions are already up to date')
+
+    def handle(self, *args, **options):
+        books = (
+            book
+            for book in Book.objects.exclude(image='').exclude(image__isnull=True)
+                .only('id', 'image', 'image_renditions').iterator(chunk_size=500)
+            if options['force'] or renditions.needs_renditions(book)
+        )
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for book, error in renditions.generate_many(books, pool, window=options['workers'] * 2):
+                if error is None:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'book {book.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'{done} books rendered, {failed} failed'))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import Book, StockSlot
+from apps.core.services import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage slotted stock for hot books: enable or disable slots for books, '
+        'list hot books, or rebalance their slots (once or every --interval seconds).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'disable', 'rebalance', 'status'])
+        parser.add_argument('book_ids', nargs='*', type=int, help='Books to act on (default for rebalance: all hot books)')
+        parser.add_argument('--slots', type=int, default=inventory.SLOTS, help='Number of stock slots per hot book')
+        parser.add_argument('--interval', type=float, help='Keep rebalancing every this many seconds')
+
+    def handle(self, *args, **options):
+        action, book_ids = options['action'], options['book_ids']
+        if action in ('enable', 'disable') and not book_ids:
+            raise CommandError(f'{action} needs at least one book id')
+        missing = set(book_ids) - set(Book.objects.filter(pk__in=book_ids).values_list('id', flat=True))
+        if missing:
+            raise CommandError(f"Unknown book ids: {', '.join(map(str, sorted(missing)))}")
+
+        if action == 'enable':
+            if options['slots'] < 1:
+                raise CommandError('--slots must be at least 1')
+            for book_id in book_ids:
+                inventory.enable(book_id, options['slots'])
+            self.stdout.write(self.style.SUCCESS(f"{len(book_ids)} books split into {options['slots']} slots"))
+        elif action == 'disable':
+            for book_id in book_ids:
+                inventory.disable(book_id)
+            self.stdout.write(self.style.SUCCESS(f'{len(book_ids)} books back on a single stock row'))
+        elif action == 'status':
+            slots = StockSlot.objects.order_by('book_id', 'slot').values_list('book_id', 'quantity')
+            if book_ids:
+                slots = slots.filter(book_id__in=book_ids)
+            by_book = {}
+            for book_id, quantity in slots:
+                by_book.setdefault(book_id, []).append(quantity)
+            for book_id, quantities in by_book.items():
+                self.stdout.write(f'book {book_id}: {sum(quantities)} in {quantities}')
+        else:
+            while True:
+                totals = inventory.rebalance(book_ids or None)
+                self.stdout.write(f'{len(totals)} hot books rebalanced')
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
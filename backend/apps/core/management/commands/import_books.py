@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import User
+from apps.core.services.book_import import FORMATS, detect_format, import_books
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL catalog into the books table, upserting by ISBN.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--seller', required=True, help='Username of the seller owning the books')
+        parser.add_argument('--format', choices=FORMATS, help='Input format (default: from file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows validated and written per batch')
+        parser.add_argument('--workers', type=int, default=1, help='Parse/validate worker processes')
+        parser.add_argument('--errors', help='Write the per-row error report to this JSONL file')
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['seller'], role='seller')
+        except User.DoesNotExist:
+            raise CommandError(f'Seller "{options["seller"]}" does not exist')
+
+        fmt = options['format'] or detect_format(options['path'])
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            report = import_books(
+                stream, fmt, seller.id,
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                max_errors=float('inf') if options['errors'] else 20,
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8') as out:
+                for error in report['errors']:
+                    out.write(json.dumps(error) + '\n')
+        else:
+            for error in report['errors']:
+                self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["rows"]} rows: {report["created"]} created, '
+            f'{report["updated"]} updated, {report["failed"]} failed'
+        ))
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from apps.core.services import order_intake
+
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between attempts while the database keeps failing
+MAX_BACKOFF_SECONDS = 30
+
+
+class Command(BaseCommand):
+    help = (
+        'Place queued orders in batches, one transaction per batch. Run several '
+        'of these side by side for more throughput (MySQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=order_intake.BATCH_SIZE)
+        parser.add_argument('--idle-sleep', type=float, default=0.05, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        placed = failed = errors = 0
+        while True:
+            try:
+                batch_placed, batch_failed = order_intake.process_batch(options['batch_size'])
+            except DatabaseError:
+                if options['once']:
+                    raise
+                errors += 1
+                delay = min(2 ** errors, MAX_BACKOFF_SECONDS)
+                logger.exception('Order intake failed, retrying in %ds', delay)
+                # Drop a connection the error may have broken
+                close_old_connections()
+                time.sleep(delay)
+                continue
+            errors = 0
+            placed += batch_placed
+            failed += batch_failed
+            if batch_placed or batch_failed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['idle_sleep'])
+        self.stdout.write(self.style.SUCCESS(f'{placed} orders placed, {failed} failed'))
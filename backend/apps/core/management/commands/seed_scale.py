@@ -0,0 +1,212 @@
+import random
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.core.models import Book, Category, Order, OrderItem, User
+
+
+WORDS = (
+    'shadow river garden silent empire winter summer broken golden city night '
+    'storm hidden secret last first lost ocean forest mountain fire glass iron '
+    'kingdom letter house road island memory dream star wolf raven crown song '
+    'journey stranger daughter son war peace light dark time world machine'
+).split()
+
+NAMES = (
+    'Ada Alan Grace Mary Jane Leo Toni Ursula Isaac Octavia Ray Frank Agatha '
+    'Virginia George Emily Charlotte Herman Fyodor Chinua Haruki Gabriel Zadie'
+).split()
+
+SURNAMES = (
+    'Lovelace Turing Hopper Shelley Austen Tolstoy Morrison Le Guin Asimov '
+    'Butler Bradbury Herbert Christie Woolf Orwell Bronte Melville Achebe '
+    'Murakami Marquez Smith'
+).split()
+
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let ``bulk_create`` keep the ``created_at``/``updated_at`` values we set."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic catalog with bulk inserts: users per role, '
+        'categories, books and order histories with Zipf-skewed book popularity.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--sellers', type=int, default=50)
+        parser.add_argument('--categories', type=int, default=30)
+        parser.add_argument('--books', type=int, default=100_000)
+        parser.add_argument('--orders', type=int, default=50_000)
+        parser.add_argument('--max-items', type=int, default=5, help='Maximum lines per order')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of book popularity')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed', help='Username prefix; use a new one to seed again')
+        parser.add_argument('--password', default='password123', help='Password for every generated user')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        prefix = options['prefix']
+
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users with prefix "{prefix}" already exist; pass another --prefix')
+
+        with explicit_timestamps(User, Book, Order, OrderItem):
+            password = make_password(options['password'])
+            sellers = self.create_users(prefix, 'seller', options['sellers'], password)
+            customers = self.create_users(prefix, 'customer', options['customers'], password)
+            categories = self.create_categories(options['categories'])
+            books = self.create_books(prefix, options['books'], sellers, categories)
+            self.create_orders(options['orders'], options['max_items'], options['skew'], customers, books)
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.rng.randrange(max(self.days, 1) * 86400))
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def next_id(self, model):
+        # Explicit ids let us reference rows without bulk_create returning
+        # them, which MySQL does not do.
+        return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+    def create_users(self, prefix, role, count, password):
+        first_id = self.next_id(User)
+        for start, end in self.batches(count):
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(
+                        id=first_id + i,
+                        username=f'{prefix}_{role}_{i}',
+                        email=f'{prefix}_{role}_{i}@example.com',
+                        password=password,
+                        role=role,
+                        date_joined=self.now,
+                        created_at=self.now,
+                        updated_at=self.now,
+                    )
+                    for i in range(start, end)
+                ])
+        self.stdout.write(f'{count} {role}s')
+        return list(range(first_id, first_id + count))
+
+    def create_categories(self, count):
+        Category.objects.bulk_create(
+            [Category(name=f'Category {i}', created_at=self.now) for i in range(count)],
+            ignore_conflicts=True,
+        )
+        names = [f'Category {i}' for i in range(count)]
+        ids = list(Category.objects.filter(name__in=names).values_list('id', flat=True))
+        self.stdout.write(f'{len(ids)} categories')
+        return ids
+
+    def create_books(self, prefix, count, sellers, categories):
+        first_id = self.next_id(Book)
+        # Keep ISBNs unique per prefix: 979 + 3-digit prefix hash + 7-digit counter
+        isbn_base = 9790000000000 + (zlib.crc32(prefix.encode()) % 1000) * 10_000_000
+        rng = self.rng
+        prices = []
+        for start, end in self.batches(count):
+            rows = []
+            for i in range(start, end):
+                created = self.timestamp()
+                price = Decimal(rng.randrange(299, 9999)) / 100
+                prices.append(price)
+                rows.append(Book(
+                    id=first_id + i,
+                    title=' '.join(rng.sample(WORDS, rng.randint(1, 4))).title(),
+                    author=f'{rng.choice(NAMES)} {rng.choice(SURNAMES)}',
+                    isbn=str(isbn_base + i),
+                    description='Generated by seed_scale.',
+                    price=price,
+                    stock_quantity=rng.choice((0, 1, 5, 20, 100, 500)),
+                    category_id=rng.choice(categories) if categories else None,
+                    seller_id=rng.choice(sellers),
+                    is_active=rng.random() > 0.02,
+                    created_at=created,
+                    updated_at=created,
+                ))
+            with transaction.atomic():
+                Book.objects.bulk_create(rows)
+            self.stdout.write(f'{end}/{count} books', ending='\r')
+        self.stdout.write(f'{count} books')
+        return first_id, prices
+
+    def create_orders(self, count, max_items, skew, customers, books):
+        first_book, prices = books
+        if not (count and customers and prices):
+            return
+        rng = self.rng
+        # Zipf-like popularity: the k-th most popular title is ordered ~1/k^s as often
+        ranks = list(range(len(prices)))
+        rng.shuffle(ranks)
+        weights = list(accumulate(1 / (rank + 1) ** skew for rank in ranks))
+
+        first_order = self.next_id(Order)
+        for start, end in self.batches(count):
+            orders, items = [], []
+            for i in range(start, end):
+                created = self.timestamp()
+                lines = {}
+                for index in rng.choices(range(len(prices)), cum_weights=weights, k=rng.randint(1, max_items)):
+                    lines[index] = lines.get(index, 0) + rng.randint(1, 3)
+                total = Decimal(0)
+                for index, quantity in lines.items():
+                    subtotal = prices[index] * quantity
+                    total += subtotal
+                    items.append(OrderItem(
+                        order_id=first_order + i,
+                        book_id=first_book + index,
+                        quantity=quantity,
+                        price=prices[index],
+                        subtotal=subtotal,
+                        created_at=created,
+                    ))
+                orders.append(Order(
+                    id=first_order + i,
+                    customer_id=rng.choice(customers),
+                    status=rng.choice(STATUSES),
+                    total_amount=total,
+                    shipping_address='1 Benchmark Street',
+                    created_at=created,
+                    updated_at=created,
+                ))
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create(items)
+            self.stdout.write(f'{end}/{count} orders', ending='\r')
+        self.stdout.write(f'{count} orders')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderintake',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
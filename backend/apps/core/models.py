@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Sum
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -16,6 +17,8 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
+    # Embedded in access tokens; bumping it revokes them, see apps.core.authentication
+    token_version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -38,6 +41,15 @@ class User(AbstractUser):
     @property
     def is_admin(self):
         return self.role == 'admin'
+    
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.token_version += 1
+    
+    def revoke_tokens(self):
+        """Invalidate every access token issued to this user so far."""
+        self.token_version += 1
+        self.save(update_fields=['token_version', 'updated_at'])
 
 
 class Category(models.Model):
@@ -47,6 +59,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'categories'
@@ -70,6 +83,8 @@ class Book(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='books')
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='books', limit_choices_to={'role': 'seller'})
     image = models.ImageField(upload_to='books/', blank=True, null=True)
+    # Resized covers keyed by size then format, see apps.core.renditions
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
@@ -81,6 +96,10 @@ class Book(models.Model):
             models.Index(fields=['title', 'author']),
             models.Index(fields=['category']),
             models.Index(fields=['seller']),
+            # Keyset pagination over the active catalog
+            models.Index(fields=['is_active', 'created_at', 'id']),
+            models.Index(fields=['is_active', 'price', 'id']),
+            models.Index(fields=['is_active', 'title', 'id']),
         ]
     
     def __str__(self):
@@ -88,7 +107,53 @@ class Book(models.Model):
     
     @property
     def in_stock(self):
-        return self.stock_quantity > 0
+        return self.available_stock > 0
+    
+    @property
+    def available_stock(self):
+        """
+        Exact stock for sale. For hot books (see ``StockSlot``) this sums the
+        slots, while ``stock_quantity`` is a total refreshed on rebalance.
+        Querysets annotated by ``inventory.with_available_stock`` save the query.
+        """
+        if hasattr(self, 'available'):
+            return self.available
+        total = self.stock_slots.aggregate(total=Sum('quantity'))['total']
+        return self.stock_quantity if total is None else total
+
+
+class StockSlot(models.Model):
+    """
+    One of several sub-counters holding the stock of a hot book, so that
+    concurrent checkouts update different rows. See
+    apps.core.services.inventory.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='stock_slots')
+    slot = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(validators=[MinValueValidator(0)], default=0)
+    
+    class Meta:
+        db_table = 'stock_slots'
+        unique_together = ['book', 'slot']
+    
+    def __str__(self):
+        return f"{self.book_id}/{self.slot}: {self.quantity}"
+
+
+class BookSearchIndex(models.Model):
+    """
+    The SQLite ``books_fts`` FTS5 table, joined from books by full-text
+    search to read each match's rank. See apps.core.search.
+    """
+    book = models.OneToOneField(
+        Book, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_index',
+    )
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'books_fts'
 
 
 class Order(models.Model):
@@ -113,6 +178,9 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customer', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer.username} - {self.status}"
@@ -148,3 +216,37 @@ class OrderItem(models.Model):
         self.subtotal = self.price * self.quantity
         super().save(*args, **kwargs)
         self.order.calculate_total()
+
+
+class OrderIntake(models.Model):
+    """
+    A checkout accepted while order intake is queued (``ORDER_INTAKE_QUEUE``),
+    waiting for a worker to place it. See apps.core.services.order_intake.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('placed', 'Placed'),
+        ('failed', 'Failed'),
+    ]
+    
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_intakes')
+    shipping_address = models.TextField()
+    # Validated cart lines, as [{'book_id': ..., 'quantity': ...}]
+    items = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='intake')
+    error = models.TextField(blank=True, default='')
+    error_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Processing attempts, including ones that hit a database error
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'order_intake'
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Intake #{self.id} - {self.customer_id} - {self.status}"
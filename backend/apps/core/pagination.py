@@ -0,0 +1,184 @@
+"""
+Keyset pagination for the core API.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination over ``(<ordering field>, id)``.
+
+    The ordering field is taken from the queryset as left by the filter
+    backends (``OrderingFilter``, full-text relevance or the model default)
+    and ``id`` is appended as a tie-breaker, so every page is a bounded
+    index range scan instead of an ``OFFSET``. ``?count=false`` skips the
+    ``COUNT(*)`` for clients that do not need a total, such as infinite
+    scroll.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_fields = ('created_at', 'price', 'title', 'search_rank')
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.prepare(queryset, request, view)
+        if self.count is None and self.with_count:
+            self.count = queryset.order_by().count()
+        return self.finish(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, reading through the async ORM."""
+        page = self.prepare(queryset, request, view)
+        if self.count is None and self.with_count:
+            self.count = await queryset.order_by().acount()
+        return self.finish([row async for row in page])
+
+    def prepare(self, queryset, request, view=None):
+        """Return the slice of ``queryset`` holding the page, plus one row."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(queryset)
+        self.size = self.get_page_size(request)
+
+        self.with_count = request.query_params.get(self.count_query_param, 'true').lower() != 'false'
+        self.count = getattr(view, 'filtered_count', None) if self.with_count else None
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor:
+            self.cursor['v'] = self.cursor_value(queryset, self.cursor['v'])
+        self.reverse = bool(self.cursor and self.cursor.get('r'))
+        # Walking backwards flips the direction; rows are re-reversed below.
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + 'id')
+        if self.cursor:
+            queryset = queryset.filter(self.seek(self.cursor['v'], self.cursor['id'], descending))
+        return queryset[:self.size + 1]
+
+    def finish(self, rows):
+        has_more = len(rows) > self.size
+        rows = rows[:self.size]
+        if self.reverse:
+            rows.reverse()
+
+        self.next_position = self.position(rows[-1]) if rows and (has_more or self.reverse) else None
+        self.previous_position = (
+            self.position(rows[0]) if rows and self.cursor and (has_more or not self.reverse) else None
+        )
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """Return ``(field, descending)`` for the keyset column of ``queryset``."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        first = ordering[0] if ordering else None
+        if not isinstance(first, str) or first.lstrip('-') not in self.keyset_fields:
+            first = self.default_ordering
+        return first.lstrip('-'), first.startswith('-')
+
+    def seek(self, value, pk, descending):
+        """Filter for rows strictly after ``(value, pk)`` in the walk direction."""
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field}__{op}': value})
+            | Q(**{self.field: value, f'id__{op}': pk})
+        )
+
+    def position(self, row):
+        if isinstance(row, dict):
+            return row[self.field], row['id']
+        return getattr(row, self.field), row.pk
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(*self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(*self.previous_position, reverse=True)
+
+    def encode_cursor(self, value, pk, reverse):
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        data = {'v': value, 'id': pk}
+        if reverse:
+            data['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def cursor_value(self, queryset, value):
+        """The cursor's ``value`` converted for the ordering field, or ``NotFound``."""
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            field = annotation.output_field
+        else:
+            field = queryset.model._meta.get_field(self.field)
+        # Booleans are ints to Python, and null cannot be seeked past
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if isinstance(value, Decimal) and not value.is_finite():
+            raise NotFound(self.invalid_cursor_message)
+        return value
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if not isinstance(cursor, dict) or 'v' not in cursor or not isinstance(cursor.get('id'), int):
+                raise ValueError
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
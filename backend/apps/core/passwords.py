@@ -0,0 +1,113 @@
+"""
+Password hashing off the request workers.
+
+Hashing a password on purpose takes a lot of CPU (PBKDF2 runs hundreds of
+thousands of iterations). The async login and registration views await it
+on a small thread pool of ``PASSWORD_HASHING_WORKERS`` threads (``hashlib``
+releases the GIL while hashing), so a burst of sign-ins queues there
+instead of holding the workers that serve the rest of the API. At most
+``PASSWORD_HASHING_QUEUE`` hashes may wait; past that ``HashingBusy`` is
+raised and the views answer 503 straight away. This only frees workers
+under ASGI: under WSGI Django runs the async views in the request's own
+thread, which stays blocked until the pool is done with its hash.
+
+Login goes through ``aauthenticate`` and so through
+``AUTHENTICATION_BACKENDS``; ``PooledModelBackend`` is Django's
+``ModelBackend`` with its async path checking passwords on the pool. A
+right password for a disabled account raises ``AccountDisabled`` so the
+login view can say so.
+
+Successful logins rehash passwords whose stored hash does not use the
+preferred hasher (the first of ``PASSWORD_HASHERS``, see the
+``PASSWORD_HASHER`` setting) or its current work factor.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+
+
+WORKERS = getattr(settings, 'PASSWORD_HASHING_WORKERS', 2)
+QUEUE = getattr(settings, 'PASSWORD_HASHING_QUEUE', 32)
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashes are already waiting for the pool."""
+
+
+class AccountDisabled(Exception):
+    """Raised by ``PooledModelBackend`` for the right password of an inactive user."""
+
+
+class HashingPool:
+
+    def __init__(self, workers=WORKERS, queue=QUEUE):
+        self.limit = workers + queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.limit:
+                raise HashingBusy()
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+pool = HashingPool()
+
+
+def _check(raw_password, encoded):
+    upgraded = []
+    valid = check_password(raw_password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+async def acheck_password(user, raw_password):
+    """
+    Check ``raw_password`` for ``user`` on the pool, saving an upgraded hash
+    if the stored one is outdated. ``user`` may be ``None``, in which case a
+    hash is still computed so unknown usernames take as long to reject.
+    """
+    if user is None:
+        await pool.run(make_password, raw_password)
+        return False
+    valid, upgraded = await pool.run(_check, raw_password, user.password)
+    if upgraded:
+        # Not through set_password, which would revoke the user's tokens
+        user.password = upgraded
+        await user.asave(update_fields=['password'])
+    return valid
+
+
+async def amake_password(raw_password):
+    return await pool.run(make_password, raw_password)
+
+
+class PooledModelBackend(ModelBackend):
+    """``ModelBackend`` hashing on the pool when used through ``aauthenticate``."""
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            user = None
+        if not await acheck_password(user, password):
+            return None
+        if not self.user_can_authenticate(user):
+            raise AccountDisabled()
+        return user
@@ -20,7 +20,7 @@ class IsBookOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.seller == request.user
+        return obj.seller_id == request.user.id
 
 
 class IsCustomerOrReadOnly(permissions.BasePermission):
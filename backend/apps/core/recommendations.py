@@ -0,0 +1,267 @@
+"""
+"Customers also bought" recommendations.
+
+Co-purchases are counted offline into a sparse book x book matrix, stored
+in CSR form in a single binary file (native byte order)::
+
+    header   magic, number of rows, number of entries, last order counted,
+             number of recent orders
+    books    int64[rows]      sorted ids of books with co-purchases
+    indptr   int64[rows + 1]  row i spans entries indptr[i]:indptr[i + 1]
+    indices  int64[entries]   co-purchased book ids, most bought first
+    counts   uint32[entries]  number of orders containing both books
+    recent   int64[recent]    counted orders among the last ``RESCAN_ORDERS`` ids
+
+Requests memory-map the file and answer with a binary search and a slice,
+without touching ``order_items``. ``update`` folds in the orders placed
+since the last run (``manage.py build_recommendations``); ``build``
+recounts everything. Order ids are allocated before their transaction
+commits, so an order may show up after higher ids were already counted:
+``update`` re-reads the last ``RECOMMENDATIONS_RESCAN_ORDERS`` ids and
+skips the orders listed in ``recent``. Counting is vectorized with NumPy when it is
+installed, and falls back to plain Python otherwise. A new file is written
+next to the old one and swapped in atomically, and readers pick it up on
+their next lookup.
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import groupby, permutations
+
+from django.conf import settings
+
+from .cache import invalidate_tags
+from .models import OrderItem
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+def default_path():
+    return getattr(settings, 'RECOMMENDATIONS_PATH', os.path.join(settings.BASE_DIR, 'recommendations', 'copurchase.bin'))
+
+
+MAGIC = b'BBCOP002'
+HEADER = struct.Struct('=8sqqqq')
+
+# Orders below the last counted id that may still be committing
+RESCAN_ORDERS = getattr(settings, 'RECOMMENDATIONS_RESCAN_ORDERS', 10000)
+
+
+class CoPurchaseMatrix:
+    """Read-only view of a matrix file; lookups take microseconds."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, rows, entries, self.last_order_id, recent = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a co-purchase matrix')
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        sections = []
+        for code, length in (('q', rows), ('q', rows + 1), ('q', entries), ('I', entries), ('q', recent)):
+            size = struct.calcsize(code) * length
+            sections.append(view[offset:offset + size].cast(code))
+            offset += size
+        self.books, self.indptr, self.indices, self.counts, self.recent = sections
+
+    def __len__(self):
+        return len(self.books)
+
+    def related(self, book_id, limit=10):
+        """``[(book_id, count), ...]`` most co-purchased with ``book_id`` first."""
+        row = bisect_left(self.books, book_id)
+        if row == len(self.books) or self.books[row] != book_id:
+            return []
+        start = self.indptr[row]
+        end = min(self.indptr[row + 1], start + limit)
+        return list(zip(self.indices[start:end].tolist(), self.counts[start:end].tolist()))
+
+    def triples(self):
+        """All entries as ``(books, related, counts)`` sequences."""
+        if np is not None:
+            return (
+                np.repeat(np.frombuffer(self.books, dtype=np.int64), np.diff(np.frombuffer(self.indptr, dtype=np.int64))),
+                np.frombuffer(self.indices, dtype=np.int64).copy(),
+                np.frombuffer(self.counts, dtype=np.uint32).astype(np.int64),
+            )
+        lengths = [self.indptr[row + 1] - self.indptr[row] for row in range(len(self.books))]
+        left = [book for book, length in zip(self.books, lengths) for _ in range(length)]
+        return left, self.indices.tolist(), self.counts.tolist()
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def get_matrix(path=None):
+    """The matrix at ``path``, reloaded when the file is replaced; ``None`` if missing."""
+    path = path or default_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    loaded = _loaded.get(path)
+    if loaded is None or loaded[0] != version:
+        with _lock:
+            loaded = _loaded.get(path)
+            if loaded is None or loaded[0] != version:
+                loaded = _loaded[path] = (version, CoPurchaseMatrix(path))
+    return loaded[1]
+
+
+def related(book_id, limit=10, path=None):
+    matrix = get_matrix(path)
+    return matrix.related(book_id, limit) if matrix is not None else []
+
+
+def count_pairs(order_ids, book_ids):
+    """
+    Co-purchase counts for order lines sorted by order, as ``(books,
+    related, counts)`` sequences with every pair of books in both directions.
+    """
+    if np is not None:
+        return _count_pairs_numpy(np.asarray(order_ids, dtype=np.int64), np.asarray(book_ids, dtype=np.int64))
+    pairs = Counter()
+    for _, lines in groupby(zip(order_ids, book_ids), key=lambda line: line[0]):
+        pairs.update(permutations((book_id for _, book_id in lines), 2))
+    return _unzip(pairs)
+
+
+def _count_pairs_numpy(order_ids, book_ids):
+    if not len(order_ids):
+        return _empty()
+    # Every line is paired with every line of its order: line i is repeated
+    # once per line of its order and matched against each of them in turn
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    line_sizes = np.repeat(sizes, sizes)
+    line_starts = np.repeat(starts, sizes)
+    left = np.repeat(book_ids, line_sizes)
+    within = np.arange(len(left)) - np.repeat(np.cumsum(line_sizes) - line_sizes, line_sizes)
+    right = book_ids[np.repeat(line_starts, line_sizes) + within]
+    keep = left != right
+    return _sum_pairs(left[keep], right[keep], np.ones(int(keep.sum()), dtype=np.int64))
+
+
+def _sum_pairs(left, right, counts):
+    if not len(left):
+        return _empty()
+    stride = int(max(left.max(), right.max())) + 1
+    keys, inverse = np.unique(left * stride + right, return_inverse=True)
+    return keys // stride, keys % stride, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def _empty():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+
+def _unzip(pairs):
+    items = sorted(pairs.items())
+    return [a for (a, _), _ in items], [b for (_, b), _ in items], [n for _, n in items]
+
+
+def merge(*triples):
+    """Add up several ``(books, related, counts)`` results."""
+    if np is not None:
+        return _sum_pairs(*(np.concatenate([np.asarray(part[i], dtype=np.int64) for part in triples]) for i in range(3)))
+    pairs = Counter()
+    for left, right, counts in triples:
+        for a, b, n in zip(left, right, counts):
+            pairs[a, b] += n
+    return _unzip(pairs)
+
+
+def write(path, triples, last_order_id, recent=()):
+    """Write ``triples`` as a matrix file, atomically replacing ``path``."""
+    left, right, counts = triples
+    if np is not None:
+        order = np.lexsort((right, -counts, left))
+        left, right, counts = left[order], right[order], counts[order]
+        books, lengths = np.unique(left, return_counts=True)
+        indptr = np.r_[0, np.cumsum(lengths)]
+        sections = [books.astype(np.int64), indptr.astype(np.int64), right.astype(np.int64), counts.astype(np.uint32)]
+        data = [section.tobytes() for section in sections]
+    else:
+        entries = sorted(zip(left, right, counts), key=lambda entry: (entry[0], -entry[2], entry[1]))
+        books, indptr = [], [0]
+        for book, group in groupby(entries, key=lambda entry: entry[0]):
+            books.append(book)
+            indptr.append(indptr[-1] + sum(1 for _ in group))
+        data = [
+            array('q', books).tobytes(), array('q', indptr).tobytes(),
+            array('q', [entry[1] for entry in entries]).tobytes(),
+            array('I', [entry[2] for entry in entries]).tobytes(),
+        ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(books), len(right), last_order_id, len(recent)))
+        for section in data:
+            f.write(section)
+        f.write(array('q', recent).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _order_lines(after_order_id=0, counted=()):
+    """Lines of the orders after ``after_order_id``, except the ``counted`` ones."""
+    lines = OrderItem.objects.filter(order_id__gt=after_order_id).order_by('order_id').values_list('order_id', 'book_id')
+    counted = set(counted)
+    order_ids, book_ids = array('q'), array('q')
+    for order_id, book_id in lines.iterator(chunk_size=10000):
+        if order_id in counted:
+            continue
+        order_ids.append(order_id)
+        book_ids.append(book_id)
+    return order_ids, book_ids
+
+
+def build(path=None):
+    """Recount the whole order history; returns the number of entries written."""
+    return _write(path or default_path(), None, *_order_lines())
+
+
+def update(path=None):
+    """
+    Fold orders placed since the last build into the matrix, building it
+    if missing. Returns the number of entries written, or 0 if no orders
+    were added.
+    """
+    path = path or default_path()
+    try:
+        matrix = get_matrix(path)
+    except ValueError:
+        # Written in an older format
+        matrix = None
+    if matrix is None:
+        return build(path)
+    order_ids, book_ids = _order_lines(max(0, matrix.last_order_id - RESCAN_ORDERS), matrix.recent)
+    if not order_ids:
+        return 0
+    return _write(path, matrix, order_ids, book_ids)
+
+
+def _write(path, matrix, order_ids, book_ids):
+    triples = count_pairs(order_ids, book_ids)
+    counted = order_ids[bisect_right(order_ids, max(0, order_ids[-1] - RESCAN_ORDERS)):] if order_ids else ()
+    if matrix is not None:
+        triples = merge(matrix.triples(), triples)
+        last_order_id = max(matrix.last_order_id, order_ids[-1])
+        counted = [*matrix.recent, *counted]
+    else:
+        last_order_id = order_ids[-1] if order_ids else 0
+    recent = sorted({order_id for order_id in counted if order_id > last_order_id - RESCAN_ORDERS})
+    write(path, triples, last_order_id, recent)
+    invalidate_tags('recommendations')
+    return len(triples[1])
@@ -0,0 +1,47 @@
+"""
+JSON renderer backed by orjson, with the stdlib ``json`` as fallback.
+
+Output matches DRF's ``JSONRenderer``: compact, UTF-8, U+2028/U+2029
+escaped. Types orjson has no native encoding for, such as ``Decimal``, lazy
+translations and querysets, go through DRF's ``JSONEncoder.default``, as do
+datetimes so that they keep DRF's millisecond precision and ``Z`` suffix.
+Pretty-printed output (``indent``) and non-default ``UNICODE_JSON`` /
+``COMPACT_JSON`` settings use DRF's implementation. Unlike it, NaN and
+infinite floats render as ``null`` instead of raising.
+
+Use it per view with ``renderer_classes`` or globally in
+``REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']``.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` serializing with orjson when it is installed."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits, deeply nested data, ...
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
@@ -0,0 +1,206 @@
+"""
+Book cover renditions.
+
+Uploaded covers are resized to a few fixed sizes in WebP and JPEG by a
+process pool, outside the request that uploaded them. Renditions are named
+after a hash of the source image, so identical uploads share files and the
+URLs can be cached forever. ``Book.image_renditions`` records the result::
+
+    {'source': 'books/cover.png',
+     'card': {'webp': 'books/renditions/ab/ab12...-card.webp',
+              'jpeg': 'books/renditions/ab/ab12...-card.jpg'}, ...}
+
+Until it is filled in, serializers keep pointing at the original image.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SIZES = getattr(settings, 'BOOK_IMAGE_RENDITION_SIZES', {
+    'thumbnail': (120, 180),
+    'card': (320, 480),
+    'detail': (800, 1200),
+})
+
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+WORKERS = getattr(settings, 'BOOK_IMAGE_RENDITION_WORKERS', 2)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+def rendition_name(digest, size, fmt):
+    return f'books/renditions/{digest[:2]}/{digest}-{size}.{FORMATS[fmt][1]}'
+
+
+def render(data):
+    """Resize image bytes to every size and format; runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    output = {}
+    with Image.open(io.BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        for size, box in SIZES.items():
+            image = source.copy()
+            image.thumbnail(box, Image.Resampling.LANCZOS)
+            for fmt, (pil_format, _, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                output[(size, fmt)] = buffer.getvalue()
+    return output
+
+
+def read_source(book):
+    with book.image.open('rb') as image:
+        return image.read()
+
+
+def store(book_id, source, digest, rendered):
+    """
+    Save rendered files and record them on the book if it still uses ``source``.
+
+    ``rendered`` maps ``(size, format)`` to bytes; files that already exist
+    under their content-hashed name are not written again. The book's cached
+    responses are invalidated, as ``update()`` sends no ``post_save``.
+    """
+    from .cache import invalidate_tags
+    from .models import Book
+    from .signals import book_tags
+
+    renditions = {'source': source}
+    for (size, fmt), content in rendered.items():
+        name = rendition_name(digest, size, fmt)
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(content))
+        renditions.setdefault(size, {})[fmt] = name
+    books = Book.objects.filter(pk=book_id, image=source)
+    if books.update(image_renditions=renditions, updated_at=timezone.now()):
+        invalidate_tags(*book_tags(books.only('id', 'seller_id', 'category_id').get()))
+    return renditions
+
+
+def existing_renditions(digest):
+    """Return already stored renditions for ``digest``, or ``None`` if incomplete."""
+    names = {(size, fmt): rendition_name(digest, size, fmt) for size in SIZES for fmt in FORMATS}
+    if all(default_storage.exists(name) for name in names.values()):
+        return names
+    return None
+
+
+def generate_many(books, pool, window):
+    """
+    Render covers for ``books`` in ``pool`` with at most ``window`` in flight.
+
+    Yields ``(book, error)`` once each book is stored; used by the backfill
+    command, while uploads go through ``schedule``.
+    """
+    pending = []
+
+    def finish(book, digest, future=None, rendered=None):
+        try:
+            store(book.pk, book.image.name, digest, future.result() if future else rendered)
+            return book, None
+        except Exception as exc:
+            return book, exc
+
+    for book in books:
+        try:
+            data = read_source(book)
+        except (OSError, ValueError) as exc:
+            yield book, exc
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        existing = existing_renditions(digest)
+        if existing is not None:
+            # Same image already rendered, e.g. for another book
+            yield finish(book, digest, rendered=dict.fromkeys(existing))
+            continue
+        pending.append((book, digest, pool.submit(render, data)))
+        if len(pending) >= window:
+            yield finish(*pending.pop(0))
+    for item in pending:
+        yield finish(*item)
+
+
+def schedule(book):
+    """Render ``book``'s cover in the background."""
+    try:
+        data = read_source(book)
+    except (OSError, ValueError):
+        logger.warning('Cannot read cover image for book %s', book.pk, exc_info=True)
+        return
+    digest = hashlib.sha256(data).hexdigest()
+    book_id, source = book.pk, book.image.name
+    existing = existing_renditions(digest)
+    if existing is not None:
+        store(book_id, source, digest, dict.fromkeys(existing))
+        return
+
+    def done(future):
+        try:
+            store(book_id, source, digest, future.result())
+        except Exception:
+            logger.exception('Rendering cover image for book %s failed', book_id)
+        finally:
+            # Runs on the pool's result thread, outside any request cycle
+            close_old_connections()
+
+    get_pool().submit(render, data).add_done_callback(done)
+
+
+def needs_renditions(book):
+    return bool(book.image) and book.image_renditions.get('source') != book.image.name
+
+
+def image_urls(book, request=None):
+    """
+    Per-size cover URLs for serializers: ``{size: {'src': ..., 'webp': ...}}``.
+
+    ``src`` is a JPEG rendition, or the original upload while renditions are
+    not ready yet.
+    """
+    return rendition_urls(book.image.name if book.image else None, book.image_renditions, request)
+
+
+def rendition_urls(image, renditions, request=None):
+    """``image_urls`` from a stored image name and ``image_renditions`` value."""
+    if not image:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request is not None else url
+
+    renditions = renditions or {}
+    if renditions.get('source') != image:
+        original = absolute(default_storage.url(image))
+        return {size: {'src': original} for size in SIZES}
+
+    return {
+        size: {
+            'src': absolute(default_storage.url(renditions[size]['jpeg'])),
+            'webp': absolute(default_storage.url(renditions[size]['webp'])),
+        }
+        for size in SIZES if size in renditions
+    }
@@ -0,0 +1,153 @@
+"""
+Refresh token revocation.
+
+Revoked token ids (JTIs) are stored in a small SQLite file shared by every
+worker process on the host, and mirrored in memory as Bloom filters, one
+series per expiry bucket of ``TOKEN_REVOCATION_BUCKET_SECONDS``. Checking
+a token costs a ``PRAGMA data_version`` (which tells whether another
+process wrote since the last check, in which case the new rows are
+pulled in) and a few bit tests; the file is only searched for the rare
+tokens the filter reports, to rule out false positives.
+
+A token needs to stay revoked only until it expires, so whole buckets are
+dropped from memory once their tokens have expired, and their rows are
+purged from the file. Each filter holds ``TOKEN_REVOCATION_FILTER_CAPACITY``
+ids; a bucket that outgrows it gets another filter, keeping the false
+positive rate, and memory at about two bytes per live revoked token.
+"""
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+
+BUCKET_SECONDS = getattr(settings, 'TOKEN_REVOCATION_BUCKET_SECONDS', 3600)
+FILTER_CAPACITY = getattr(settings, 'TOKEN_REVOCATION_FILTER_CAPACITY', 100_000)
+ERROR_RATE = 0.001
+
+
+def default_path():
+    return getattr(settings, 'TOKEN_REVOCATION_PATH', str(settings.BASE_DIR / 'token_revocation.sqlite3'))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    """Revoked JTIs: SQLite file as the source of truth, Bloom filters in front."""
+
+    def __init__(self, path, bucket_seconds=BUCKET_SECONDS, filter_capacity=FILTER_CAPACITY):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self.filter_capacity = filter_capacity
+        self._filters = {}
+        self._last_id = 0
+        self._purged_at = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS revoked ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, jti TEXT NOT NULL UNIQUE, bucket INTEGER NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS revoked_bucket ON revoked (bucket)')
+            self._local.connection = connection
+            self._local.data_version = None
+        return connection
+
+    def _add(self, jti, bucket):
+        filters = self._filters.setdefault(bucket, [])
+        if not filters or filters[-1].count >= self.filter_capacity:
+            filters.append(BloomFilter(self.filter_capacity))
+        filters[-1].add(jti)
+
+    def _sync(self, connection):
+        """Pull rows written since the last sync, by this or another process."""
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._local.data_version:
+            return
+        with self._lock:
+            rows = connection.execute(
+                'SELECT id, jti, bucket FROM revoked WHERE id > ? ORDER BY id', (self._last_id,)
+            ).fetchall()
+            for row_id, jti, bucket in rows:
+                self._add(jti, bucket)
+                self._last_id = row_id
+            expired = [bucket for bucket in self._filters if (bucket + 1) * self.bucket_seconds <= time.time()]
+            for bucket in expired:
+                del self._filters[bucket]
+        self._local.data_version = data_version
+
+    def revoke(self, jti, exp):
+        """Revoke token ``jti``, which expires at ``exp`` (a Unix timestamp)."""
+        bucket = int(exp) // self.bucket_seconds
+        connection = self._connection()
+        cursor = connection.execute('INSERT OR IGNORE INTO revoked (jti, bucket) VALUES (?, ?)', (jti, bucket))
+        with self._lock:
+            self._add(jti, bucket)
+            # Skip our own row on the next sync, unless rows of others come before it
+            if cursor.rowcount == 1 and cursor.lastrowid == self._last_id + 1:
+                self._last_id = cursor.lastrowid
+        if time.time() - self._purged_at > self.bucket_seconds:
+            self.purge()
+
+    def is_revoked(self, jti, exp):
+        if exp <= time.time():
+            # Expired tokens are refused anyway
+            return False
+        connection = self._connection()
+        self._sync(connection)
+        filters = self._filters.get(int(exp) // self.bucket_seconds, ())
+        if not any(jti in bloom for bloom in filters):
+            return False
+        return connection.execute('SELECT 1 FROM revoked WHERE jti = ?', (jti,)).fetchone() is not None
+
+    def purge(self):
+        """Delete rows whose tokens have all expired."""
+        self._purged_at = time.time()
+        current = int(time.time()) // self.bucket_seconds
+        self._connection().execute('DELETE FROM revoked WHERE bucket < ?', (current,))
+
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for filters in self._filters.values() for bloom in filters)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=None):
+    path = path or default_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = RevocationStore(path)
+        return _stores[path]
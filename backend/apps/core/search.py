@@ -0,0 +1,80 @@
+"""
+Full-text search for the book catalog.
+
+SQLite uses the ``books_fts`` FTS5 table and MySQL the ``books_fulltext``
+FULLTEXT index, both created by migration ``0002_book_fulltext`` and kept in
+sync with ``books`` by the database itself. Other backends fall back to
+DRF's ``icontains`` search.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+
+MAX_TERMS = 8
+
+FULLTEXT_MODE = 'fulltext'
+
+
+def search_terms(query):
+    """Split a query into word tokens usable by both full-text dialects."""
+    return re.findall(r'\w+', query)[:MAX_TERMS]
+
+
+def fulltext_search(queryset, query):
+    """
+    Restrict ``queryset`` to books matching every term of ``query`` as a
+    prefix, annotated with ``search_rank`` (higher is more relevant).
+
+    Returns ``None`` when the database has no full-text support.
+    """
+    terms = search_terms(query)
+    vendor = connections[queryset.db].vendor
+    if not terms:
+        return queryset.none()
+
+    if vendor == 'sqlite':
+        # Join the FTS table rather than ranking in a correlated subquery,
+        # which re-runs the MATCH for every row: quadratic on common terms.
+        # The join is aliased by its table name, which the MATCH refers to.
+        match = ' '.join('"%s"*' % term for term in terms)
+        return queryset.filter(search_index__isnull=False).filter(
+            RawSQL('"books_fts" MATCH %s', [match], output_field=BooleanField())
+        ).annotate(search_rank=-F('search_index__rank'))
+
+    if vendor == 'mysql':
+        match = ' '.join('+%s*' % term for term in terms)
+        against = 'MATCH (books.title, books.author, books.isbn) AGAINST (%s IN BOOLEAN MODE)'
+        return queryset.filter(
+            RawSQL(against, [match], output_field=BooleanField())
+        ).annotate(search_rank=RawSQL(against, [match], output_field=FloatField()))
+
+    return None
+
+
+class BookSearchFilter(filters.SearchFilter):
+    """
+    ``SearchFilter`` with an opt-in full-text mode.
+
+    ``?search=<terms>`` keeps the default ``icontains`` behaviour, while
+    ``?search=<terms>&search_mode=fulltext`` uses the full-text index with
+    prefix matching and, unless ``ordering`` is given, orders by relevance.
+    Place it after ``OrderingFilter`` so relevance ordering is not replaced.
+    """
+    search_mode_param = 'search_mode'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or request.query_params.get(self.search_mode_param) != FULLTEXT_MODE:
+            return super().filter_queryset(request, queryset, view)
+
+        results = fulltext_search(queryset, query)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        if api_settings.ORDERING_PARAM not in request.query_params:
+            results = results.order_by('-search_rank', '-id')
+        return results
@@ -1,5 +1,8 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from ..models import Book, Category
+from ..renditions import image_urls, rendition_urls
+from ..services import inventory
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -16,12 +19,13 @@ class BookSerializer(serializers.ModelSerializer):
     seller = serializers.StringRelatedField(read_only=True)
     seller_id = serializers.IntegerField(read_only=True)
     in_stock = serializers.BooleanField(read_only=True)
+    image_urls = serializers.SerializerMethodField()
     
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'isbn', 'description', 'price', 
                   'stock_quantity', 'category', 'category_id', 'seller', 'seller_id',
-                  'image', 'is_active', 'in_stock', 'created_at', 'updated_at']
+                  'image', 'image_urls', 'is_active', 'in_stock', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
         extra_kwargs = {
             'isbn': {'required': False, 'allow_blank': True},
@@ -45,14 +49,78 @@ class BookSerializer(serializers.ModelSerializer):
                 validated_data['category'] = category
             except Category.DoesNotExist:
                 validated_data['category'] = None
-        return super().update(instance, validated_data)
+        previous_stock = instance.stock_quantity
+        instance = super().update(instance, validated_data)
+        # Sending back an unchanged stock must not refill slots sold since
+        if instance.stock_quantity != previous_stock:
+            inventory.redistribute([instance.pk])
+            instance.available = instance.stock_quantity
+        return instance
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # The slot sum of hot books, not their total as of the last rebalance
+        data['stock_quantity'] = instance.available_stock
+        return data
+    
+    def get_image_urls(self, obj):
+        return image_urls(obj, self.context.get('request'))
+
+
+class BookRowListSerializer(serializers.ListSerializer):
+    """
+    List serializer with a fast path for ``values()`` rows.
+
+    Rows from ``BookListSerializer.rows`` are turned into dicts directly,
+    without a field-by-field ``to_representation`` per book; the output is
+    the same as ``BookListSerializer``'s for model instances, which still go
+    through the regular path.
+    """
+    
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        if not rows or not isinstance(rows[0], dict):
+            return super().to_representation(rows)
+        
+        request = self.context.get('request')
+        price = self.child.fields['price'].to_representation
+        url = default_storage.url
+        absolute = request.build_absolute_uri if request is not None else str
+        return [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'author': row['author'],
+                'price': price(row['price']),
+                'image': absolute(url(row['image'])) if row['image'] else None,
+                'image_urls': rendition_urls(row['image'], row['image_renditions'], request),
+                'category': row['category__name'],
+                'in_stock': row['available'] > 0,
+            }
+            for row in rows
+        ]
 
 
 class BookListSerializer(serializers.ModelSerializer):
     """Lightweight serializer for book listings."""
     category = serializers.StringRelatedField()
+    image_urls = serializers.SerializerMethodField()
+    
+    # Columns read by BookRowListSerializer, plus keyset pagination fields
+    row_fields = ('id', 'title', 'author', 'price', 'image', 'image_renditions',
+                  'category__name', 'available', 'created_at')
     
     class Meta:
         model = Book
-        fields = ['id', 'title', 'author', 'price', 'image', 'category', 'in_stock']
-
+        fields = ['id', 'title', 'author', 'price', 'image', 'image_urls', 'category', 'in_stock']
+        list_serializer_class = BookRowListSerializer
+    
+    @classmethod
+    def rows(cls, queryset):
+        """``queryset`` as the ``values()`` rows the fast list path expects."""
+        queryset = inventory.with_available_stock(queryset)
+        annotations = [name for name in ('search_rank',) if name in queryset.query.annotations]
+        return queryset.values(*cls.row_fields, *annotations)
+    
+    def get_image_urls(self, obj):
+        return image_urls(obj, self.context.get('request'))
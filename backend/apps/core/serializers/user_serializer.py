@@ -52,8 +52,13 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('password_confirm')
         password = validated_data.pop('password')
-        user = User.objects.create(**validated_data)
-        user.set_password(password)
+        # Hashed off the request worker by the register view
+        encoded_password = validated_data.pop('encoded_password', None)
+        user = User(**validated_data)
+        if encoded_password:
+            user.password = encoded_password
+        else:
+            user.set_password(password)
         user.save()
         return user
 
@@ -0,0 +1,7 @@
+# Domain services for Core API
+from .order_placement import OrderPlacementError, place_order
+
+__all__ = [
+    'OrderPlacementError',
+    'place_order',
+]
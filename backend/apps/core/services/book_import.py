@@ -0,0 +1,260 @@
+"""
+Streaming bulk import of book catalogs.
+
+Rows are read lazily from CSV or JSONL, validated in batches (optionally in
+worker processes) and upserted by ISBN with ``bulk_create`` in fixed-size
+chunks, so memory stays bounded by the chunk size rather than the file size.
+"""
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .. import events
+from ..cache import invalidate_tags
+from ..models import Book, Category
+from . import inventory
+
+
+FORMATS = ('csv', 'jsonl')
+
+UPSERT_FIELDS = [
+    'title', 'author', 'description', 'price', 'stock_quantity',
+    'category', 'is_active', 'updated_at',
+]
+
+MAX_PRICE = Decimal('99999999.99')
+
+
+class ImportFormatError(ValueError):
+    """Raised when the input cannot be read in the requested format."""
+
+
+def detect_format(filename, default='csv'):
+    """Guess the input format from a file name."""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` pairs from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ImportFormatError(f'Unsupported format: {fmt}')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _text(row, field, max_length, errors, required=True):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        errors[field] = 'This field is required.'
+    elif len(value) > max_length:
+        errors[field] = f'Ensure this field has no more than {max_length} characters.'
+    return value
+
+
+def validate_row(row, categories):
+    """
+    Clean one input row.
+
+    ``categories`` maps lower-cased category names to ids. Returns
+    ``(values, errors)``; ``values`` is ``None`` when the row is invalid.
+    """
+    if row is None:
+        return None, {'row': 'Malformed row.'}
+
+    errors = {}
+    values = {
+        'title': _text(row, 'title', 200, errors),
+        'author': _text(row, 'author', 100, errors),
+        'isbn': _text(row, 'isbn', 20, errors, required=False) or None,
+        'description': _text(row, 'description', 1 << 16, errors, required=False),
+    }
+
+    try:
+        price = Decimal(str(row.get('price', '')).strip()).quantize(Decimal('0.01'))
+        if not 0 <= price <= MAX_PRICE:
+            raise InvalidOperation
+        values['price'] = price
+    except (InvalidOperation, ValueError):
+        errors['price'] = 'A valid non-negative price is required.'
+
+    stock = row.get('stock_quantity')
+    try:
+        # int() would truncate 1.5 from JSON
+        if isinstance(stock, bool) or (isinstance(stock, float) and not stock.is_integer()):
+            raise ValueError
+        values['stock_quantity'] = int(stock) if stock not in (None, '') else 0
+        if values['stock_quantity'] < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        errors['stock_quantity'] = 'Ensure this value is a non-negative integer.'
+
+    category = str(row.get('category') or '').strip()
+    values['category_id'] = categories.get(category.lower()) if category else None
+    if category and values['category_id'] is None:
+        errors['category'] = f'Unknown category "{category}".'
+
+    active = str(row.get('is_active', 'true')).strip().lower()
+    values['is_active'] = active not in ('0', 'false', 'no')
+
+    return (None, errors) if errors else (values, None)
+
+
+def validate_batch(batch, categories):
+    """Validate ``[(line_number, row), ...]``; runs in worker processes."""
+    return [(line_number, *validate_row(row, categories)) for line_number, row in batch]
+
+
+def _validated(rows, categories, chunk_size, workers):
+    """Yield validated batches, parsing ahead in up to ``workers`` processes."""
+    batches = batched(rows, chunk_size)
+    if workers <= 1:
+        for batch in batches:
+            yield validate_batch(batch, categories)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch in batches:
+            pending.append(pool.submit(validate_batch, batch, categories))
+            # Keep a bounded window of batches in flight
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def import_books(stream, fmt, seller_id, chunk_size=1000, workers=1, max_errors=1000):
+    """
+    Upsert books for ``seller_id`` from ``stream``.
+
+    Rows with an ISBN already owned by another seller are rejected rather
+    than taken over. Returns a report with ``rows``, ``created``,
+    ``updated`` and up to ``max_errors`` per-row ``errors``.
+    """
+    categories = {name.lower(): pk for name, pk in Category.objects.values_list('name', 'id')}
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def reject(line_number, errors):
+        report['failed'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line_number, 'errors': errors})
+
+    for batch in _validated(read_rows(stream, fmt), categories, chunk_size, workers):
+        report['rows'] += len(batch)
+        valid = []
+        for line_number, values, errors in batch:
+            if errors:
+                reject(line_number, errors)
+            else:
+                valid.append((line_number, values))
+        if valid:
+            _write_chunk(valid, seller_id, report, reject)
+
+    return report
+
+
+class _IsbnTaken(Exception):
+    """Another seller inserted one of a chunk's new ISBNs while it was written."""
+
+
+def _write_chunk(valid, seller_id, report, reject):
+    # Later rows win when an ISBN repeats within a chunk
+    by_isbn, without_isbn = {}, []
+    for line_number, values in valid:
+        if values['isbn']:
+            by_isbn[values['isbn']] = (line_number, values)
+        else:
+            without_isbn.append(values)
+
+    # The upsert would update a book another seller inserted after the
+    # ownership check, so the chunk is then rolled back and written again,
+    # now seeing that book. Each retry sees at least one more owner.
+    for _ in range(len(by_isbn) + 1):
+        try:
+            with transaction.atomic():
+                rejected, updated_ids, created = _upsert(by_isbn, without_isbn, seller_id)
+            break
+        except _IsbnTaken:
+            continue
+    else:
+        raise _IsbnTaken()
+
+    for line_number in rejected:
+        reject(line_number, {'isbn': 'A book with this ISBN belongs to another seller.'})
+    report['updated'] += len(updated_ids)
+    report['created'] += created
+
+    # bulk_create sends no post_save, so invalidate cached catalog pages here
+    tags = {'catalog', f'seller:{seller_id}'}
+    tags.update(f'book:{pk}' for pk in updated_ids)
+    tags.update(f'category:{values["category_id"]}' for _, values in valid if values['category_id'])
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+    transaction.on_commit(lambda: events.stock_changed(updated_ids))
+
+
+def _upsert(by_isbn, without_isbn, seller_id):
+    """Write one chunk; returns rejected line numbers, updated ids and the created count."""
+    # Locked, so the owner checked here is the one updated below
+    existing = {
+        isbn: (pk, owner, stock)
+        for isbn, pk, owner, stock in Book.objects.select_for_update().filter(isbn__in=by_isbn).values_list(
+            'isbn', 'id', 'seller_id', 'stock_quantity'
+        )
+    }
+    now = timezone.now()
+    upserts, rejected, updated_ids, restocked_ids = [], [], [], []
+    for isbn, (line_number, values) in by_isbn.items():
+        if isbn in existing:
+            pk, owner, stock = existing[isbn]
+            if owner != seller_id:
+                rejected.append(line_number)
+                continue
+            updated_ids.append(pk)
+            if values['stock_quantity'] != stock:
+                restocked_ids.append(pk)
+        upserts.append(Book(seller_id=seller_id, updated_at=now, **values))
+
+    # MySQL upserts on whichever unique key conflicts and rejects a target
+    unique_fields = ['isbn'] if connection.features.supports_update_conflicts_with_target else None
+    if upserts:
+        Book.objects.bulk_create(
+            upserts, update_conflicts=True, unique_fields=unique_fields, update_fields=UPSERT_FIELDS,
+        )
+        new_isbns = [isbn for isbn in by_isbn if isbn not in existing]
+        if new_isbns and Book.objects.filter(isbn__in=new_isbns).exclude(seller_id=seller_id).exists():
+            raise _IsbnTaken()
+    if without_isbn:
+        Book.objects.bulk_create([Book(seller_id=seller_id, **values) for values in without_isbn])
+    if restocked_ids:
+        inventory.redistribute(restocked_ids)
+
+    return rejected, updated_ids, len(upserts) - len(updated_ids) + len(without_isbn)
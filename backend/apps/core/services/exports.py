@@ -0,0 +1,175 @@
+"""
+Streaming catalog and order exports.
+
+Rows are pulled as ``values()`` dicts in primary-key ordered chunks and
+encoded as they arrive, so memory stays flat however many rows there are.
+Chunks are fetched by seeking on the key rather than ``QuerySet.iterator()``
+because mysqlclient buffers a whole result set on the client. Exports read
+from a replica when one is configured, unless the user has just written.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+from bookbridge.routers import reporting_database
+
+from ..models import Book, OrderItem
+
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+# Spreadsheets run CSV cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Encoded output is sent in pieces of about this many characters
+FLUSH_SIZE = 64 * 1024
+
+# Export column -> lookup path; the first column is the chunking key
+BOOK_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'author': 'author',
+    'isbn': 'isbn',
+    'price': 'price',
+    'stock_quantity': 'stock_quantity',
+    'category_name': 'category__name',
+    'seller_id': 'seller_id',
+    'is_active': 'is_active',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+ORDER_COLUMNS = {
+    'line_id': 'id',
+    'order_id': 'order_id',
+    'order_status': 'order__status',
+    'ordered_at': 'order__created_at',
+    'customer': 'order__customer__username',
+    'shipping_address': 'order__shipping_address',
+    'book_id': 'book_id',
+    'title': 'book__title',
+    'isbn': 'book__isbn',
+    'quantity': 'quantity',
+    'price': 'price',
+    'subtotal': 'subtotal',
+}
+
+
+def _values(queryset, columns):
+    """``values()`` with lookups renamed to their export column names."""
+    fields = [column for column, path in columns.items() if column == path]
+    aliases = {column: F(path) for column, path in columns.items() if column != path}
+    return queryset.values(*fields, **aliases)
+
+
+def book_rows(queryset):
+    """Flat book rows for ``queryset``."""
+    return _values(queryset, BOOK_COLUMNS)
+
+
+def order_rows(user):
+    """One row per order line visible to ``user``, oldest line first."""
+    items = OrderItem.objects.all()
+    if user.is_customer:
+        items = items.filter(order__customer_id=user.id)
+    elif user.is_seller:
+        items = items.filter(book__seller_id=user.id)
+    elif not user.is_admin:
+        items = items.none()
+    return _values(items, ORDER_COLUMNS)
+
+
+def iterate(rows, columns, chunk_size=CHUNK_SIZE):
+    """Yield ``rows`` in chunks, seeking past the last key of each chunk."""
+    column, path = next(iter(columns.items()))
+    rows = rows.order_by(path)
+    last = None
+    while True:
+        chunk = rows if last is None else rows.filter(**{f'{path}__gt': last})
+        chunk = list(chunk[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][column]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def _csv_cell(value):
+    """``value`` with a leading ``'`` if a spreadsheet would take it for a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def encode_rows(rows, fmt, columns, chunk_size=CHUNK_SIZE):
+    """Yield the encoded export in pieces of roughly ``FLUSH_SIZE``."""
+    rows = iterate(rows, columns, chunk_size)
+    buffer = io.StringIO()
+
+    if fmt == 'ndjson':
+        dumps = json.JSONEncoder(default=_json_default, separators=(',', ':')).encode
+
+        def write(row):
+            buffer.write(dumps(row))
+            buffer.write('\n')
+    else:
+        writer = csv.writer(buffer)
+        writer.writerow(list(columns))
+        # Send the header straight away so the client sees the first byte
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        def write(row):
+            writer.writerow([_csv_cell(row[column]) for column in columns])
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_books(queryset, fmt, chunk_size=CHUNK_SIZE, user_id=None):
+    rows = book_rows(queryset).using(reporting_database(user_id))
+    return encode_rows(rows, fmt, BOOK_COLUMNS, chunk_size)
+
+
+def export_orders(user, fmt, chunk_size=CHUNK_SIZE):
+    rows = order_rows(user).using(reporting_database(user.id))
+    return encode_rows(rows, fmt, ORDER_COLUMNS, chunk_size)
+
+
+def streaming_response(chunks, fmt, name):
+    """Wrap encoded export chunks in a downloadable streaming response."""
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
+
+
+def seller_catalog(user):
+    """Books a user may export: a seller's whole catalog, else the active one."""
+    if user.is_seller:
+        return Book.objects.filter(seller_id=user.id)
+    return Book.objects.filter(is_active=True)
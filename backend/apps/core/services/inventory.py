@@ -0,0 +1,173 @@
+"""
+Slotted stock for hot books.
+
+Every checkout of a book updates its ``books`` row, so during a launch all
+checkouts of a bestseller queue on one row lock. A book made hot with
+``enable`` has its stock split across ``StockSlot`` rows instead: a
+reservation decrements one slot picked at random, trying the others when it
+runs short, so concurrent checkouts mostly lock different rows and never
+touch the book row at all.
+
+For hot books the slots are authoritative. ``Book.stock_quantity`` holds
+their total as of the last ``rebalance``, which evens the slots out and is
+meant to run periodically (``manage.py hot_stock rebalance --interval``);
+``Book.available_stock`` sums the slots exactly, and the catalog shows and
+filters on that sum (``with_available_stock``).
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..cache import invalidate_tags
+from ..models import Book, StockSlot
+
+
+SLOTS = getattr(settings, 'HOT_STOCK_SLOTS', 8)
+
+
+def slot_count():
+    """Subquery annotation with the number of stock slots of a book (0 if cold)."""
+    return Coalesce(Subquery(
+        StockSlot.objects.filter(book_id=OuterRef('pk')).order_by()
+        .values('book_id').annotate(count=Count('*')).values('count')
+    ), 0)
+
+
+def available_stock():
+    """Annotation with the exact stock of a book, as ``Book.available_stock``."""
+    # A plain SUM rather than an aggregate, so no GROUP BY ends up in list queries
+    return Coalesce(Subquery(
+        StockSlot.objects.filter(book_id=OuterRef('pk')).order_by()
+        .annotate(total=Func('quantity', function='SUM')).values('total')[:1]
+    ), F('stock_quantity'))
+
+
+def with_available_stock(queryset):
+    """``queryset`` with ``available_stock()`` annotated as ``available``."""
+    if 'available' in queryset.query.annotations:
+        return queryset
+    return queryset.annotate(available=available_stock())
+
+
+def split(total, slots):
+    """Spread ``total`` units as evenly as possible over ``slots`` slots."""
+    base, extra = divmod(total, slots)
+    return [base + (slot < extra) for slot in range(slots)]
+
+
+def _refresh_books(totals):
+    """Write slot totals back to ``Book.stock_quantity``; one update per book."""
+    now = timezone.now()
+    for book_id, total in totals.items():
+        Book.objects.filter(pk=book_id).update(stock_quantity=total, updated_at=now)
+    tags = [f'book:{book_id}' for book_id in totals]
+    if not all(totals.values()):
+        tags.append('stock')
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def enable(book_id, slots=SLOTS):
+    """Make ``book_id`` hot, moving its stock into ``slots`` slots."""
+    with transaction.atomic():
+        book = Book.objects.select_for_update().only('stock_quantity').get(pk=book_id)
+        # Already hot books are re-split over the new number of slots
+        total = book.available_stock
+        book.stock_slots.all().delete()
+        StockSlot.objects.bulk_create([
+            StockSlot(book_id=book_id, slot=slot, quantity=quantity)
+            for slot, quantity in enumerate(split(total, slots))
+        ])
+        _refresh_books({book_id: total})
+
+
+def disable(book_id):
+    """Make ``book_id`` cold again, folding its slots back into the book row."""
+    with transaction.atomic():
+        slots = list(StockSlot.objects.select_for_update().filter(book_id=book_id))
+        if not slots:
+            return
+        StockSlot.objects.filter(book_id=book_id).delete()
+        _refresh_books({book_id: sum(slot.quantity for slot in slots)})
+
+
+def rebalance(book_ids=None):
+    """
+    Even out the slots of hot books and refresh their ``stock_quantity``.
+
+    Returns ``{book_id: total}``. Each book is rebalanced in its own short
+    transaction so checkouts of other books are not held up.
+    """
+    if book_ids is None:
+        book_ids = StockSlot.objects.values_list('book_id', flat=True).distinct()
+    totals = {}
+    for book_id in list(book_ids):
+        with transaction.atomic():
+            slots = list(StockSlot.objects.select_for_update().filter(book_id=book_id).order_by('slot'))
+            if not slots:
+                continue
+            total = sum(slot.quantity for slot in slots)
+            _redistribute(slots, total)
+            _refresh_books({book_id: total})
+        totals[book_id] = total
+    return totals
+
+
+def redistribute(book_ids):
+    """
+    Bring the slots of the hot books among ``book_ids`` to the
+    ``stock_quantity`` a book update or a bulk import just changed. Books
+    whose slots already hold that total are left alone.
+    """
+    with transaction.atomic():
+        slots = list(StockSlot.objects.select_for_update().filter(book_id__in=book_ids).order_by('book_id', 'slot'))
+        if not slots:
+            return
+        totals = dict(Book.objects.filter(pk__in={slot.book_id for slot in slots}).values_list('id', 'stock_quantity'))
+        by_book = {}
+        for slot in slots:
+            by_book.setdefault(slot.book_id, []).append(slot)
+        for book_id, book_slots in by_book.items():
+            # Units sold meanwhile are already gone from the locked slots
+            if sum(slot.quantity for slot in book_slots) != totals[book_id]:
+                _redistribute(book_slots, totals[book_id])
+
+
+def _redistribute(slots, total):
+    for slot, quantity in zip(slots, split(total, len(slots))):
+        slot.quantity = quantity
+    StockSlot.objects.bulk_update(slots, ['quantity'])
+
+
+def reserve(book_id, quantity, slots):
+    """
+    Take ``quantity`` units of hot book ``book_id`` (which has ``slots``
+    slots) from its stock slots. Must run inside a transaction.
+
+    Tries each slot, starting from a random one, with a conditional
+    ``UPDATE``. If no single slot holds enough, the slots are locked and
+    drained in order. Returns whether the units were reserved.
+    """
+    start = random.randrange(slots)
+    for offset in range(slots):
+        taken = StockSlot.objects.filter(
+            book_id=book_id, slot=(start + offset) % slots, quantity__gte=quantity,
+        ).update(quantity=F('quantity') - quantity)
+        if taken:
+            return True
+
+    locked = list(StockSlot.objects.select_for_update().filter(book_id=book_id, quantity__gt=0).order_by('slot'))
+    if sum(slot.quantity for slot in locked) < quantity:
+        return False
+    remaining = quantity
+    for slot in locked:
+        take = min(slot.quantity, remaining)
+        slot.quantity -= take
+        remaining -= take
+        if not remaining:
+            break
+    StockSlot.objects.bulk_update(locked, ['quantity'])
+    return True
@@ -0,0 +1,128 @@
+"""
+Queued order intake for flash sales.
+
+Placed synchronously, every checkout is its own transaction, so under a
+burst the database's commit rate caps checkouts per second. With
+``ORDER_INTAKE_QUEUE`` on, ``POST /orders/`` only validates the cart and
+stores it as an ``OrderIntake`` row (a single small insert), answering
+``202 Accepted`` with a handle the client polls.
+
+Workers (``manage.py process_order_intake``) drain the queue in batches and
+place each batch of orders in one transaction, so one commit covers many
+checkouts. Each order runs in its own savepoint: one that fails (out of
+stock, unknown book) is rolled back and recorded on its intake without
+affecting the rest of the batch. Database errors are retried on later
+batches, up to ``ORDER_INTAKE_MAX_ATTEMPTS`` times per intake. Several workers can run side by side on
+MySQL, where claimed intakes are skipped with ``SKIP LOCKED``.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from ..models import OrderIntake
+from .order_placement import OrderPlacementError, place_order
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'ORDER_INTAKE_BATCH_SIZE', 200)
+# Database errors tolerated per intake before it is marked failed
+MAX_ATTEMPTS = getattr(settings, 'ORDER_INTAKE_MAX_ATTEMPTS', 3)
+
+
+def enabled():
+    return getattr(settings, 'ORDER_INTAKE_QUEUE', False)
+
+
+def enqueue(customer_id, shipping_address, items):
+    """Queue a validated cart for ``customer_id``; returns the ``OrderIntake``."""
+    return OrderIntake.objects.create(
+        customer_id=customer_id,
+        shipping_address=shipping_address,
+        items=[{'book_id': item['book_id'], 'quantity': item['quantity']} for item in items],
+    )
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """
+    Place up to ``batch_size`` queued orders in a single transaction.
+
+    Returns ``(placed, failed)`` counts; ``(0, 0)`` means nothing was
+    processed. If the batch transaction itself fails, its orders are retried
+    one transaction each, so a bad intake cannot hold up the others.
+    """
+    try:
+        return _process(_queued()[:batch_size])
+    except DatabaseError:
+        logger.warning('Order intake batch failed, placing its orders one by one', exc_info=True)
+
+    placed = failed = 0
+    intake_ids = OrderIntake.objects.filter(status='queued').order_by('id').values_list('id', flat=True)
+    for intake_id in list(intake_ids[:batch_size]):
+        try:
+            intake_placed, intake_failed = _process(_queued().filter(pk=intake_id))
+        except DatabaseError as exc:
+            intake_placed, intake_failed = 0, _record_error(intake_id, exc)
+        placed += intake_placed
+        failed += intake_failed
+    return placed, failed
+
+
+def _queued():
+    queued = OrderIntake.objects.filter(status='queued').order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        queued = queued.select_for_update(skip_locked=True)
+    return queued
+
+
+def _process(queued):
+    placed = failed = 0
+    with transaction.atomic():
+        intakes = list(queued)
+        now = timezone.now()
+        for intake in intakes:
+            try:
+                # place_order's atomic block is a savepoint in here
+                order, _ = place_order(intake.customer_id, intake.shipping_address, intake.items)
+            except OrderPlacementError as exc:
+                intake.status, intake.error, intake.error_status = 'failed', exc.message, exc.status_code
+                failed += 1
+            except DatabaseError as exc:
+                logger.warning('Order intake #%d failed', intake.pk, exc_info=True)
+                failed += _retry_later(intake, exc)
+                continue
+            else:
+                intake.status, intake.order = 'placed', order
+                placed += 1
+            intake.attempts += 1
+            intake.processed_at = now
+        OrderIntake.objects.bulk_update(
+            intakes, ['status', 'order', 'error', 'error_status', 'attempts', 'processed_at'],
+        )
+    if intakes:
+        logger.info('Order intake batch: %d placed, %d failed', placed, failed)
+    return placed, failed
+
+
+def _retry_later(intake, exc):
+    """Count a failed attempt on ``intake``, giving up after ``MAX_ATTEMPTS``; returns 1 if it did."""
+    intake.attempts += 1
+    intake.error = str(exc)
+    if intake.attempts < MAX_ATTEMPTS:
+        return 0
+    intake.status, intake.error_status, intake.processed_at = 'failed', 500, timezone.now()
+    return 1
+
+
+def _record_error(intake_id, exc):
+    """``_retry_later`` for an intake whose own transaction failed."""
+    logger.warning('Order intake #%d failed', intake_id, exc_info=True)
+    with transaction.atomic():
+        intake = OrderIntake.objects.select_for_update().filter(pk=intake_id, status='queued').first()
+        if intake is None:
+            return 0
+        failed = _retry_later(intake, exc)
+        intake.save(update_fields=['status', 'error', 'error_status', 'attempts', 'processed_at'])
+    return failed
@@ -0,0 +1,138 @@
+"""
+Set-based order placement.
+
+An order is placed with a constant number of queries regardless of how many
+lines the cart has: one read of the requested books, one conditional stock
+update, one insert for the order and one bulk insert for its items, all
+inside a single transaction. Hot books keep their stock in slots instead
+and are reserved slot by slot, see ``inventory``.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+from rest_framework import status
+
+from .. import events, typeahead
+from ..cache import invalidate_tags
+from ..models import Book, Order, OrderItem
+from . import inventory
+
+
+class OrderPlacementError(Exception):
+    """Raised when an order cannot be placed; carries the HTTP status to report."""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def merge_lines(items):
+    """Collapse cart lines into an ordered ``{book_id: quantity}`` mapping."""
+    quantities = {}
+    for item in items:
+        book_id = item['book_id']
+        quantities[book_id] = quantities.get(book_id, 0) + item['quantity']
+    return quantities
+
+
+def place_order(customer_id, shipping_address, items):
+    """
+    Place an order for ``customer_id`` and reserve stock for every line.
+
+    ``items`` is a list of ``{'book_id': ..., 'quantity': ...}`` dicts as
+    validated by ``OrderCreateSerializer``. Stock is decremented with a single
+    conditional ``UPDATE`` so that two concurrent checkouts can never take the
+    same units: if any row no longer has enough stock the whole transaction is
+    rolled back and ``OrderPlacementError`` is raised.
+    """
+    quantities = merge_lines(items)
+
+    with transaction.atomic():
+        books = Book.objects.filter(id__in=quantities, is_active=True).only(
+            'id', 'title', 'author', 'price', 'stock_quantity'
+        ).annotate(stock_slot_count=inventory.slot_count()).in_bulk()
+
+        for book_id, quantity in quantities.items():
+            book = books.get(book_id)
+            if book is None:
+                raise OrderPlacementError(
+                    f'Book with id {book_id} not found',
+                    status_code=status.HTTP_404_NOT_FOUND,
+                )
+            # stock_quantity of hot books is only a periodic total
+            if not book.stock_slot_count and book.stock_quantity < quantity:
+                raise OrderPlacementError(f'Insufficient stock for {book.title}')
+
+        cold = {book_id: quantity for book_id, quantity in quantities.items()
+                if not books[book_id].stock_slot_count}
+        if cold:
+            # The conditional update takes the row locks and re-checks stock
+            # atomically, so stale reads above can never lead to overselling.
+            reserved = Book.objects.filter(
+                reduce(or_, (
+                    Q(id=book_id, stock_quantity__gte=quantity)
+                    for book_id, quantity in cold.items()
+                )),
+                is_active=True,
+            ).update(
+                stock_quantity=Case(
+                    *(When(id=book_id, then=F('stock_quantity') - quantity)
+                      for book_id, quantity in cold.items()),
+                    output_field=IntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            if reserved != len(cold):
+                raise OrderPlacementError(_describe_shortage(cold, books))
+
+        # In id order, so concurrent carts lock slots in the same order
+        for book_id, quantity in sorted(quantities.items()):
+            book = books[book_id]
+            if book.stock_slot_count and not inventory.reserve(book_id, quantity, book.stock_slot_count):
+                raise OrderPlacementError(f'Insufficient stock for {book.title}')
+
+        total = sum(books[book_id].price * quantity for book_id, quantity in quantities.items())
+        order = Order.objects.create(
+            customer_id=customer_id,
+            shipping_address=shipping_address,
+            status='pending',
+            total_amount=total,
+        )
+        # bulk_create skips OrderItem.save(), so subtotals are set here and
+        # the order total is written once above instead of once per line.
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                book=books[book_id],
+                quantity=quantity,
+                price=books[book_id].price,
+                subtotal=books[book_id].price * quantity,
+            )
+            for book_id, quantity in quantities.items()
+        ])
+        # Stock changed through update(), which sends no post_save. Books
+        # that sold out also leave in_stock lists and the stock facet.
+        sold_out = inventory.with_available_stock(
+            Book.objects.filter(id__in=quantities)
+        ).filter(available__lte=0).exists()
+        tags = [f'book:{book_id}' for book_id in quantities] + (['stock'] if sold_out else [])
+        transaction.on_commit(lambda: invalidate_tags(*tags))
+        transaction.on_commit(lambda: typeahead.index.record_sales(quantities))
+        transaction.on_commit(lambda: events.stock_changed(quantities))
+
+    return order, order_items
+
+
+def _describe_shortage(quantities, books):
+    """Build the error message for lines that lost a race for stock."""
+    current = dict(
+        Book.objects.filter(id__in=quantities).values_list('id', 'stock_quantity')
+    )
+    for book_id, quantity in quantities.items():
+        if current.get(book_id, 0) < quantity:
+            return f'Insufficient stock for {books[book_id].title}'
+    return 'Insufficient stock'
@@ -0,0 +1,68 @@
+"""
+Signal handlers for Core API models.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, events, renditions, typeahead
+from .cache import invalidate_tags
+from .models import Book, Category, User
+
+
+def book_tags(book):
+    """Cache tags affected by a change to ``book``."""
+    tags = {f'book:{book.pk}', f'seller:{book.seller_id}', 'catalog'}
+    if book.category_id:
+        tags.add(f'category:{book.category_id}')
+    return tags
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    invalidate_tags(*book_tags(instance))
+
+
+@receiver(post_save, sender=Book)
+def render_cover(sender, instance, **kwargs):
+    if renditions.needs_renditions(instance):
+        transaction.on_commit(lambda: renditions.schedule(instance))
+
+
+@receiver(post_save, sender=Book)
+def reindex_book(sender, instance, **kwargs):
+    if typeahead.index.ready:
+        transaction.on_commit(lambda: typeahead.index.update_book(instance))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    if typeahead.index.ready:
+        book_id = instance.pk
+        transaction.on_commit(lambda: typeahead.index.remove_book(book_id))
+
+
+@receiver([post_save, post_delete], sender=Book)
+def publish_stock(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: events.stock_changed([book_id]))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate_tags(f'category:{instance.pk}', 'categories')
+
+
+@receiver(post_save, sender=User)
+def remember_user(sender, instance, **kwargs):
+    # Dropped now so lookups fall back to the database, and replaced once
+    # the save is committed
+    authentication.clear_user(instance.pk)
+    transaction.on_commit(lambda: authentication.remember_user(instance))
+
+
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    authentication.clear_user(user_id)
+    transaction.on_commit(lambda: authentication.forget_user(user_id))
@@ -1,3 +1,1401 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import io
+import json
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from bookbridge import routers
+from bookbridge.compression import CODECS, compression_stats, negotiate
+from bookbridge.instrumentation import route_stats
+
+from . import authentication, benchmarks, events, passwords, recommendations, renditions, revocation, typeahead
+from .authentication import ClaimsRefreshToken
+from .models import User, Category, Book, Order, OrderIntake, OrderItem, StockSlot
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .serializers import BookListSerializer
+from .services import OrderPlacementError, inventory, order_intake, place_order
+from .viewsets.async_viewsets import event_messages
+
+
+def make_catalog(books=3, stock=10):
+    """Create a seller, a customer and ``books`` active books."""
+    seller = User.objects.create_user(username='seller', password='pass', role='seller')
+    customer = User.objects.create_user(username='customer', password='pass', role='customer')
+    category = Category.objects.create(name='Fiction')
+    catalog = [
+        Book.objects.create(
+            title=f'Book {i}', author='Author', description='...',
+            price=Decimal('10.00') + i, stock_quantity=stock,
+            category=category, seller=seller,
+        )
+        for i in range(books)
+    ]
+    return seller, customer, catalog
+
+
+class OrderPlacementTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog()
+
+    def test_places_order_and_reserves_stock(self):
+        order, items = place_order(self.customer.id, 'Somewhere', [
+            {'book_id': self.books[0].id, 'quantity': 2},
+            {'book_id': self.books[1].id, 'quantity': 1},
+        ])
+        self.assertEqual(order.total_amount, Decimal('31.00'))
+        self.assertEqual(sorted(i.subtotal for i in items), [Decimal('11.00'), Decimal('20.00')])
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].stock_quantity, 8)
+
+    def test_duplicate_lines_are_merged(self):
+        order, items = place_order(self.customer.id, 'Somewhere', [
+            {'book_id': self.books[0].id, 'quantity': 2},
+            {'book_id': self.books[0].id, 'quantity': 3},
+        ])
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].quantity, 5)
+
+    def test_insufficient_stock_rolls_back(self):
+        with self.assertRaises(OrderPlacementError):
+            place_order(self.customer.id, 'Somewhere', [
+                {'book_id': self.books[0].id, 'quantity': 1},
+                {'book_id': self.books[1].id, 'quantity': 11},
+            ])
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].stock_quantity, 10)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_book_is_not_found(self):
+        with self.assertRaises(OrderPlacementError) as ctx:
+            place_order(self.customer.id, 'Somewhere', [{'book_id': 9999, 'quantity': 1}])
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_query_count_is_independent_of_cart_size(self):
+        seller, customer, books = self.seller, self.customer, self.books
+        more = [
+            Book.objects.create(
+                title=f'Extra {i}', author='Author', description='...',
+                price=Decimal('5.00'), stock_quantity=5, seller=seller,
+            )
+            for i in range(10)
+        ]
+        with CaptureQueriesContext(connection) as small:
+            place_order(customer.id, 'Somewhere', [{'book_id': books[0].id, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as large:
+            place_order(customer.id, 'Somewhere', [
+                {'book_id': book.id, 'quantity': 1} for book in books + more
+            ])
+        self.assertEqual(len(small), len(large))
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Asserts that endpoints stay within a fixed number of queries.
+
+    Budgets are stated per route name in ``query_budgets`` and must hold
+    whatever the size of the page being rendered.
+    """
+    query_budgets = {}
+
+    def assertWithinBudget(self, route, method='get', *args, **kwargs):
+        budget = self.query_budgets[route]
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(*args, **kwargs)
+        self.assertLessEqual(
+            len(ctx), budget,
+            f'{route} ran {len(ctx)} queries, budget is {budget}:\n'
+            + '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+        return response
+
+
+class OrderQueryBudgetTests(QueryBudgetTestCase):
+    query_budgets = {
+        'order-list': 3,    # validators + count, orders + customers, items + books
+        'order-detail': 3,  # validators, order + customer, items + books
+        'order-create': 9,  # placement (5 + savepoint) and the detail read
+    }
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=5, stock=100)
+        self.other_seller = User.objects.create_user(username='other', password='pass', role='seller')
+        self.other_book = Book.objects.create(
+            title='Other', author='Author', description='...', price=Decimal('1.00'),
+            stock_quantity=100, seller=self.other_seller,
+        )
+        for _ in range(20):
+            place_order(self.customer.id, 'Somewhere', [
+                {'book_id': book.id, 'quantity': 1} for book in self.books + [self.other_book]
+            ])
+        self.client = APIClient()
+
+    def test_customer_list(self):
+        self.client.force_authenticate(self.customer)
+        response = self.assertWithinBudget('order-list', 'get', reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(response.data['results'][0]['items']), 6)
+
+    def test_seller_list_only_has_own_items(self):
+        self.client.force_authenticate(self.other_seller)
+        response = self.assertWithinBudget('order-list', 'get', reverse('order-list'))
+        self.assertEqual(response.data['count'], 20)
+        self.assertEqual(
+            {item['book_id'] for order in response.data['results'] for item in order['items']},
+            {self.other_book.id},
+        )
+
+    def test_detail(self):
+        self.client.force_authenticate(self.customer)
+        order = Order.objects.filter(customer=self.customer).first()
+        response = self.assertWithinBudget('order-detail', 'get', reverse('order-detail', args=[order.pk]))
+        self.assertEqual(len(response.data['items']), 6)
+
+    def test_create(self):
+        self.client.force_authenticate(self.customer)
+        response = self.assertWithinBudget('order-create', 'post', reverse('order-list'), {
+            'shipping_address': 'Somewhere',
+            'items': [{'book_id': book.id, 'quantity': 1} for book in self.books],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), 5)
+        self.assertEqual(OrderItem.objects.filter(order_id=response.data['id']).count(), 5)
+
+
+class FullTextSearchTests(TestCase):
+
+    def setUp(self):
+        self.seller, _, _ = make_catalog(books=0)
+        for title, author in [
+            ('The Hobbit', 'J. R. R. Tolkien'),
+            ('The Silmarillion', 'J. R. R. Tolkien'),
+            ('Dune', 'Frank Herbert'),
+        ]:
+            Book.objects.create(
+                title=title, author=author, description='...', price=Decimal('9.99'),
+                stock_quantity=1, seller=self.seller,
+            )
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get(reverse('book-list'), {'search': query, 'search_mode': 'fulltext'})
+        return [book['title'] for book in response.data['results']]
+
+    def test_prefix_match_on_every_term(self):
+        self.assertEqual(sorted(self.search('tolk')), ['The Hobbit', 'The Silmarillion'])
+        self.assertEqual(self.search('tolk hob'), ['The Hobbit'])
+
+    def test_index_follows_updates(self):
+        Book.objects.filter(title='Dune').update(title='Dune Messiah')
+        self.assertEqual(self.search('messiah'), ['Dune Messiah'])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.seller, _, _ = make_catalog(books=0)
+        for i in range(7):
+            # Repeated prices exercise the id tie-breaker
+            Book.objects.create(
+                title=f'Book {i}', author='Author', description='...',
+                price=Decimal(i // 3), stock_quantity=1, seller=self.seller,
+            )
+        self.client = APIClient()
+
+    def walk(self, **params):
+        response = self.client.get(reverse('book-list'), {'page_size': 3, **params})
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        return pages
+
+    def test_walks_every_row_once_in_order(self):
+        for ordering in ['-created_at', 'price', '-price', 'title']:
+            pages = self.walk(ordering=ordering)
+            ids = [book['id'] for page in pages for book in page['results']]
+            expected = Book.objects.order_by(ordering, ordering.replace(ordering.lstrip('-'), 'id'))
+            self.assertEqual(ids, list(expected.values_list('id', flat=True)), ordering)
+
+    def test_previous_link_returns_prior_page(self):
+        pages = self.walk(ordering='price')
+        back = self.client.get(pages[2]['previous'])
+        self.assertEqual(back.data['results'], pages[1]['results'])
+
+    def test_malformed_cursor_values_are_not_found(self):
+        url = reverse('book-list')
+        cases = [
+            ({'a': 1}, '-created_at'), ([1, 2], '-created_at'), ('not-a-date', '-created_at'),
+            (None, '-created_at'), (True, '-created_at'), ('x', 'price'), ('NaN', 'price'), ([], 'title'),
+        ]
+        for value, ordering in cases:
+            token = base64.urlsafe_b64encode(json.dumps({'v': value, 'id': 1}).encode()).decode()
+            response = self.client.get(url, {'ordering': ordering, 'cursor': token})
+            self.assertEqual(response.status_code, 404, (value, ordering))
+            self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+    def test_count_is_opt_out(self):
+        self.assertEqual(self.walk()[0]['count'], 7)
+        self.assertNotIn('count', self.walk(count='false')[0])
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=2)
+        self.client = APIClient()
+
+    def test_list_is_cached_until_a_book_changes(self):
+        url = reverse('book-list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        Book.objects.create(
+            title='New', author='Author', description='...', price=Decimal('1.00'),
+            seller=self.seller,
+        )
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 3)
+
+    def test_detail_is_invalidated_by_order_placement(self):
+        url = reverse('book-detail', args=[self.books[0].pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.customer.id, 'Somewhere', [{'book_id': self.books[0].pk, 'quantity': 4}])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock_quantity'], 6)
+
+    def test_other_category_lists_stay_cached(self):
+        other = Category.objects.create(name='Poetry')
+        url = reverse('book-list')
+        self.client.get(url, {'category': other.pk})
+        self.books[0].title = 'Renamed'
+        self.books[0].save()
+        self.assertEqual(self.client.get(url, {'category': other.pk})['X-Cache'], 'HIT')
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=2)
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.books[0].id, 'quantity': 1}])
+        self.client = APIClient()
+
+    def test_order_list_not_modified_before_serialization(self):
+        self.client.force_authenticate(self.customer)
+        url = reverse('order-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.books[1].id, 'quantity': 1}])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_order_validators_follow_rendered_books_and_customer(self):
+        self.client.force_authenticate(self.customer)
+        order = Order.objects.get()
+        for url in (reverse('order-list'), reverse('order-detail', args=[order.pk])):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.books[0].title = f'{self.books[0].title} (2nd edition)'
+            self.books[0].save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+            etag = response['ETag']
+            self.customer.username = f'{self.customer.username}-renamed'
+            self.customer.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_book_detail_validators(self):
+        url = reverse('book-detail', args=[self.books[1].pk])
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.books[1].price = Decimal('99.00')
+        self.books[1].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_book_list_without_count_validates_the_page_only(self):
+        url = reverse('book-list')
+        params = {'count': 'false', 'page_size': 1}
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(url, params)['ETag']
+        self.assertFalse(any('COUNT(' in query['sql'] or 'MAX(' in query['sql'] for query in queries))
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Validators do not depend on the process: a fresh cache gives the same ETag
+        cache.clear()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        category = self.books[0].category
+        category.name = 'Novels'
+        category.save()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BookImportTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=1)
+        self.books[0].isbn = '111'
+        self.books[0].save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('book-import'), {
+            'file': SimpleUploadedFile(name, content.encode()),
+        }, format='multipart')
+
+    def test_csv_upsert_by_isbn_with_row_errors(self):
+        response = self.upload('catalog.csv', (
+            'title,author,isbn,price,stock_quantity,category\n'
+            'Updated,Author,111,12.50,3,fiction\n'
+            'Fresh,Author,222,5,1,\n'
+            'Broken,Author,333,-1,1,Fiction\n'
+            'Lost,Author,444,5,1,Nope\n'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'updated', 'failed')},
+            {'rows': 4, 'created': 1, 'updated': 1, 'failed': 2},
+        )
+        self.assertEqual([e['line'] for e in response.data['errors']], [4, 5])
+        self.books[0].refresh_from_db()
+        self.assertEqual((self.books[0].title, self.books[0].stock_quantity), ('Updated', 3))
+        self.assertEqual(Book.objects.get(isbn='222').seller, self.seller)
+
+    def test_jsonl_cannot_take_over_other_sellers_isbn(self):
+        other = User.objects.create_user(username='other', password='pass', role='seller')
+        self.client.force_authenticate(other)
+        response = self.upload('catalog.jsonl', '{"title": "Mine", "author": "A", "isbn": "111", "price": 1}\n')
+        self.assertEqual(response.data['failed'], 1)
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].seller, self.seller)
+
+    def test_isbn_inserted_by_another_seller_during_import_is_not_taken_over(self):
+        other = User.objects.create_user(username='other', password='pass', role='seller')
+        Book.objects.create(title='Theirs', author='A', price=Decimal('1.00'), isbn='999', seller=other)
+        select_for_update = Book.objects.select_for_update
+        # The first ownership check runs before the other seller's insert
+        with mock.patch.object(Book.objects, 'select_for_update', side_effect=[Book.objects.none(), select_for_update()]):
+            response = self.upload('catalog.csv', 'title,author,isbn,price\nMine,Author,999,5\nNew,Author,555,5\n')
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+        self.assertEqual(Book.objects.get(isbn='999').title, 'Theirs')
+
+    def test_fractional_stock_is_rejected(self):
+        response = self.upload('catalog.jsonl', '{"title": "Half", "author": "A", "price": 1, "stock_quantity": 1.5}\n')
+        self.assertEqual(response.data['errors'][0]['errors'], {'stock_quantity': 'Ensure this value is a non-negative integer.'})
+        self.assertFalse(Book.objects.filter(title='Half').exists())
+
+    def test_upsert_without_conflict_target_on_mysql(self):
+        with (
+            mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False),
+            mock.patch.object(Book.objects, 'bulk_create') as bulk_create,
+        ):
+            response = self.upload('catalog.csv', 'title,author,isbn,price\nUpdated,Author,111,12.50\n')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+        self.assertIsNone(bulk_create.call_args.kwargs['unique_fields'])
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=3)
+        place_order(self.customer.id, 'Somewhere', [{'book_id': book.id, 'quantity': 1} for book in self.books])
+        self.client = APIClient()
+
+    def test_seller_catalog_csv(self):
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(reverse('book-export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('id,title,author'))
+
+    def test_csv_cells_are_not_formulas(self):
+        Book.objects.filter(pk=self.books[0].pk).update(title='=HYPERLINK("http://evil")', author='-2+3')
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(reverse('book-export'))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        row = next(row for row in rows if row['id'] == str(self.books[0].pk))
+        self.assertEqual((row['title'], row['author']), ('\'=HYPERLINK("http://evil")', "'-2+3"))
+        self.assertEqual(row['price'], '10.00')
+
+    def test_customer_orders_ndjson(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(reverse('order-export'), {'export_format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(row['book_id'] for row in rows), sorted(book.id for book in self.books))
+        self.assertEqual(rows[0]['customer'], 'customer')
+
+
+class RenditionTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller, _, self.books = make_catalog(books=1)
+
+    def test_renditions_replace_original_once_ready(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 1800), 'teal').save(buffer, 'PNG')
+        book = self.books[0]
+        book.image = SimpleUploadedFile('cover.png', buffer.getvalue())
+        book.save()
+
+        url = reverse('book-detail', args=[book.pk])
+        urls = self.client.get(url).data['image_urls']
+        self.assertTrue(urls['card']['src'].endswith('cover.png'))
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            [(_, error)] = list(renditions.generate_many([book], pool, window=1))
+        self.assertIsNone(error)
+        book.refresh_from_db()
+        with default_storage.open(book.image_renditions['card']['jpeg']) as card:
+            self.assertLessEqual(max(Image.open(card).size), 480)
+
+        # The cached detail is invalidated when the renditions are recorded
+        urls = self.client.get(url).data['image_urls']
+        self.assertTrue(urls['card']['webp'].endswith('-card.webp'))
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def test_server_timing_and_route_stats(self):
+        make_catalog(books=2)
+        before = route_stats.snapshot().get('book-list', {}).get('requests', 0)
+        response = self.client.get(reverse('book-list'))
+        timing = response['Server-Timing']
+        self.assertIn('desc="', timing)
+        self.assertIn('serializer;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertEqual(route_stats.snapshot()['book-list']['requests'], before + 1)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_scale(self):
+        call_command(
+            'seed_scale', customers=5, sellers=2, categories=3, books=40, orders=20,
+            batch_size=16, stdout=io.StringIO(),
+        )
+        self.assertEqual(User.objects.filter(role='seller').count(), 2)
+        self.assertEqual(Book.objects.count(), 40)
+        self.assertEqual(Order.objects.count(), 20)
+        order = Order.objects.prefetch_related('items').first()
+        self.assertEqual(order.total_amount, sum(item.subtotal for item in order.items.all()))
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 21))
+        self.assertEqual(benchmarks.percentile(values, 0.5), 10)
+        self.assertEqual(benchmarks.percentile(values, 0.95), 19)
+        self.assertEqual(benchmarks.percentile(values[:4], 0.75), 3)
+        self.assertEqual(benchmarks.percentile(values, 1), 20)
+        self.assertIsNone(benchmarks.percentile([], 0.5))
+
+    def test_bench_api_report_and_compare(self):
+        make_catalog(books=5, stock=100)
+        report = benchmarks.run(requests=4, warmup=1, host='testserver', cold_cache=True)
+        self.assertEqual(set(report['scenarios']), set(benchmarks.SCENARIOS))
+        for result in report['scenarios'].values():
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
+
+        slower = json.loads(json.dumps(report))
+        slower['scenarios']['book-detail']['p95_ms'] *= 2
+        _, regressions = benchmarks.compare(report, slower)
+        self.assertEqual(regressions, ['book-detail'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Reads inside a transaction stay on the primary, so TestCase's
+    # per-test transaction would hide the routing under test
+
+    def setUp(self):
+        routers.health.mark('replica', True)
+        self.addCleanup(routers.health.mark, 'replica', True)
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_use_replica_only_when_enabled(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Book), 'replica')
+            self.assertEqual(self.router.db_for_write(Book), 'default')
+            with transaction.atomic():
+                self.assertIsNone(self.router.db_for_read(Book))
+            routers.health.mark('replica', False)
+            self.assertIsNone(self.router.db_for_read(Book))
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica_2'])
+    def test_one_replica_serves_a_whole_request(self):
+        routers.health.mark('replica_2', True)
+        for _ in range(5):
+            with routers.replica_reads():
+                chosen = {self.router.db_for_read(Book) for _ in range(20)}
+            self.assertEqual(len(chosen), 1)
+            self.assertIn(chosen.pop(), ['replica', 'replica_2'])
+
+    def test_write_pins_user_to_primary(self):
+        _, customer, books = make_catalog(books=1)
+        self.assertEqual(routers.reporting_database(customer.pk), 'replica')
+        client = APIClient()
+        client.force_authenticate(customer)
+        response = client.post(reverse('order-list'), {
+            'shipping_address': '1 Main St',
+            'items': [{'book_id': books[0].id, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(routers.is_pinned(customer.pk))
+        self.assertEqual(routers.reporting_database(customer.pk), 'default')
+
+
+class BookListFastPathTests(TestCase):
+
+    def test_rows_render_like_instances(self):
+        seller, _, books = make_catalog(books=3)
+        Book.objects.filter(pk=books[0].pk).update(category=None, stock_quantity=0, image='books/cover.png')
+        request = APIClient().get(reverse('book-list')).wsgi_request
+        context = {'request': request}
+
+        queryset = Book.objects.order_by('id')
+        fast = BookListSerializer(BookListSerializer.rows(queryset), many=True, context=context).data
+        slow = BookListSerializer(list(queryset), many=True, context=context).data
+        self.assertEqual(json.loads(json.dumps(fast)), json.loads(json.dumps(slow)))
+        self.assertIsNone(fast[0]['category'])
+        self.assertTrue(fast[0]['image'].endswith('/media/books/cover.png'))
+
+    def test_list_queries(self):
+        make_catalog(books=5)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book-list'))
+        self.assertEqual(response.data['results'][0]['category'], 'Fiction')
+
+
+class FastJSONTests(TestCase):
+
+    def test_renders_like_drf(self):
+        _, customer, books = make_catalog(books=2)
+        place_order(customer.id, '1 Main St', [{'book_id': books[0].id, 'quantity': 2}])
+        payloads = benchmarks.json_payloads()
+        payloads['raw'] = {
+            'price': Decimal('12.50'), 'at': Order.objects.get().created_at,
+            'text': 'line\u2028separator \u00e9', 1: None,
+        }
+        for data in payloads.values():
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(indented, b'{\n  "a": 1\n}')
+
+    def test_parses_like_drf(self):
+        body = b'{"items": [{"book_id": 1, "quantity": 2}], "price": 1.5, "name": "\xc3\xa9"}'
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"price": NaN}'))
+
+
+class CompressionTests(TestCase):
+
+    def test_cacheable_bodies_are_compressed_once(self):
+        make_catalog(books=30)
+        url = reverse('book-list')
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', first['Vary'])
+        self.assertTrue(first['ETag'].startswith('W/'))
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+
+        hits = compression_stats.snapshot()['gzip']['cache_hits']
+        second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(compression_stats.snapshot()['gzip']['cache_hits'], hits + 1)
+
+    def test_small_and_streaming_responses_are_not_compressed(self):
+        seller, _, _ = make_catalog(books=30)
+        small = self.client.get(reverse('health-check-direct'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        client = APIClient()
+        client.force_authenticate(seller)
+        export = client.get(reverse('book-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(export.streaming)
+        self.assertFalse(export.has_header('Content-Encoding'))
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate('*'), next(iter(CODECS)))
+        self.assertIsNone(negotiate('gzip;q=0, identity'))
+
+
+class HotStockTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(stock=10)
+        self.hot = self.books[0]
+        inventory.enable(self.hot.id, slots=4)
+
+    def slots(self):
+        return list(StockSlot.objects.filter(book=self.hot).order_by('slot').values_list('quantity', flat=True))
+
+    def test_enable_splits_stock(self):
+        self.assertEqual(self.slots(), [3, 3, 2, 2])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock_quantity, 10)
+        self.assertEqual(self.hot.available_stock, 10)
+
+    def test_order_reserves_from_slots_without_touching_book_row(self):
+        self.hot.refresh_from_db()
+        updated_at = self.hot.updated_at
+        place_order(self.customer.id, 'Somewhere', [
+            {'book_id': self.hot.id, 'quantity': 2},
+            {'book_id': self.books[1].id, 'quantity': 1},
+        ])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.updated_at, updated_at)
+        self.assertEqual(sum(self.slots()), 8)
+        self.assertEqual(self.hot.available_stock, 8)
+        response = APIClient().get(reverse('book-detail', args=[self.hot.id]))
+        self.assertEqual(response.data['stock_quantity'], 8)
+        self.books[1].refresh_from_db()
+        self.assertEqual(self.books[1].stock_quantity, 9)
+
+    def test_large_orders_drain_several_slots(self):
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.hot.id, 'quantity': 9}])
+        self.assertEqual(sum(self.slots()), 1)
+        with self.assertRaises(OrderPlacementError):
+            place_order(self.customer.id, 'Somewhere', [{'book_id': self.hot.id, 'quantity': 2}])
+        self.assertEqual(sum(self.slots()), 1)
+
+    def test_rebalance_and_disable(self):
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.hot.id, 'quantity': 3}])
+        self.assertEqual(inventory.rebalance(), {self.hot.id: 7})
+        self.assertEqual(self.slots(), [2, 2, 2, 1])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock_quantity, 7)
+
+        inventory.disable(self.hot.id)
+        self.assertEqual(self.slots(), [])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock_quantity, 7)
+
+    def test_seller_updates_are_spread_over_slots(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.patch(reverse('book-detail', args=[self.hot.id]), {'stock_quantity': 20}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slots(), [5, 5, 5, 5])
+
+    def test_sold_out_hot_book_is_listed_out_of_stock(self):
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.hot.id, 'quantity': 10}])
+        client = APIClient()
+        url = reverse('book-list')
+        books = {book['id']: book for book in client.get(url).data['results']}
+        self.assertFalse(books[self.hot.id]['in_stock'])
+        self.assertFalse(client.get(reverse('book-detail', args=[self.hot.id])).data['in_stock'])
+        in_stock = {book['id'] for book in client.get(url, {'in_stock': 'true'}).data['results']}
+        self.assertNotIn(self.hot.id, in_stock)
+        facets = client.get(url, {'facets': 'true'}).data['facets']
+        self.assertEqual(facets['stock']['out_of_stock'], 1)
+
+    def test_unchanged_update_keeps_sold_units_sold(self):
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.hot.id, 'quantity': 2}])
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        url = reverse('book-detail', args=[self.hot.id])
+        book = client.get(url).data
+        payload = {field: book[field] for field in ['title', 'author', 'isbn', 'description', 'price', 'stock_quantity']}
+        response = client.put(url, payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(self.slots()), 8)
+
+
+@override_settings(ORDER_INTAKE_QUEUE=True)
+class OrderIntakeTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def checkout(self, book, quantity):
+        return self.client.post(reverse('order-list'), {
+            'shipping_address': 'Somewhere',
+            'items': [{'book_id': book.id, 'quantity': quantity}],
+        }, format='json')
+
+    def test_checkout_is_queued_then_placed(self):
+        response = self.checkout(self.books[0], 2)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'queued')
+
+        self.assertEqual(order_intake.process_batch(), (1, 0))
+        poll = self.client.get(response.data['status_url'])
+        self.assertEqual(poll.data['status'], 'placed')
+        self.assertEqual(poll.data['order']['total_amount'], '20.00')
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].stock_quantity, 8)
+        self.assertEqual(order_intake.process_batch(), (0, 0))
+
+    def test_failed_orders_do_not_affect_their_batch(self):
+        first = self.checkout(self.books[0], 6).data['status_url']
+        second = self.checkout(self.books[0], 6).data['status_url']
+        third = self.checkout(self.books[1], 1).data['status_url']
+
+        self.assertEqual(order_intake.process_batch(), (2, 1))
+        self.assertEqual([self.client.get(url).data['status'] for url in (first, second, third)],
+                         ['placed', 'failed', 'placed'])
+        self.assertEqual(self.client.get(second).data['error_status'], 400)
+        self.assertEqual(Order.objects.count(), 2)
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].stock_quantity, 4)
+
+    def test_database_errors_are_retried_then_fail_the_intake(self):
+        poisoned = self.checkout(self.books[0], 1).data['status_url']
+        fine = self.checkout(self.books[1], 1).data['status_url']
+
+        def place(customer_id, shipping_address, items):
+            if items[0]['book_id'] == self.books[0].id:
+                raise DatabaseError('deadlock')
+            return place_order(customer_id, shipping_address, items)
+
+        with (
+            mock.patch.object(order_intake, 'place_order', side_effect=place),
+            self.assertLogs('apps.core.services.order_intake', 'WARNING'),
+        ):
+            self.assertEqual(order_intake.process_batch(), (1, 0))
+            self.assertEqual(self.client.get(poisoned).data['status'], 'queued')
+            self.assertEqual(order_intake.process_batch(), (0, 0))
+            self.assertEqual(order_intake.process_batch(), (0, 1))
+        self.assertEqual(self.client.get(fine).data['status'], 'placed')
+        poll = self.client.get(poisoned).data
+        self.assertEqual((poll['status'], poll['error_status']), ('failed', 500))
+        self.assertEqual(OrderIntake.objects.get(status='failed').error, 'deadlock')
+
+    def test_failed_batch_is_retried_one_order_at_a_time(self):
+        urls = [self.checkout(book, 1).data['status_url'] for book in self.books[:2]]
+        bulk_update = OrderIntake.objects.bulk_update
+        failures = [DatabaseError('connection lost')]
+
+        def flaky_bulk_update(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return bulk_update(*args, **kwargs)
+
+        with (
+            mock.patch.object(OrderIntake.objects, 'bulk_update', side_effect=flaky_bulk_update),
+            self.assertLogs('apps.core.services.order_intake', 'WARNING') as logs,
+        ):
+            self.assertEqual(order_intake.process_batch(), (2, 0))
+        self.assertIn('one by one', logs.output[0])
+        self.assertEqual([self.client.get(url).data['status'] for url in urls], ['placed', 'placed'])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_intakes_are_private(self):
+        url = self.checkout(self.books[0], 1).data['status_url']
+        other = User.objects.create_user(username='other', password='pass', role='customer')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        call_command('process_order_intake', '--once', stdout=io.StringIO())
+        self.assertFalse(OrderIntake.objects.filter(status='queued').exists())
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        override = override_settings(RECOMMENDATIONS_PATH=f'{self.dir.name}/copurchase.bin')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller, self.customer, self.books = make_catalog(books=4)
+
+    def buy(self, *books):
+        place_order(self.customer.id, 'Somewhere', [{'book_id': book.id, 'quantity': 1} for book in books])
+
+    def test_counts_and_incremental_updates(self):
+        a, b, c, d = self.books
+        self.buy(a, b)
+        self.buy(a, b, c)
+        self.assertEqual(recommendations.update(), 6)
+        self.assertEqual(recommendations.related(a.id), [(b.id, 2), (c.id, 1)])
+        self.assertEqual(recommendations.related(c.id, limit=1), [(a.id, 1)])
+        self.assertEqual(recommendations.related(d.id), [])
+        self.assertEqual(recommendations.update(), 0)
+
+        self.buy(a, c)
+        self.buy(a, c, d)
+        self.assertEqual(recommendations.update(), 10)
+        self.assertEqual(recommendations.related(a.id), [(c.id, 3), (b.id, 2), (d.id, 1)])
+        built = recommendations.get_matrix()
+        recommendations.build()
+        rebuilt = recommendations.get_matrix()
+        self.assertIsNot(rebuilt, built)
+        self.assertEqual([rebuilt.related(book.id) for book in self.books],
+                         [built.related(book.id) for book in self.books])
+
+    def test_orders_committed_late_are_counted_once(self):
+        a, b, c, _ = self.books
+        late, _ = place_order(self.customer.id, 'Somewhere', [
+            {'book_id': a.id, 'quantity': 1}, {'book_id': b.id, 'quantity': 1},
+        ])
+        # Not committed yet when the next update runs
+        lines = list(late.items.all())
+        late.items.all().delete()
+        self.buy(a, c)
+        self.assertEqual(recommendations.update(), 2)
+
+        OrderItem.objects.bulk_create(lines)
+        self.assertEqual(recommendations.update(), 4)
+        self.assertEqual(recommendations.related(a.id), [(b.id, 1), (c.id, 1)])
+        self.assertEqual(recommendations.update(), 0)
+
+    def test_related_action(self):
+        a, b, c, _ = self.books
+        url = reverse('book-related', args=[a.id])
+        self.assertEqual(self.client.get(url).data['results'], [])
+
+        self.buy(a, b)
+        self.buy(a, b, c)
+        call_command('build_recommendations', stdout=io.StringIO())
+        response = self.client.get(url)
+        self.assertEqual([(book['id'], book['co_purchases']) for book in response.data['results']],
+                         [(b.id, 2), (c.id, 1)])
+
+        b.is_active = False
+        b.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 5})
+        self.assertEqual([book['id'] for book in response.data['results']], [c.id])
+
+        self.assertEqual(self.client.get(reverse('book-related', args=[b.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('book-related', args=[9999])).status_code, 404)
+
+    @unittest.skipUnless(recommendations.np, 'numpy is not installed')
+    def test_numpy_counts_match_pure_python(self):
+        order_ids = [1, 1, 1, 2, 2, 3, 4, 4, 4, 4]
+        book_ids = [5, 7, 9, 5, 7, 9, 2, 5, 7, 9]
+        counted = recommendations.count_pairs(order_ids, book_ids)
+        with mock.patch.object(recommendations, 'np', None):
+            expected = recommendations.count_pairs(order_ids, book_ids)
+        self.assertEqual([list(map(int, part)) for part in counted], list(expected))
+
+
+class TypeaheadTests(TestCase):
+
+    def setUp(self):
+        self.seller, self.customer, self.books = make_catalog(books=3)
+        Book.objects.filter(pk=self.books[0].pk).update(title='Harry Potter', author='J. K. Rowling', isbn='978-0-7475-3269-9')
+        Book.objects.filter(pk=self.books[1].pk).update(title='Harvest Moon', author='Émile Zola')
+        place_order(self.customer.id, 'Somewhere', [{'book_id': self.books[1].id, 'quantity': 3}])
+        typeahead.index.build()
+
+    def suggest(self, query):
+        return [book['id'] for book in typeahead.index.suggest(query)]
+
+    def test_prefixes_are_ranked_by_sales(self):
+        harry, harvest, _ = self.books
+        self.assertEqual(self.suggest('Har'), [harvest.id, harry.id])
+        self.assertEqual(self.suggest('harry p'), [harry.id])
+        self.assertEqual(self.suggest('pot'), [harry.id])
+        self.assertEqual(self.suggest('emile'), [harvest.id])
+        self.assertEqual(self.suggest('97807475'), [harry.id])
+        self.assertEqual(self.suggest('xyz'), [])
+
+    def test_signals_and_orders_update_the_index(self):
+        harry, harvest, other = self.books
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.customer.id, 'Somewhere', [{'book_id': harry.id, 'quantity': 5}])
+        self.assertEqual(self.suggest('har'), [harry.id, harvest.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            harry.title = 'Hogwarts Express'
+            harry.save()
+            other.title = 'Harbour Lights'
+            other.save()
+            harvest.delete()
+        self.assertEqual(self.suggest('har'), [other.id])
+        self.assertEqual(self.suggest('hogw'), [harry.id])
+
+    def test_endpoint_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('book-suggest'), {'q': 'harv'})
+        self.assertEqual(response.data['results'], [
+            {'id': self.books[1].id, 'title': 'Harvest Moon', 'author': 'Émile Zola'},
+        ])
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        self.seller, _, self.books = make_catalog(books=3)
+        poetry = Category.objects.create(name='Poetry')
+        Book.objects.create(
+            title='Odes', author='Author', description='...', price=Decimal('55.00'),
+            stock_quantity=0, category=poetry, seller=self.seller,
+        )
+
+    def test_facets_are_counted_in_one_query_and_cached(self):
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'facets': 'true', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['facets'], {
+            'category': [
+                {'id': self.books[0].category_id, 'name': 'Fiction', 'count': 3},
+                {'id': Category.objects.get(name='Poetry').id, 'name': 'Poetry', 'count': 1},
+            ],
+            'price': [
+                {'min_price': 10, 'max_price': 20, 'count': 3},
+                {'min_price': 50, 'max_price': 100, 'count': 1},
+            ],
+            'stock': {'in_stock': 3, 'out_of_stock': 1},
+        })
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in queries), 1)
+
+        # Another page and ordering of the same filters reuse the counts
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'facets': 'true', 'ordering': 'price'})
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in queries), 0)
+
+        self.books[0].stock_quantity = 0
+        self.books[0].save()
+        response = self.client.get(url, {'facets': 'true', 'ordering': 'price'})
+        self.assertEqual(response.data['facets']['stock'], {'in_stock': 2, 'out_of_stock': 2})
+
+    def test_facets_follow_filters(self):
+        response = self.client.get(reverse('book-list'), {'facets': 'true', 'in_stock': 'true', 'max_price': '12'})
+        self.assertEqual([book['id'] for book in response.data['results']], [self.books[1].id, self.books[0].id])
+        self.assertEqual(response.data['facets']['stock'], {'in_stock': 2, 'out_of_stock': 0})
+        self.assertNotIn('facets', self.client.get(reverse('book-list')).data)
+
+    def test_facets_of_fulltext_search(self):
+        response = self.client.get(reverse('book-list'), {'facets': 'true', 'search': 'odes', 'search_mode': 'fulltext'})
+        self.assertEqual(response.data['facets']['category'][0]['name'], 'Poetry')
+        self.assertEqual(response.data['facets']['stock'], {'in_stock': 0, 'out_of_stock': 1})
+
+    def test_checkout_selling_out_refreshes_stock_facet_and_lists(self):
+        cache.clear()
+        url = reverse('book-list')
+        customer = User.objects.get(username='customer')
+        self.client.get(url, {'facets': 'true'})
+        self.client.get(url, {'in_stock': 'false'})
+        self.assertEqual(self.client.get(url, {'in_stock': 'false'})['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(customer.id, 'Somewhere', [{'book_id': self.books[0].id, 'quantity': 10}])
+
+        response = self.client.get(url, {'facets': 'true'})
+        self.assertEqual(response.data['facets']['stock'], {'in_stock': 2, 'out_of_stock': 2})
+        response = self.client.get(url, {'in_stock': 'false'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(self.books[0].id, [book['id'] for book in response.data['results']])
+
+
+class ClaimsAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller, self.customer, self.books = make_catalog()
+
+    def login(self, username='customer'):
+        response = self.client.post(reverse('login'), {'username': username, 'password': 'pass'}, content_type='application/json')
+        return {'HTTP_AUTHORIZATION': f'Bearer {response.json()["tokens"]["access"]}'}
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if 'FROM "users"' in query['sql']]
+
+    def test_requests_do_not_read_the_user(self):
+        auth = self.login()
+        self.client.get(reverse('order-list'), **auth)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order-list'), **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_queries(queries), [])
+
+        seller = self.login('seller')
+        response = self.client.patch(reverse('book-detail', args=[self.books[0].id]), {'price': '12.00'},
+                                     content_type='application/json', **seller)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('current-user'), **seller).data['username'], 'seller')
+
+    def test_revoked_tokens_are_refused(self):
+        auth = self.login()
+        self.customer.revoke_tokens()
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 401)
+
+        auth = self.login()
+        self.customer.role = 'seller'
+        self.customer.save()
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 401)
+
+        auth = self.login()
+        self.customer.set_password('other')
+        self.customer.save()
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 401)
+
+        auth = self.login('seller')
+        self.seller.is_active = False
+        self.seller.save()
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 401)
+
+    def test_role_change_by_another_worker_takes_effect(self):
+        auth = self.login()
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 200)
+        # Saved elsewhere: this process's cached state is stale until it expires
+        User.objects.filter(pk=self.customer.pk).update(role='seller')
+        self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 200)
+        later = time.time() + authentication.STATE_CACHE_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: later)):
+            self.assertEqual(self.client.get(reverse('order-list'), **auth).status_code, 401)
+        self.assertLessEqual(authentication.STATE_CACHE_SECONDS, 10)
+
+    def test_tokens_without_claims_still_work(self):
+        token = RefreshToken.for_user(self.customer).access_token
+        response = self.client.get(reverse('current-user'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.data['username'], 'customer')
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = f'{self.dir.name}/revoked.sqlite3'
+        override = override_settings(TOKEN_REVOCATION_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller, self.customer, _ = make_catalog(books=0)
+
+    def test_bloom_filter(self):
+        bloom = revocation.BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        self.assertLess(sum(f'other-{i}' in bloom for i in range(10000)), 100)
+
+    def test_revocations_are_shared_and_expire(self):
+        now = time.time()
+        worker, other_worker = revocation.RevocationStore(self.path), revocation.RevocationStore(self.path)
+        self.assertFalse(other_worker.is_revoked('a', now + 60))
+        worker.revoke('a', now + 60)
+        worker.revoke('b', now - 7200)
+        self.assertTrue(worker.is_revoked('a', now + 60))
+        self.assertTrue(other_worker.is_revoked('a', now + 60))
+        self.assertFalse(other_worker.is_revoked('c', now + 60))
+        # The writer's own rows are not pulled in again
+        self.assertEqual(worker._last_id, 2)
+        self.assertEqual([bloom.count for bloom in worker._filters[int(now + 60) // worker.bucket_seconds]], [1])
+
+        worker.purge()
+        rows = worker._connection().execute('SELECT jti FROM revoked').fetchall()
+        self.assertEqual(rows, [('a',)])
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': token}, content_type='application/json')
+
+    def test_rotation_and_logout_revoke_refresh_tokens(self):
+        tokens = self.client.post(reverse('token_obtain_pair'), {'username': 'customer', 'password': 'pass'},
+                                  content_type='application/json').data
+        with CaptureQueriesContext(connection) as queries:
+            rotated = self.refresh(tokens['refresh'])
+        self.assertEqual(rotated.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "users"' in query['sql']])
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+        response = self.client.get(reverse('order-list'), HTTP_AUTHORIZATION=f'Bearer {rotated.data["access"]}')
+        self.assertEqual(response.status_code, 200)
+
+        verify = reverse('token_verify')
+        self.assertEqual(self.client.post(verify, {'token': rotated.data['refresh']}).status_code, 200)
+        self.client.post(reverse('token_blacklist'), {'refresh': rotated.data['refresh']}, content_type='application/json')
+        self.assertEqual(self.refresh(rotated.data['refresh']).status_code, 401)
+        self.assertEqual(self.client.post(verify, {'token': rotated.data['refresh']}).status_code, 400)
+        self.assertEqual(self.client.post(verify, {'token': tokens['refresh']}).status_code, 400)
+
+    def test_refresh_follows_user_state(self):
+        tokens = self.client.post(reverse('token_obtain_pair'), {'username': 'customer', 'password': 'pass'},
+                                  content_type='application/json').data
+        self.customer.role = 'seller'
+        self.customer.save()
+        access = self.refresh(tokens['refresh']).data['access']
+        response = self.client.get(reverse('current-user'), HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.data['role'], 'seller')
+
+        self.customer.revoke_tokens()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+
+class PasswordHashingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller, self.customer, self.books = make_catalog()
+
+    def login(self, username='customer', password='pass', **extra):
+        return self.client.post(
+            reverse('login'), {'username': username, 'password': password}, content_type='application/json', **extra
+        )
+
+    def test_login_and_register(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['username'], 'customer')
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertEqual(self.login(username='nobody').status_code, 401)
+
+        response = self.client.post(reverse('register'), {
+            'username': 'reader', 'email': 'reader@example.com', 'password': 'Long-enough-42',
+            'password_confirm': 'Long-enough-42', 'role': 'customer',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('access', response.json()['tokens'])
+        self.assertTrue(User.objects.get(username='reader').check_password('Long-enough-42'))
+
+        response = self.client.post(reverse('register'), {'username': 'reader'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json())
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        hashers = ['django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+        version = self.customer.token_version
+        with override_settings(PASSWORD_HASHERS=hashers):
+            User.objects.filter(pk=self.customer.pk).update(password=make_password('pass', hasher='md5'))
+            self.assertEqual(self.login().status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.password.startswith('pbkdf2_sha256$'))
+        # Upgrading the hash does not revoke the user's tokens
+        self.assertEqual(self.customer.token_version, version)
+
+    def test_login_goes_through_the_authentication_backends(self):
+        logged_in, failed = [], []
+        user_logged_in.connect(lambda user, **kwargs: logged_in.append(user.username), weak=False, dispatch_uid='test')
+        user_login_failed.connect(lambda credentials, **kwargs: failed.append(credentials), weak=False, dispatch_uid='test')
+        self.addCleanup(user_logged_in.disconnect, dispatch_uid='test')
+        self.addCleanup(user_login_failed.disconnect, dispatch_uid='test')
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(logged_in, ['customer'])
+        self.customer.refresh_from_db()
+        self.assertIsNotNone(self.customer.last_login)
+
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        User.objects.filter(pk=self.seller.pk).update(is_active=False)
+        response = self.login('seller')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'User account is disabled'})
+        self.assertEqual(self.login('seller', password='wrong').json(), {'error': 'Invalid credentials'})
+        self.assertEqual([credentials['username'] for credentials in failed], ['customer', 'seller', 'seller'])
+
+    @override_settings(AUTH_THROTTLE_RATES={'login-username': '2/min', 'login-ip': '3/min'})
+    def test_login_throttles_reject_before_hashing(self):
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        # A wrong password would be a 401 had it been checked
+        response = self.login(password='wrong')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.login('seller').status_code, 429)
+        self.assertEqual(self.login('seller', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    async def test_pool_refuses_hashes_past_its_queue(self):
+        pool = passwords.HashingPool(workers=1, queue=0)
+        release = threading.Event()
+        first = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+        with self.assertRaises(passwords.HashingBusy):
+            await pool.run(make_password, 'pass')
+        release.set()
+        self.assertTrue(await first)
+        self.assertTrue(await pool.run(make_password, 'pass'))
+
+
+class AsyncReadViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller, self.customer, self.books = make_catalog()
+
+    def test_book_list_matches_the_sync_view(self):
+        params = {'ordering': 'price', 'page_size': 2, 'facets': 'true', 'max_price': '20'}
+        expected = self.client.get(reverse('book-list'), params).json()
+        response = self.client.get(reverse('async-book-list'), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['results'], expected['results'])
+        self.assertEqual((data['count'], data['facets']), (expected['count'], expected['facets']))
+        self.assertIn('/api/core/async/books/', data['next'])
+
+        page = self.client.get(data['next']).json()
+        self.assertEqual([book['id'] for book in page['results']], [self.books[2].id])
+
+        response = self.client.get(reverse('async-book-list'), {'search': 'book 1'})
+        self.assertEqual([book['id'] for book in response.json()['results']], [self.books[1].id])
+
+    def test_responses_are_cached_and_invalidated(self):
+        url = reverse('async-book-detail', args=[self.books[0].id])
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], len(queries)), ('HIT', 0))
+        self.assertEqual(response.json(), self.client.get(reverse('book-detail', args=[self.books[0].id])).data)
+
+        self.books[0].title = 'Renamed'
+        self.books[0].save()
+        self.assertEqual(self.client.get(url).json()['title'], 'Renamed')
+        self.assertEqual(self.client.get(reverse('async-book-detail', args=[0])).status_code, 404)
+
+    def test_categories_health_and_current_user(self):
+        response = self.client.get(reverse('async-category-list'))
+        self.assertEqual(response.json(), self.client.get(reverse('category-list')).json())
+        category = self.client.get(reverse('async-category-detail', args=[self.books[0].category_id]))
+        self.assertEqual(category.json()['name'], 'Fiction')
+        self.assertEqual(self.client.get(reverse('async-health')).json()['status'], 'healthy')
+
+        self.assertEqual(self.client.get(reverse('async-current-user')).status_code, 401)
+        token = self.client.post(
+            reverse('login'), {'username': 'customer', 'password': 'pass'}, content_type='application/json'
+        ).json()['tokens']['access']
+        response = self.client.get(reverse('async-current-user'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['username'], 'customer')
+        response = self.client.get(reverse('async-current-user'), HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post(reverse('async-book-list')).status_code, 405)
+
+
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller, self.customer, self.books = make_catalog()
+
+    def test_dispatch_reads_stock_of_watched_books_once(self):
+        broker = events.Broker(events.LocalRelay())
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscriber = events.Subscriber([events.book_channel(self.books[0].id)], loop)
+        broker._subscribers[events.book_channel(self.books[0].id)].add(subscriber)
+
+        book = self.books[0]
+        with self.assertNumQueries(1):
+            broker.dispatch([
+                (1, events.book_channel(book.id), events.STOCK, None),
+                (2, events.book_channel(book.id), events.STOCK, None),
+                (3, events.book_channel(self.books[1].id), events.STOCK, None),
+            ])
+        with self.assertNumQueries(0):
+            broker.dispatch([(4, events.book_channel(self.books[1].id), events.STOCK, None)])
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(subscriber.queue.qsize(), 1)
+        self.assertEqual(
+            subscriber.queue.get_nowait(),
+            (1, events.STOCK, {'book_id': book.id, 'stock_quantity': 10, 'in_stock': True}),
+        )
+
+        # Hot books report the total of their slots
+        inventory.enable(book.id, slots=2)
+        inventory.reserve(book.id, 3, 2)
+        self.assertEqual(events.current_stock([book.id, 0])[book.id]['stock_quantity'], 7)
+        self.assertFalse(events.current_stock([0])[0]['in_stock'])
+
+    def test_sqlite_relay_carries_events_between_processes(self):
+        path = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        publisher, receiver = events.SQLiteRelay(path), events.SQLiteRelay(path)
+        self.assertEqual(receiver.receive(timeout=0), [])
+        publisher.publish([('book:1', events.STOCK, None), ('user:2', events.ORDER, {'status': 'shipped'})])
+        received = receiver.receive(timeout=1)
+        self.assertEqual([event[1:] for event in received], [
+            ('book:1', events.STOCK, None), ('user:2', events.ORDER, {'status': 'shipped'}),
+        ])
+        self.assertEqual(receiver.receive(timeout=0), [])
+        self.assertEqual([event[0] for event in receiver.since(0, {'user:2', 'book:1'})], [received[1][0]])
+
+    async def test_live_events_are_not_dropped_after_a_relay_restart(self):
+        # The client saw id 50 from a process whose ids have since restarted
+        loop = asyncio.get_running_loop()
+        subscriber = events.Subscriber(['user:1'], loop)
+        subscriber.queue.put_nowait((3, events.ORDER, {'status': 'shipped'}))
+        broker = mock.Mock(subscribe=mock.Mock(return_value=subscriber), since=mock.Mock(return_value=[]))
+        with mock.patch.object(events, 'get_broker', return_value=broker):
+            stream = event_messages({'user:1'}, [], 50)
+            await anext(stream)
+            message = await asyncio.wait_for(anext(stream), 5)
+            await stream.aclose()
+        self.assertTrue(message.startswith('id: 3\n'))
+        broker.since.assert_called_once_with(50, {'user:1'})
+
+    def update_status(self, order, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.seller)
+            return self.client.patch(
+                reverse('order-update-status', args=[order.pk]), {'status': status}, content_type='application/json'
+            )
+
+    async def test_stream_sends_stock_snapshot_and_order_status(self):
+        order, _ = await sync_to_async(place_order)(self.customer.id, 'Somewhere', [
+            {'book_id': self.books[0].id, 'quantity': 2},
+        ])
+        token = str(ClaimsRefreshToken.for_user(self.customer).access_token)
+        response = await self.async_client.get(
+            reverse('events'), {'books': f'{self.books[0].id},{self.books[1].id}', 'token': token}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        snapshot = (await anext(stream)).decode()
+        self.assertIn('event: stock', snapshot)
+        self.assertIn(f'"book_id":{self.books[0].id},"stock_quantity":8', snapshot)
+        await anext(stream)
+
+        response = await sync_to_async(self.update_status)(order, 'shipped')
+        self.assertEqual(response.status_code, 200)
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertTrue(message.startswith('id: '))
+        self.assertIn('event: order', message)
+        self.assertIn(f'"order_id":{order.pk},"status":"shipped"', message)
+        await stream.aclose()
+
+    def test_stream_needs_asgi(self):
+        self.assertEqual(self.client.get(reverse('events'), {'books': '1'}).status_code, 503)
@@ -0,0 +1,61 @@
+"""
+Fixed-window rate limits for the async authentication views.
+
+``AUTH_THROTTLE_RATES`` maps a scope to a DRF-style rate such as
+``'5/min'``. Counters live in the default cache: with the default
+local-memory cache every process counts on its own, so a client spread
+over N processes gets up to N times the rate. ``CACHE_BACKEND=file``
+shares them between the processes of a host.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+DEFAULT_RATES = {
+    'login-ip': '30/min',
+    'login-username': '5/min',
+    'register-ip': '10/hour',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'5/min'`` -> ``(5, 60)``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def get_rate(scope):
+    rates = {**DEFAULT_RATES, **getattr(settings, 'AUTH_THROTTLE_RATES', {})}
+    return rates.get(scope)
+
+
+async def athrottle(scope, ident):
+    """
+    Count a request for ``ident`` in ``scope``. Returns ``None`` if it is
+    allowed, else the number of seconds until the window resets.
+    """
+    rate = get_rate(scope)
+    if not rate or not ident:
+        return None
+    limit, period = parse_rate(rate)
+    now = int(time.time())
+    window = now // period
+    key = f'throttle:{scope}:{ident}:{window}'
+    await cache.aadd(key, 0, period)
+    try:
+        count = await cache.aincr(key)
+    except ValueError:
+        # Expired between add and incr
+        await cache.aset(key, 1, period)
+        count = 1
+    if count > limit:
+        return (window + 1) * period - now
+    return None
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
@@ -0,0 +1,242 @@
+"""
+In-process prefix index for search-box typeahead.
+
+Each active book is indexed under its normalized (case- and accent-folded)
+title and author, starting from each of their first few words, and under
+its ISBN digits. Keys live in one sorted array, stored as a single string
+plus offsets rather than one object per key, and a lookup is a binary
+search followed by a short scan; suggestions are ranked by units sold.
+
+The index is built from the database on first use and rebuilt in the
+background every ``TYPEAHEAD_REFRESH_SECONDS``. In between, ``Book``
+saves and deletes (see ``signals``) and placed orders update it
+incrementally: changed books go to a small sorted delta, which brings the
+next rebuild forward once it grows, and their old keys are skipped
+through a per-book generation number. Each process holds its own index,
+so changes made by other processes, or by bulk writes that send no
+signals, show up after the next rebuild.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import count
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import Book
+
+
+REFRESH_SECONDS = getattr(settings, 'TYPEAHEAD_REFRESH_SECONDS', 600)
+
+# Keys are cut to this many characters; longer prefixes match the cut key
+MAX_KEY_LENGTH = 48
+# Titles and authors are indexed from each of their first words
+MAX_WORD_STARTS = 6
+# Queries up to this long are answered from precomputed top lists
+SHORT_PREFIX = 3
+TOP_K = 20
+# Longest scan of the key array for a longer prefix
+MAX_SCAN = 2000
+MAX_DELTA = 1000
+
+_non_word = re.compile(r'[\W_]+')
+_isbn = re.compile(r'[^0-9x]')
+
+
+def normalize(text):
+    """Fold case and accents and reduce punctuation to single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _non_word.sub(' ', text.casefold()).strip()
+
+
+def index_keys(title, author, isbn):
+    keys = set()
+    for text in (title, author):
+        words = normalize(text).split()
+        for start in range(min(len(words), MAX_WORD_STARTS)):
+            keys.add(' '.join(words[start:])[:MAX_KEY_LENGTH])
+    isbn = _isbn.sub('', (isbn or '').lower())
+    if isbn:
+        keys.add(isbn)
+    return keys
+
+
+class SortedKeys:
+    """Sorted strings packed into one string plus an offsets array."""
+
+    def __init__(self, keys):
+        self._blob = ''.join(keys)
+        self._offsets = array('I', [0])
+        for key in keys:
+            self._offsets.append(self._offsets[-1] + len(key))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return self._blob[self._offsets[index]:self._offsets[index + 1]]
+
+
+class _State:
+    """One immutable key array plus the delta of books changed since."""
+
+    def __init__(self, books):
+        # book id -> (title, author, isbn, units sold, generation)
+        self.books = books
+        entries = sorted(
+            (key, book_id, book[4])
+            for book_id, book in books.items()
+            for key in index_keys(*book[:3])
+        )
+        self.keys = SortedKeys([key for key, _, _ in entries])
+        self.ids = array('q', [book_id for _, book_id, _ in entries])
+        self.generations = array('Q', [generation for _, _, generation in entries])
+        self.delta = []
+
+        candidates = defaultdict(set)
+        for key, book_id, generation in entries:
+            for length in range(1, min(len(key), SHORT_PREFIX) + 1):
+                candidates[key[:length]].add((book_id, generation))
+        self.top = {
+            prefix: tuple(heapq.nlargest(TOP_K, pairs, key=lambda pair: books[pair[0]][3]))
+            for prefix, pairs in candidates.items()
+        }
+
+    def matches(self, prefix):
+        """``(book_id, generation)`` pairs whose keys start with ``prefix``."""
+        if len(prefix) <= SHORT_PREFIX:
+            yield from self.top.get(prefix, ())
+        else:
+            index = bisect_left(self.keys, prefix)
+            end = min(len(self.keys), index + MAX_SCAN)
+            while index < end and self.keys[index].startswith(prefix):
+                yield self.ids[index], self.generations[index]
+                index += 1
+        index = bisect_left(self.delta, (prefix,))
+        while index < len(self.delta) and self.delta[index][0].startswith(prefix):
+            yield self.delta[index][1:]
+            index += 1
+
+
+class TypeaheadIndex:
+
+    def __init__(self):
+        self._state = None
+        self._built_at = 0
+        self._lock = threading.RLock()
+        self._generations = count(1)
+        self._building = False
+        self._replay = []
+
+    @property
+    def ready(self):
+        return self._state is not None
+
+    def build(self):
+        """(Re)build the index from the active catalog."""
+        with self._lock:
+            self._building = True
+        try:
+            rows = Book.objects.filter(is_active=True).annotate(
+                sold=Coalesce(Sum('order_items__quantity'), 0)
+            ).values_list('id', 'title', 'author', 'isbn', 'sold').order_by().iterator(chunk_size=5000)
+            books = {
+                book_id: (title, author, isbn, sold, next(self._generations))
+                for book_id, title, author, isbn, sold in rows
+            }
+            state = _State(books)
+            with self._lock:
+                self._state = state
+                self._built_at = time.monotonic()
+                # Changes committed while the catalog was being read
+                for change in self._replay:
+                    change()
+        finally:
+            with self._lock:
+                self._building = False
+                self._replay = []
+
+    def suggest(self, query, limit=8):
+        """Up to ``limit`` ``{'id', 'title', 'author'}`` dicts, best sellers first."""
+        self._ensure_fresh()
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        state = self._state
+        found = {}
+        for book_id, generation in state.matches(prefix):
+            book = state.books.get(book_id)
+            # Keys of a book that changed since they were indexed are stale
+            if book is not None and book[4] == generation:
+                found[book_id] = book
+        best = heapq.nsmallest(limit, found.items(), key=lambda item: (-item[1][3], item[1][0]))
+        return [{'id': book_id, 'title': book[0], 'author': book[1]} for book_id, book in best]
+
+    def _ensure_fresh(self):
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    self.build()
+        elif time.monotonic() - self._built_at > REFRESH_SECONDS and not self._building:
+            with self._lock:
+                if self._building:
+                    return
+                self._building = True
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        from django.db import connection
+
+        try:
+            self.build()
+        finally:
+            connection.close()
+
+    def _apply(self, change, replay=True):
+        with self._lock:
+            if self._building and replay:
+                self._replay.append(change)
+            if self._state is not None:
+                change()
+
+    def update_book(self, book):
+        """Reindex ``book`` after it was saved (or drop it if inactive)."""
+        def change():
+            state = self._state
+            if not book.is_active:
+                state.books.pop(book.pk, None)
+                return
+            previous = state.books.get(book.pk)
+            generation = next(self._generations)
+            state.books[book.pk] = (book.title, book.author, book.isbn, previous[3] if previous else 0, generation)
+            for key in index_keys(book.title, book.author, book.isbn):
+                insort(state.delta, (key, book.pk, generation))
+            if len(state.delta) > MAX_DELTA:
+                # Rebuild in the background on the next lookup
+                self._built_at = 0
+        self._apply(change)
+
+    def remove_book(self, book_id):
+        self._apply(lambda: self._state.books.pop(book_id, None))
+
+    def record_sales(self, quantities):
+        """Add ``{book_id: quantity}`` to the books' units sold."""
+        def change():
+            books = self._state.books
+            for book_id, quantity in quantities.items():
+                if book_id in books:
+                    title, author, isbn, sold, generation = books[book_id]
+                    books[book_id] = (title, author, isbn, sold + quantity, generation)
+        # Not replayed after a rebuild, whose totals may already include them
+        self._apply(change, replay=False)
+
+
+index = TypeaheadIndex()
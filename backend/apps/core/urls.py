@@ -3,10 +3,11 @@ URL configuration for Core API app.
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from apps.core.viewsets import async_viewsets
 from apps.core.viewsets import (
     HealthCheckViewSet,
     health_check,
-    RegisterView,
+    register_view,
     login_view,
     current_user_view,
     BookViewSet,
@@ -29,7 +30,16 @@ urlpatterns = [
     path('health-check/', health_check, name='health-check-direct'),
     
     # Authentication endpoints
-    path('auth/register/', RegisterView.as_view(), name='register'),
+    path('auth/register/', register_view, name='register'),
     path('auth/login/', login_view, name='login'),
     path('auth/me/', current_user_view, name='current-user'),
+    
+    # Async read endpoints for ASGI deployments
+    path('async/health/', async_viewsets.health, name='async-health'),
+    path('async/books/', async_viewsets.book_list, name='async-book-list'),
+    path('async/books/<int:pk>/', async_viewsets.book_detail, name='async-book-detail'),
+    path('async/categories/', async_viewsets.category_list, name='async-category-list'),
+    path('async/categories/<int:pk>/', async_viewsets.category_detail, name='async-category-detail'),
+    path('async/auth/me/', async_viewsets.current_user, name='async-current-user'),
+    path('events/', async_viewsets.event_stream, name='events'),
 ]
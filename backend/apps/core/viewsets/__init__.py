@@ -1,13 +1,13 @@
 # ViewSets for Core API
 from .api_viewsets import HealthCheckViewSet, health_check
-from .auth_viewsets import RegisterView, login_view, current_user_view
+from .auth_viewsets import register_view, login_view, current_user_view
 from .book_viewsets import BookViewSet, CategoryViewSet
 from .order_viewsets import OrderViewSet
 
 __all__ = [
     'HealthCheckViewSet',
     'health_check',
-    'RegisterView',
+    'register_view',
     'login_view',
     'current_user_view',
     'BookViewSet',
@@ -7,6 +7,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
 
+HEALTH = {
+    'status': 'healthy',
+    'message': 'BookBridge API is running',
+    'version': '1.0.0'
+}
+
+
 class HealthCheckViewSet(viewsets.ViewSet):
     """
     Health check endpoint for API monitoring.
@@ -17,11 +24,7 @@ class HealthCheckViewSet(viewsets.ViewSet):
         """
         Returns API health status.
         """
-        return Response({
-            'status': 'healthy',
-            'message': 'BookBridge API is running',
-            'version': '1.0.0'
-        }, status=status.HTTP_200_OK)
+        return Response(HEALTH, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -30,9 +33,5 @@ def health_check(request):
     """
     Simple health check endpoint.
     """
-    return Response({
-        'status': 'healthy',
-        'message': 'BookBridge API is running',
-        'version': '1.0.0'
-    }, status=status.HTTP_200_OK)
+    return Response(HEALTH, status=status.HTTP_200_OK)
 
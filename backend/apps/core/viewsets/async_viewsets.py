@@ -0,0 +1,276 @@
+"""
+Async read endpoints for ASGI deployments.
+
+Async Django views serving the hot catalog reads (book list, search and
+detail, categories), the health check and the current user under
+``/api/core/async/``, plus the Server-Sent Events stream of
+``apps.core.events``, next to the synchronous DRF viewsets. Under ASGI a
+request waiting on the database or the cache does not hold a thread, so
+one worker process can keep thousands of catalog connections open.
+
+DRF views cannot be async, so each view borrows the matching viewset's
+configuration (queryset, filter backends, serializers, cache tags) and
+runs it with the async ORM and cache. Queryset filtering, which may
+validate filter values against the database, and facet counts go through
+``sync_to_async``. Responses are cached like the sync ones, under their own
+keys since their links point at the async URLs, and carry no ETag.
+"""
+import asyncio
+from contextlib import nullcontext
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+
+from bookbridge.instrumentation import measure
+from bookbridge.routers import ais_pinned, replica_reads, replicas
+from .. import events
+from ..authentication import ClaimsJWTAuthentication, afull_user
+from ..cache import REPLICA_SETTLE_SECONDS, aget_response, aset_response
+from ..renderers import FastJSONRenderer
+from ..serializers import UserSerializer
+from .api_viewsets import HEALTH
+from .book_viewsets import BookViewSet, CategoryViewSet
+
+
+# Most books one event stream may watch
+MAX_STREAM_BOOKS = 100
+# Comment lines sent to idle streams, so that proxies keep them open
+HEARTBEAT_SECONDS = 15
+# Reconnection delay suggested to EventSource clients
+RETRY_MILLISECONDS = 3000
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    with measure('render'):
+        content = FastJSONRenderer().render(data)
+    return HttpResponse(content, content_type='application/json', status=status_code)
+
+
+def async_api_view(view):
+    """Answer GET/HEAD only and turn DRF exceptions into JSON errors."""
+    @require_safe
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            response = json_response(data, exc.status_code)
+            if isinstance(exc, NotAuthenticated):
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+    return wrapper
+
+
+async def authenticate(request):
+    with measure('auth'):
+        return await ClaimsJWTAuthentication().aauthenticate(request)
+
+
+async def viewset_for(viewset_class, request, action, **kwargs):
+    """An undispatched ``viewset_class`` set up to handle ``request`` as ``action``."""
+    drf_request = Request(request)
+    drf_request.user = await authenticate(request) or AnonymousUser()
+    view = viewset_class(request=drf_request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+    # As ReplicaReadMixin: users pinned by a recent write stay on the primary
+    view.read_from_replica = bool(replicas()) and not await ais_pinned(drf_request.user.pk)
+    return view
+
+
+def catalog_reads(view):
+    return replica_reads() if view.read_from_replica else nullcontext()
+
+
+async def cached_response(view, build):
+    """
+    ``CachedResponseMixin.cached_response`` for async views: ``build`` is a
+    coroutine function returning the response data.
+    """
+    request = view.request
+    if any(param in request.query_params for param in view.cache_bypass_params):
+        return json_response(await build())
+
+    key = f'async-{view.get_cache_key(request)}'
+    entry = await aget_response(key)
+    if entry is not None:
+        response = json_response(entry[0])
+        response['X-Cache'] = 'HIT'
+        return response
+
+    data = await build()
+    await aset_response(
+        key, data, view.get_cache_tags(data),
+        settle_seconds=REPLICA_SETTLE_SECONDS if view.read_from_replica else 0,
+    )
+    response = json_response(data)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+@async_api_view
+async def health(request):
+    """Async health check."""
+    return json_response(HEALTH)
+
+
+@async_api_view
+async def category_list(request):
+    view = await viewset_for(CategoryViewSet, request, 'list')
+
+    async def build():
+        with catalog_reads(view):
+            categories = [category async for category in view.get_queryset()]
+        return view.get_serializer(categories, many=True).data
+
+    return await cached_response(view, build)
+
+
+@async_api_view
+async def category_detail(request, pk):
+    view = await viewset_for(CategoryViewSet, request, 'retrieve', pk=pk)
+
+    async def build():
+        with catalog_reads(view):
+            category = await view.get_queryset().filter(pk=pk).afirst()
+        if category is None:
+            raise NotFound('No Category matches the given query.')
+        return view.get_serializer(category).data
+
+    return await cached_response(view, build)
+
+
+@async_api_view
+async def book_list(request):
+    """Books list and search, with the filters, ordering and pagination of ``BookViewSet``."""
+    view = await viewset_for(BookViewSet, request, 'list')
+
+    async def build():
+        with catalog_reads(view):
+            queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+            if view.request.query_params.get('facets') == 'true':
+                view.facet_queryset = queryset
+            rows = await view.paginator.apaginate_queryset(
+                view.get_serializer_class().rows(queryset), view.request, view=view
+            )
+            data = view.get_serializer(rows, many=True).data
+            if hasattr(view, 'facet_queryset'):
+                response = await sync_to_async(view.get_paginated_response)(data)
+            else:
+                response = view.get_paginated_response(data)
+        return response.data
+
+    return await cached_response(view, build)
+
+
+@async_api_view
+async def book_detail(request, pk):
+    view = await viewset_for(BookViewSet, request, 'retrieve', pk=pk)
+
+    async def build():
+        with catalog_reads(view):
+            book = await view.get_queryset().filter(pk=pk).afirst()
+        if book is None:
+            raise NotFound('No Book matches the given query.')
+        return view.get_serializer(book).data
+
+    return await cached_response(view, build)
+
+
+@async_api_view
+async def current_user(request):
+    """Async current user."""
+    user = await authenticate(request)
+    if user is None:
+        raise NotAuthenticated()
+    return json_response(UserSerializer(await afull_user(user)).data)
+
+
+def server_sent_event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {FastJSONRenderer().render(data).decode()}']
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_messages(channels, book_ids, last_event_id):
+    broker = events.get_broker()
+    # Subscribed before the snapshot so no change falls in between
+    subscriber = broker.subscribe(channels, asyncio.get_running_loop())
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        if book_ids:
+            stock = await sync_to_async(events.current_stock)(book_ids)
+            for data in stock.values():
+                yield server_sent_event(events.STOCK, data)
+        # Last-Event-ID only picks the replay: ids restart with a process
+        # (LocalRelay), so live events are only checked against the replay
+        replayed = 0
+        if last_event_id:
+            missed = await sync_to_async(broker.since, thread_sensitive=False)(last_event_id, channels)
+            for event_id, _, name, data in missed:
+                yield server_sent_event(name, data, event_id)
+                replayed = event_id
+        
+        while not subscriber.closed:
+            try:
+                event_id, name, data = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if event_id > replayed:
+                yield server_sent_event(name, data, event_id)
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+@async_api_view
+async def event_stream(request):
+    """
+    Server-Sent Events: ``stock`` of the books in ``?books=<id>,<id>``,
+    starting with a snapshot, and ``order`` status changes of the
+    authenticated customer. EventSource cannot send headers, so the access
+    token may also be passed as ``?token=``.
+    """
+    if not isinstance(request, ASGIRequest):
+        return json_response(
+            {'error': 'Event streams need the ASGI server'}, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    authenticator = ClaimsJWTAuthentication()
+    with measure('auth'):
+        user = await authenticator.aauthenticate(request)
+        if user is None and request.GET.get('token'):
+            user = await authenticator.aget_user(authenticator.get_validated_token(request.GET['token']))
+    
+    try:
+        book_ids = sorted({int(book_id) for book_id in request.GET.get('books', '').split(',') if book_id.strip()})
+    except ValueError:
+        return json_response({'error': 'books must be a comma-separated list of ids'}, status.HTTP_400_BAD_REQUEST)
+    if len(book_ids) > MAX_STREAM_BOOKS:
+        return json_response(
+            {'error': f'At most {MAX_STREAM_BOOKS} books per stream'}, status.HTTP_400_BAD_REQUEST
+        )
+    channels = {events.book_channel(book_id) for book_id in book_ids}
+    if user is not None:
+        channels.add(events.user_channel(user.id))
+    if not channels:
+        return json_response(
+            {'error': 'Pass books to watch, or authenticate for order events'}, status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    response = StreamingHttpResponse(
+        event_messages(channels, book_ids, last_event_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,81 +1,119 @@
-from rest_framework import status, generics
+import io
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
-from ..models import User
+from rest_framework.permissions import IsAuthenticated
+from ..authentication import ClaimsRefreshToken, full_user
+from ..parsers import FastJSONParser
+from ..passwords import AccountDisabled, HashingBusy, amake_password
 from ..serializers import UserSerializer, UserRegistrationSerializer
+from ..throttling import athrottle, client_ip
+from .async_viewsets import json_response
+
+
+# Login and registration are plain async Django views rather than DRF views
+# (which cannot be async), so that password hashing, run on the pool of
+# ``apps.core.passwords``, does not hold a request worker under ASGI.
+
+def _throttled(wait):
+    response = json_response({'error': 'Too many attempts, try again later'}, status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def _busy():
+    response = json_response({'error': 'Server busy, try again shortly'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
 
+def _request_data(request):
+    if request.content_type == 'application/json':
+        return FastJSONParser().parse(io.BytesIO(request.body))
+    return request.POST
 
-class RegisterView(generics.CreateAPIView):
+
+def _token_response(user, message, status_code):
+    refresh = ClaimsRefreshToken.for_user(user)
+    return json_response({
+        'user': UserSerializer(user).data,
+        'tokens': {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        },
+        'message': message
+    }, status_code)
+
+
+@csrf_exempt
+@require_POST
+async def register_view(request):
     """User registration endpoint."""
-    queryset = User.objects.all()
-    permission_classes = [AllowAny]
-    serializer_class = UserRegistrationSerializer
+    wait = await athrottle('register-ip', client_ip(request))
+    if wait:
+        return _throttled(wait)
+    try:
+        data = _request_data(request)
+    except ParseError as exc:
+        return json_response({'error': str(exc.detail)}, status.HTTP_400_BAD_REQUEST)
+    
+    serializer = UserRegistrationSerializer(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    try:
+        encoded_password = await amake_password(serializer.validated_data['password'])
+    except HashingBusy:
+        return _busy()
+    user = await sync_to_async(serializer.save)(encoded_password=encoded_password)
     
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-        
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        
-        return Response({
-            'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
-            'message': 'User registered successfully'
-        }, status=status.HTTP_201_CREATED)
-
-
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def login_view(request):
+    return _token_response(user, 'User registered successfully', status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def login_view(request):
     """User login endpoint."""
-    username = request.data.get('username')
-    password = request.data.get('password')
+    try:
+        data = _request_data(request)
+    except ParseError as exc:
+        return json_response({'error': str(exc.detail)}, status.HTTP_400_BAD_REQUEST)
+    username = data.get('username')
+    password = data.get('password')
     
     if not username or not password:
-        return Response(
-            {'error': 'Username and password are required'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        return json_response({'error': 'Username and password are required'}, status.HTTP_400_BAD_REQUEST)
     
-    user = authenticate(username=username, password=password)
+    # Both limits are checked before any hashing
+    wait = await athrottle('login-ip', client_ip(request)) or await athrottle('login-username', username)
+    if wait:
+        return _throttled(wait)
     
+    try:
+        # Sends user_login_failed on failure
+        user = await aauthenticate(request, username=username, password=password)
+    except HashingBusy:
+        return _busy()
+    except AccountDisabled:
+        await user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
+        return json_response({'error': 'User account is disabled'}, status.HTTP_401_UNAUTHORIZED)
     if user is None:
-        return Response(
-            {'error': 'Invalid credentials'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
-    
-    if not user.is_active:
-        return Response(
-            {'error': 'User account is disabled'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
+        return json_response({'error': 'Invalid credentials'}, status.HTTP_401_UNAUTHORIZED)
+    await user_logged_in.asend(sender=user.__class__, request=request, user=user)
     
-    # Generate JWT tokens
-    refresh = RefreshToken.for_user(user)
-    
-    return Response({
-        'user': UserSerializer(user).data,
-        'tokens': {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-        },
-        'message': 'Login successful'
-    }, status=status.HTTP_200_OK)
+    return _token_response(user, 'Login successful', status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user_view(request):
     """Get current authenticated user."""
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(full_user(request.user))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -1,31 +1,57 @@
+import io
+
 from rest_framework import viewsets, status
 from rest_framework import filters
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.db.models import Count, Max, Sum
+from django.http import Http404
 from django_filters.rest_framework import DjangoFilterBackend
+from bookbridge.routers import ReplicaReadMixin
 from ..models import Book, Category
 from ..serializers import BookSerializer, BookListSerializer, CategorySerializer
+from apps.core import facets, recommendations, typeahead
+from apps.core.cache import CachedResponseMixin
+from apps.core.conditional import ConditionalGetMixin
+from apps.core.filters import BookFilter
+from apps.core.pagination import KeysetPagination
 from apps.core.permissions import IsSellerOrReadOnly
+from apps.core.search import BookSearchFilter
+from apps.core.services import exports, inventory
+from apps.core.services.book_import import FORMATS, detect_format, import_books
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for Category - read-only for all users."""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    cache_prefix = 'category'
+    
+    def get_cache_tags(self, data):
+        if self.action == 'list':
+            return {'categories'}
+        return {f'category:{data["id"]}'}
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ReplicaReadMixin, CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Book model."""
     queryset = Book.objects.filter(is_active=True)
     permission_classes = [IsSellerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'seller']
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BookSearchFilter]
+    filterset_class = BookFilter
     search_fields = ['title', 'author', 'isbn']
     ordering_fields = ['price', 'created_at', 'title']
     ordering = ['-created_at']
+    cache_prefix = 'book'
+    cache_bypass_params = ['my_books']
+    # Rendered but not reflected in Book.updated_at: the slot sum of hot
+    # books, and category names (renamed, or removed from the book)
+    validator_fields = {'available': Sum, 'category__updated_at': Max, 'category_id': Count}
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -37,12 +63,102 @@ class BookViewSet(viewsets.ModelViewSet):
         # Sellers can see their own inactive books
         if self.request.user.is_authenticated and self.request.user.is_seller:
             if self.request.query_params.get('my_books') == 'true':
-                return Book.objects.filter(seller=self.request.user)
-        return queryset
+                queryset = Book.objects.filter(seller_id=self.request.user.id)
+        return inventory.with_available_stock(queryset.select_related('category', 'seller'))
+    
+    def paginate_queryset(self, queryset):
+        # Lists are serialized from values() rows, see BookRowListSerializer
+        if self.action == 'list':
+            if self.request.query_params.get('facets') == 'true':
+                self.facet_queryset = queryset
+            queryset = BookListSerializer.rows(queryset)
+        return super().paginate_queryset(queryset)
+    
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        queryset = getattr(self, 'facet_queryset', None)
+        if queryset is not None:
+            if any(param in self.request.query_params for param in self.cache_bypass_params):
+                response.data['facets'] = facets.facet_counts(queryset)
+            else:
+                response.data['facets'] = facets.cached_facet_counts(
+                    queryset, self.request.query_params, {'categories', 'stock'} | self.get_filter_tags()
+                )
+        return response
+    
+    def page_only(self, request):
+        # Facets count every matching book, not just the page
+        return super().page_only(request) and request.query_params.get('facets') != 'true'
+    
+    def get_cache_tags(self, data):
+        if self.action == 'retrieve':
+            tags = {f'book:{data["id"]}', f'seller:{data["seller_id"]}'}
+            if data['category']:
+                tags.add(f'category:{data["category"]["id"]}')
+            return tags
+        if self.action == 'related':
+            return {'recommendations', f'book:{self.kwargs["pk"]}'} | {
+                f'book:{book["id"]}' for book in data['results']
+            }
+        
+        # Lists depend on the books they contain, and on any book that could
+        # join them: narrowed by category or seller when filtered, else all.
+        tags = {f'book:{book["id"]}' for book in data['results']} | self.get_filter_tags()
+        if 'facets' in data:
+            tags |= {'categories', 'stock'}
+        return tags
+    
+    def get_filter_tags(self):
+        """Tags of every book that could match the list filters."""
+        params = self.request.query_params
+        tags = {f'{field}:{params[field]}' for field in ('category', 'seller') if params.get(field)}
+        tags = tags or {'catalog'}
+        if 'in_stock' in params:
+            # Checkouts that sell a book out change membership, see place_order
+            tags.add('stock')
+        return tags
     
     def perform_create(self, serializer):
         # Automatically set seller to current user
-        serializer.save(seller=self.request.user)
+        serializer.save(seller_id=self.request.user.id)
+    
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[AllowAny])
+    def suggest(self, request):
+        """Typeahead suggestions for ``?q=``, served from memory, see apps.core.typeahead."""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 8)), 20))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be a number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'results': typeahead.index.suggest(request.query_params.get('q', ''), limit)})
+    
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Books most often bought together with this one, see apps.core.recommendations."""
+        return self.cached_response(request, self._related, pk=pk)
+    
+    def _related(self, request, pk=None):
+        # Missing and inactive books are 404, like retrieve
+        book_id = self.get_object().pk
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            raise Http404
+        # Read a few extra in case some of them are no longer for sale
+        counts = dict(recommendations.related(book_id, limit * 2))
+        rows = []
+        if counts:
+            found = {
+                row['id']: row
+                for row in BookListSerializer.rows(self.get_queryset().filter(id__in=counts).order_by())
+            }
+            rows = [found[related_id] for related_id in counts if related_id in found][:limit]
+        results = BookListSerializer(rows, many=True, context=self.get_serializer_context()).data
+        for book in results:
+            book['co_purchases'] = counts[book['id']]
+        return Response({'results': results})
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_books(self, request):
@@ -52,7 +168,52 @@ class BookViewSet(viewsets.ModelViewSet):
                 {'error': 'Only sellers can access this endpoint'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        books = Book.objects.filter(seller=request.user)
+        books = inventory.with_available_stock(Book.objects.filter(seller_id=request.user.id))
         serializer = BookSerializer(books, many=True)
         return Response(serializer.data)
 
+    
+    @action(detail=False, methods=['post'], url_path='import', url_name='import',
+            permission_classes=[IsAuthenticated], parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """Bulk upsert the current seller's catalog from an uploaded CSV/JSONL file."""
+        if not request.user.is_seller:
+            return Response(
+                {'error': 'Only sellers can access this endpoint'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'A CSV or JSONL file is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in FORMATS:
+            return Response(
+                {'error': f'Unsupported format: {fmt}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            report = import_books(stream, fmt, request.user.id)
+        except UnicodeDecodeError:
+            return Response(
+                {'error': 'File must be UTF-8 encoded'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(report, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream the seller's catalog (or the active catalog) as CSV or NDJSON."""
+        fmt = request.query_params.get('export_format', 'csv')
+        if fmt not in exports.FORMATS:
+            return Response(
+                {'error': f'Unsupported format: {fmt}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return exports.streaming_response(
+            exports.export_books(exports.seller_catalog(request.user), fmt, user_id=request.user.id), fmt, 'books'
+        )
@@ -2,25 +2,48 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from ..models import Order, OrderItem, Book
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Prefetch, Subquery
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from .. import events
+from ..conditional import ConditionalGetMixin
+from ..models import Order, OrderIntake, OrderItem
+from ..pagination import KeysetPagination
 from ..serializers import OrderSerializer, OrderCreateSerializer
+from ..services import OrderPlacementError, exports, order_intake, place_order
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Order model."""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # Rendered through str(): the customer, and the titles and authors of
+    # the books, whose changes do not touch Order.updated_at
+    validator_fields = {'customer__updated_at': Max, 'books_updated_at': Max}
     
     def get_queryset(self):
         user = self.request.user
         if user.is_customer:
-            return Order.objects.filter(customer=user)
+            queryset = Order.objects.filter(customer_id=user.id)
+            items = OrderItem.objects.all()
         elif user.is_seller:
-            # Sellers can see orders for their books
-            return Order.objects.filter(items__book__seller=user).distinct()
+            # Sellers can see orders for their books, and only their own lines
+            items = OrderItem.objects.filter(book__seller_id=user.id)
+            queryset = Order.objects.filter(
+                Exists(items.filter(order_id=OuterRef('pk')))
+            )
         elif user.is_admin:
-            return Order.objects.all()
-        return Order.objects.none()
+            queryset = Order.objects.all()
+            items = OrderItem.objects.all()
+        else:
+            return Order.objects.none()
+        return queryset.select_related('customer').prefetch_related(
+            Prefetch('items', queryset=items.select_related('book'))
+        ).annotate(books_updated_at=Subquery(
+            items.filter(order_id=OuterRef('pk')).order_by('-book__updated_at').values('book__updated_at')[:1]
+        ))
     
     def create(self, request, *args, **kwargs):
         """Create a new order from cart items."""
@@ -33,55 +56,58 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = OrderCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create order
-        order = Order.objects.create(
-            customer=request.user,
-            shipping_address=serializer.validated_data['shipping_address'],
-            status='pending'
-        )
-        
-        # Create order items
-        total = 0
-        for item_data in serializer.validated_data['items']:
-            try:
-                book = Book.objects.get(id=item_data['book_id'], is_active=True)
-                quantity = item_data['quantity']
-                
-                if book.stock_quantity < quantity:
-                    order.delete()
-                    return Response(
-                        {'error': f'Insufficient stock for {book.title}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Create order item
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    book=book,
-                    quantity=quantity,
-                    price=book.price
-                )
-                
-                # Update book stock
-                book.stock_quantity -= quantity
-                book.save()
-                
-                total += order_item.subtotal
-            except Book.DoesNotExist:
-                order.delete()
-                return Response(
-                    {'error': f'Book with id {item_data["book_id"]} not found'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+        if order_intake.enabled():
+            # Placed later by a worker in a batch, see services.order_intake
+            intake = order_intake.enqueue(
+                customer_id=request.user.id,
+                shipping_address=serializer.validated_data['shipping_address'],
+                items=serializer.validated_data['items'],
+            )
+            status_url = reverse('order-intake', kwargs={'intake_id': intake.pk})
+            return Response(
+                {'intake_id': intake.pk, 'status': intake.status, 'status_url': status_url},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': status_url},
+            )
         
-        order.total_amount = total
-        order.save()
+        try:
+            order, _ = place_order(
+                customer_id=request.user.id,
+                shipping_address=serializer.validated_data['shipping_address'],
+                items=serializer.validated_data['items'],
+            )
+        except OrderPlacementError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
         
         return Response(
-            OrderSerializer(order).data,
+            OrderSerializer(self.get_queryset().get(pk=order.pk)).data,
             status=status.HTTP_201_CREATED
         )
     
+    @action(detail=False, methods=['get'], url_path=r'intake/(?P<intake_id>\d+)')
+    def intake(self, request, intake_id=None):
+        """Poll a queued checkout; includes the order once it is placed."""
+        intake = get_object_or_404(OrderIntake, pk=intake_id, customer_id=request.user.id)
+        data = {'intake_id': intake.pk, 'status': intake.status}
+        if intake.status == 'placed' and intake.order_id:
+            data['order'] = OrderSerializer(self.get_queryset().get(pk=intake.order_id)).data
+        elif intake.status == 'failed':
+            # Database errors are kept for the logs, not shown to customers
+            data['error'] = intake.error if intake.error_status < 500 else 'Order could not be placed'
+            data['error_status'] = intake.error_status
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the order lines visible to the current user as CSV or NDJSON."""
+        fmt = request.query_params.get('export_format', 'csv')
+        if fmt not in exports.FORMATS:
+            return Response(
+                {'error': f'Unsupported format: {fmt}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return exports.streaming_response(exports.export_orders(request.user, fmt), fmt, 'orders')
+    
     @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated])
     def update_status(self, request, pk=None):
         """Update order status (for sellers and admins)."""
@@ -101,7 +127,8 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         
         order.status = new_status
-        order.save()
+        order.save(update_fields=['status', 'updated_at'])
+        transaction.on_commit(lambda: events.order_status(order))
         
         return Response(OrderSerializer(order).data)
 
@@ -0,0 +1,103 @@
+"""
+Response compression codecs and their metrics.
+
+gzip is always available; Brotli (``br``) and Zstandard (``zstd``) are used
+when the ``brotli`` / ``zstandard`` packages are installed. Bodies that are
+cached anyway are compressed once at a higher level and the result is
+cached too, see ``CompressionMiddleware``.
+"""
+import gzip
+import threading
+from collections import defaultdict
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+def _gzip(level):
+    return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(quality):
+    return lambda data: brotli.compress(data, quality=quality)
+
+
+def _zstd(level):
+    return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# Encoding -> (compressor for one-off bodies, compressor for cached bodies),
+# in server preference order
+CODECS = {}
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd(3), _zstd(12))
+if brotli is not None:
+    CODECS['br'] = (_brotli(4), _brotli(9))
+CODECS['gzip'] = (_gzip(6), _gzip(9))
+
+
+def parse_accept_encoding(header):
+    """Return ``{coding: q}`` for an ``Accept-Encoding`` header."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header, codecs=CODECS):
+    """Pick the encoding for ``header``: highest q, then server preference."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in codecs:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionStats:
+    """Per-encoding counters shared by all threads of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._encodings = defaultdict(lambda: {
+            'responses': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0, 'compress_ms': 0.0,
+        })
+
+    def add(self, encoding, bytes_in, bytes_out, compress_ms=0.0, cache_hit=False):
+        with self._lock:
+            stats = self._encodings[encoding]
+            stats['responses'] += 1
+            stats['cache_hits'] += cache_hit
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['compress_ms'] += compress_ms
+
+    def snapshot(self):
+        """Counters per encoding plus the overall ``ratio`` (compressed / original)."""
+        with self._lock:
+            return {
+                encoding: {**stats, 'ratio': stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else None}
+                for encoding, stats in self._encodings.items()
+            }
+
+
+compression_stats = CompressionStats()
@@ -0,0 +1,170 @@
+"""
+Per-request performance instrumentation.
+
+A ``RequestMetrics`` object lives in a context variable for the duration of
+a request. Database time is collected with ``connection.execute_wrapper``;
+other phases (serializers, JWT authentication, ...) are recorded with
+``measure()``. Recording is a few ``perf_counter`` calls per event, cheap
+enough to leave on in production.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings collected for one request, in milliseconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = ''
+        self.spans = defaultdict(float)
+        self._depth = defaultdict(int)
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def record_query(self, sql, elapsed_ms):
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_sql = sql
+
+
+def current():
+    """Metrics of the request being handled, or ``None`` outside a request."""
+    return _current.get()
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def record(name, elapsed_ms):
+    """Add ``elapsed_ms`` to the span ``name`` of the current request."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.spans[name] += elapsed_ms
+
+
+@contextmanager
+def measure(name):
+    """
+    Time a block as span ``name``.
+
+    Nested blocks with the same name (a serializer rendering child
+    serializers) are only counted once, at the outermost level.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics._depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._depth[name] -= 1
+        if not metrics._depth[name]:
+            metrics.spans[name] += (time.perf_counter() - started) * 1000
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook timing every query."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, (time.perf_counter() - started) * 1000)
+
+
+class RouteStats:
+    """Running per-route aggregates, shared by all threads of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, route, metrics, total_ms):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'requests': 0, 'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0,
+                    'max_ms': 0.0, 'spans': defaultdict(float),
+                }
+            stats['requests'] += 1
+            stats['total_ms'] += total_ms
+            stats['db_ms'] += metrics.db_ms
+            stats['queries'] += metrics.queries
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            for name, elapsed in metrics.spans.items():
+                stats['spans'][name] += elapsed
+
+    def snapshot(self):
+        """Per-route averages, e.g. ``{'book-list': {'requests': 10, 'avg_ms': ...}}``."""
+        with self._lock:
+            return {
+                route: {
+                    'requests': stats['requests'],
+                    'avg_ms': stats['total_ms'] / stats['requests'],
+                    'max_ms': stats['max_ms'],
+                    'avg_db_ms': stats['db_ms'] / stats['requests'],
+                    'avg_queries': stats['queries'] / stats['requests'],
+                    **{f'avg_{name}_ms': total / stats['requests'] for name, total in stats['spans'].items()},
+                }
+                for route, stats in self._routes.items()
+            }
+
+
+route_stats = RouteStats()
+
+
+def _timed_property(cls, attribute, span):
+    prop = getattr(cls, attribute)
+    if getattr(prop.fget, 'instrumented', False):
+        return
+
+    def timed(self, _fget=prop.fget):
+        with measure(span):
+            return _fget(self)
+    timed.instrumented = True
+    setattr(cls, attribute, property(timed))
+
+
+def install_drf_timing():
+    """Time DRF serializer ``.data`` as ``serializer`` and rendering as ``render``."""
+    from rest_framework import serializers
+    from rest_framework.response import Response
+
+    _timed_property(serializers.Serializer, 'data', 'serializer')
+    _timed_property(serializers.ListSerializer, 'data', 'serializer')
+    _timed_property(Response, 'rendered_content', 'render')
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` recording its time as the ``auth`` span."""
+
+    def authenticate(self, request):
+        with measure('auth'):
+            return super().authenticate(request)
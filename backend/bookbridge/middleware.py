@@ -0,0 +1,217 @@
+"""
+Project-wide middleware.
+"""
+import hashlib
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from . import compression, instrumentation, routers
+
+logger = logging.getLogger('bookbridge.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Measure each request and report it in a ``Server-Timing`` header, a
+    structured log line and the per-route aggregates of
+    ``instrumentation.route_stats``.
+
+    Place it first in ``MIDDLEWARE`` so the total covers the whole stack.
+    Requests slower than ``PERFORMANCE_LOG_THRESHOLD_MS`` are logged at
+    WARNING, the rest at DEBUG.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold_ms = getattr(settings, 'PERFORMANCE_LOG_THRESHOLD_MS', 500)
+        instrumentation.install_drf_timing()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = instrumentation.start()
+        try:
+            with self.wrap_queries():
+                response = self.get_response(request)
+        finally:
+            instrumentation.finish(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = instrumentation.start()
+        try:
+            with self.wrap_queries():
+                response = await self.get_response(request)
+        finally:
+            instrumentation.finish(token)
+        return self.report(request, response, metrics)
+
+    def wrap_queries(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(instrumentation.query_wrapper))
+        return stack
+
+    def report(self, request, response, metrics):
+        total_ms = metrics.total_ms
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unresolved'
+
+        timings = [
+            f'db;dur={metrics.db_ms:.1f};desc="{metrics.queries} queries"',
+            f'db-slowest;dur={metrics.slowest_ms:.1f}',
+        ]
+        timings += [f'{name};dur={elapsed:.1f}' for name, elapsed in metrics.spans.items()]
+        timings.append(f'total;dur={total_ms:.1f}')
+        response['Server-Timing'] = ', '.join(timings)
+
+        instrumentation.route_stats.add(route, metrics, total_ms)
+
+        level = logging.WARNING if total_ms >= self.threshold_ms else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                'route': route,
+                'method': request.method,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'db_ms': round(metrics.db_ms, 2),
+                'queries': metrics.queries,
+                'slowest_query_ms': round(metrics.slowest_ms, 2),
+                'slowest_query': metrics.slowest_sql[:500],
+                **{f'{name}_ms': round(elapsed, 2) for name, elapsed in metrics.spans.items()},
+            }))
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Pin users to the primary database after a successful write so they read
+    their own writes while replicas catch up (see ``bookbridge.routers``).
+
+    DRF copies the authenticated user onto the underlying request, so token
+    authenticated users are seen here too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.record(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.record(request, response)
+        return response
+
+    def record(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            routers.pin(user.pk)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts (see
+    ``bookbridge.compression``).
+
+    Responses that are cached anyway, those with an ``ETag`` or an
+    ``X-Cache`` header, are compressed at a higher level and the result is
+    cached under a digest of the body, so repeated hits cost a hash instead
+    of a compression. Streaming responses, bodies under
+    ``COMPRESSION_MIN_SIZE`` bytes and non-text types are left alone.
+    Compression time is reported as the ``compress`` span; ratios and cache
+    hits are counted in ``compression.compression_stats``.
+
+    Place it after ``PerformanceMiddleware`` so compression is measured.
+    """
+    sync_capable = True
+    async_capable = True
+    compressible_types = (
+        'text/', 'application/json', 'application/javascript', 'application/xml',
+        'application/x-ndjson', 'image/svg+xml',
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.cache_alias = getattr(settings, 'COMPRESSION_CACHE_ALIAS', 'default')
+        self.cache_timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def is_cacheable(self, response):
+        return (
+            response.status_code == 200
+            and (response.has_header('ETag') or response.has_header('X-Cache'))
+            and 'no-store' not in response.get('Cache-Control', '')
+        )
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_size
+            or not response.get('Content-Type', '').startswith(self.compressible_types)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        body = response.content
+        cacheable = self.is_cacheable(response)
+        key = f'compressed:{encoding}:{hashlib.md5(body).hexdigest()}' if cacheable else None
+        compressed = caches[self.cache_alias].get(key) if key else None
+        hit, elapsed = compressed is not None, 0.0
+        if not hit:
+            started = time.perf_counter()
+            compressed = compression.CODECS[encoding][cacheable](body)
+            elapsed = (time.perf_counter() - started) * 1000
+            instrumentation.record('compress', elapsed)
+            if key:
+                caches[self.cache_alias].set(key, compressed, self.cache_timeout)
+        compression.compression_stats.add(encoding, len(body), len(compressed), elapsed, cache_hit=hit)
+
+        if len(compressed) >= len(body):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation of the resource
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,181 @@
+"""
+Read-replica database routing.
+
+Reads go to the primary (``default``) unless replica reads are switched on
+for the current context, which ``ReplicaReadMixin`` does for safe requests
+to catalog viewsets; reports pick a database with ``reporting_database``.
+Switching them on picks one replica, which serves every read of the context,
+so a request never mixes data from replicas at different positions.
+Even then a read stays on the primary when it runs inside a transaction on
+the primary, when the user wrote recently (see ``pin``) or when no replica
+is healthy. Writes always go to the primary.
+
+Replicas are listed in ``settings.DATABASE_REPLICAS``. Pins live in the
+default cache, so use a shared cache backend when running several
+processes.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Replica serving the reads of the current context, if any
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def replica_reads_active():
+    return _replica_reads.get() is not None
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in this block go to a replica, the same one for all of them."""
+    token = _replica_reads.set(choose_replica())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin(user_id):
+    """Keep ``user_id`` on the primary for ``REPLICA_PIN_SECONDS``."""
+    if user_id is not None and replicas():
+        cache.set(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user_id):
+    return user_id is not None and bool(replicas()) and cache.get(_pin_key(user_id), False)
+
+
+async def ais_pinned(user_id):
+    return user_id is not None and bool(replicas()) and await cache.aget(_pin_key(user_id), False)
+
+
+class ReplicaHealth:
+    """
+    Per-process replica availability.
+
+    A replica is probed at most every ``REPLICA_CHECK_INTERVAL`` seconds
+    while healthy. A failed probe, or on MySQL a replica lagging more than
+    ``REPLICA_MAX_LAG_SECONDS``, takes it out of rotation until it passes a
+    probe again, tried every ``REPLICA_RETRY_SECONDS``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def is_available(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked = self._state.get(alias, (True, None))
+        interval = getattr(settings, 'REPLICA_CHECK_INTERVAL' if healthy else 'REPLICA_RETRY_SECONDS', 5)
+        if checked is None or now - checked >= interval:
+            healthy = self.probe(alias)
+            self.mark(alias, healthy)
+        return healthy
+
+    def mark(self, alias, healthy):
+        with self._lock:
+            self._state[alias] = (healthy, time.monotonic())
+
+    def probe(self, alias):
+        try:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                if connection.vendor != 'mysql':
+                    cursor.execute('SELECT 1')
+                    return True
+                cursor.execute('SHOW REPLICA STATUS')
+                row = cursor.fetchone()
+                if row is None:
+                    return True
+                status = dict(zip((column[0] for column in cursor.description), row))
+        except DatabaseError:
+            logger.warning('Replica %s is unreachable', alias, exc_info=True)
+            return False
+        lag = status.get('Seconds_Behind_Source')
+        if lag is None or lag > getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 30):
+            logger.warning('Replica %s is lagging (%s seconds behind)', alias, lag)
+            return False
+        return True
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """Return a healthy replica alias at random, or ``None``."""
+    candidates = replicas()
+    random.shuffle(candidates)
+    for alias in candidates:
+        if health.is_available(alias):
+            return alias
+    return None
+
+
+def reporting_database(user_id=None):
+    """Database for report-style reads, such as exports, by ``user_id``."""
+    if is_pinned(user_id):
+        return DEFAULT_DB_ALIAS
+    return choose_replica() or DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """Route reads to a replica while replica reads are on; writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = _replica_reads.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        # Back to the primary, which is never behind, if the replica fails
+        return alias if health.is_available(alias) else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serve safe requests of a DRF view from a replica.
+
+    Authentication runs first, on the primary, so that users pinned by a
+    recent write keep reading from it.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.perform_authentication(request)
+        if request.method in SAFE_METHODS and replicas() and not is_pinned(request.user.pk):
+            self._replica_token = _replica_reads.set(choose_replica())
+        super().initial(request, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                _replica_reads.reset(self._replica_token)
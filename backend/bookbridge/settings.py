@@ -56,6 +56,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookbridge.middleware.PerformanceMiddleware',
+    'bookbridge.middleware.PrimaryPinMiddleware',
+    'bookbridge.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -116,6 +119,90 @@ else:
         }
     }
 
+# Read replicas, used by bookbridge.routers.ReplicaRouter for catalog
+# browsing and reports. With MySQL, DB_REPLICA_HOSTS lists replica hosts
+# sharing the primary's credentials. With SQLite, DB_REPLICA_SQLITE names a
+# second database file standing in for a replica (keep it in sync yourself,
+# e.g. by copying db.sqlite3); tests mirror it to the default database.
+if DB_ENGINE == 'mysql':
+    for number, host in enumerate(filter(None, get_env('DB_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host.strip()}
+elif get_env('DB_REPLICA_SQLITE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': get_env('DB_REPLICA_SQLITE'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['bookbridge.routers.ReplicaRouter']
+
+# Seconds a user who has just written reads from the primary only
+REPLICA_PIN_SECONDS = get_env('REPLICA_PIN_SECONDS', 10, cast=int)
+# Replicas are probed at most this often, and skipped for
+# REPLICA_RETRY_SECONDS after failing a probe or lagging more than
+# REPLICA_MAX_LAG_SECONDS behind the primary (MySQL only)
+REPLICA_CHECK_INTERVAL = get_env('REPLICA_CHECK_INTERVAL', 5, cast=int)
+REPLICA_RETRY_SECONDS = get_env('REPLICA_RETRY_SECONDS', 30, cast=int)
+REPLICA_MAX_LAG_SECONDS = get_env('REPLICA_MAX_LAG_SECONDS', 30, cast=int)
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+CACHE_BACKEND = get_env('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': get_env('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bookbridge',
+        }
+    }
+
+# Seconds a process may trust its cached (token version, active, role)
+# state of a user, see apps.core.authentication. Saves only refresh the
+# cache of the saving process: with the per-process locmem cache other
+# workers see deactivations, role changes and revoked tokens only once
+# their copy expires, so keep this short unless the cache is shared.
+AUTH_STATE_CACHE_SECONDS = get_env('AUTH_STATE_CACHE_SECONDS', 300 if CACHE_BACKEND == 'file' else 5, cast=int)
+
+# Seconds a cached catalog response may live before it is recomputed,
+# even if none of its tags were invalidated
+RESPONSE_CACHE_TIMEOUT = get_env('RESPONSE_CACHE_TIMEOUT', 300, cast=int)
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = get_env('COMPRESSION_MIN_SIZE', 1024, cast=int)
+
+# Default number of stock slots for books made hot with `manage.py hot_stock`
+HOT_STOCK_SLOTS = get_env('HOT_STOCK_SLOTS', 8, cast=int)
+
+# Queue checkouts and answer 202 instead of placing orders inline; queued
+# orders are placed in batches by `manage.py process_order_intake`
+ORDER_INTAKE_QUEUE = get_env('ORDER_INTAKE_QUEUE', 'False').lower() == 'true'
+ORDER_INTAKE_BATCH_SIZE = get_env('ORDER_INTAKE_BATCH_SIZE', 200, cast=int)
+ORDER_INTAKE_MAX_ATTEMPTS = get_env('ORDER_INTAKE_MAX_ATTEMPTS', 3, cast=int)
+
+# Co-purchase matrix served by /books/<id>/related/, kept up to date by
+# `manage.py build_recommendations`
+RECOMMENDATIONS_PATH = get_env('RECOMMENDATIONS_PATH', str(BASE_DIR / 'recommendations' / 'copurchase.bin'))
+# Orders are committed out of id order; updates re-read this many ids
+# below the last one counted
+RECOMMENDATIONS_RESCAN_ORDERS = get_env('RECOMMENDATIONS_RESCAN_ORDERS', 10000, cast=int)
+
+# Seconds between background rebuilds of the in-memory typeahead index
+TYPEAHEAD_REFRESH_SECONDS = get_env('TYPEAHEAD_REFRESH_SECONDS', 600, cast=int)
+
+# SQLite file relaying live stock and order events between the worker
+# processes of a host; leave empty to keep events within each process
+EVENTS_RELAY_PATH = get_env('EVENTS_RELAY_PATH', '')
+EVENTS_RETENTION_SECONDS = get_env('EVENTS_RETENTION_SECONDS', 300, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -133,6 +220,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with PASSWORD_HASHER; stored hashes of the other
+# hashers keep working and are rehashed with it on the next login
+PASSWORD_HASHERS = list(dict.fromkeys([
+    get_env('PASSWORD_HASHER', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'),
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]))
+
+# Threads hashing passwords for the login and register views, and how many
+# more hashes may wait for them before those views answer 503
+PASSWORD_HASHING_WORKERS = get_env('PASSWORD_HASHING_WORKERS', 2, cast=int)
+PASSWORD_HASHING_QUEUE = get_env('PASSWORD_HASHING_QUEUE', 32, cast=int)
+
+# Login and registration attempts allowed per client IP / username
+AUTH_THROTTLE_RATES = {
+    'login-ip': get_env('LOGIN_IP_THROTTLE_RATE', '30/min'),
+    'login-username': get_env('LOGIN_USERNAME_THROTTLE_RATE', '5/min'),
+    'register-ip': get_env('REGISTER_IP_THROTTLE_RATE', '10/hour'),
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 LANGUAGE_CODE = 'en-us'
@@ -156,15 +266,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'core.User'
 
+# ModelBackend, with async logins hashing on the PASSWORD_HASHING_WORKERS pool
+AUTHENTICATION_BACKENDS = ['apps.core.passwords.PooledModelBackend']
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Users come from signed token claims, see apps.core.authentication
+        'apps.core.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # orjson-backed JSON when installed, DRF's stdlib implementation otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -180,8 +304,16 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'apps.core.authentication.ClaimsTokenObtainPairSerializer',
+    # Rotated and logged out refresh tokens are revoked, see apps.core.revocation
+    'TOKEN_REFRESH_SERIALIZER': 'apps.core.authentication.ClaimsTokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'apps.core.authentication.ClaimsTokenBlacklistSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'apps.core.authentication.ClaimsTokenVerifySerializer',
 }
 
+# SQLite file of revoked refresh tokens, shared by the workers of a host
+TOKEN_REVOCATION_PATH = get_env('TOKEN_REVOCATION_PATH', str(BASE_DIR / 'token_revocation.sqlite3'))
+
 # CORS settings - Allow Lovable preview and local development
 CORS_ALLOWED_ORIGINS = get_env(
     'CORS_ALLOWED_ORIGINS',
@@ -214,3 +346,25 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+
+# Logging
+# https://docs.djangoproject.com/en/5.0/topics/logging/
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'bookbridge.performance': {
+            'handlers': ['console'],
+            'level': get_env('PERFORMANCE_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Requests slower than this are logged at WARNING by PerformanceMiddleware
+PERFORMANCE_LOG_THRESHOLD_MS = get_env('PERFORMANCE_LOG_THRESHOLD_MS', 500, cast=int)